@@ -0,0 +1,170 @@
+# -*- coding: utf-8 -*-
+'''
+Benchmarks CODEOWNERS resolution with the indexed rule engine in
+``tamarack.codeowners`` against trying every rule from the last one to the
+first for each file, and against the original nested ``fnmatch`` loop (which
+applied every matching rule rather than the last one, so only its time is
+comparable).
+
+Run from the root of the repository:
+
+    python -m benchmarks.codeowners --files 10000 --rules 1000
+'''
+
+# Import Python libs
+import argparse
+import collections
+import fnmatch
+import random
+import time
+
+# Import Tamarack libs
+import tamarack.codeowners
+
+EXTENSIONS = ['.py', '.rst', '.sls', '.txt', '.yml', '.jinja']
+
+
+def legacy_code_owners(files, owners_contents):
+    '''
+    The original ownership matching algorithm: one ``fnmatch`` call for every
+    (entry x file) pair, with every owner of every matching entry.
+    '''
+    entries = tamarack.codeowners.parse_entries(owners_contents)
+    matches = []
+    for pattern, owners in entries:
+        for item in files:
+            if fnmatch.fnmatch(item, pattern):
+                matches.extend(owners)
+    return matches
+
+
+def reverse_scan_code_owners(files, owners_contents):
+    '''
+    Last-match-wins resolution without the index: every rule is tried, from
+    the last one to the first, until one matches.
+    '''
+    rules = tamarack.codeowners.compile_rules(owners_contents).rules
+    owners = collections.OrderedDict()
+    for file_name in files:
+        for rule in reversed(rules):
+            if rule.matches(file_name):
+                owners.update((owner, None) for owner in rule.owners)
+                break
+    return list(owners)
+
+
+def compiled_code_owners(files, owners_contents):
+    '''
+    Last-match-wins resolution with the indexed rule engine.
+    '''
+    return tamarack.codeowners.compile_rules(owners_contents).owners(files)
+
+
+def make_tree(num_dirs, rand):
+    '''
+    Returns a list of nested directory names resembling a large repository.
+    '''
+    tops = ['salt', 'tests', 'doc', 'pkg', 'conf', 'scripts']
+    dirs = []
+    for index in range(num_dirs):
+        depth = rand.randint(1, 3)
+        parts = [rand.choice(tops)]
+        parts.extend('mod{0}_{1}'.format(index % 97, level) for level in range(depth))
+        dirs.append('/'.join(parts))
+    return dirs
+
+
+def make_rules(dirs, num_rules, rand):
+    '''
+    Returns CODEOWNERS contents with a mix of exact paths, directory globs,
+    directory rules, ``**`` rules and extension globs.
+    '''
+    lines = ['# Generated CODEOWNERS file', '']
+    for index in range(num_rules):
+        kind = index % 6
+        directory = rand.choice(dirs)
+        if kind == 0:
+            pattern = '{0}/file{1}{2}'.format(directory, index, rand.choice(EXTENSIONS))
+        elif kind == 1:
+            pattern = '{0}/*'.format(directory)
+        elif kind == 2:
+            pattern = '{0}/*{1}'.format(directory, rand.choice(EXTENSIONS))
+        elif kind == 3:
+            pattern = '/{0}/'.format(directory)
+        elif kind == 4:
+            pattern = '**/{0}/*.py'.format(directory.rsplit('/', 1)[-1])
+        else:
+            pattern = '*{0}'.format(rand.choice(EXTENSIONS))
+        lines.append('{0}    @saltstack/team-{1}'.format(pattern, index % 40))
+    return '\n'.join(lines) + '\n'
+
+
+def make_files(dirs, num_files, rand):
+    '''
+    Returns a list of changed file names.
+    '''
+    files = []
+    for index in range(num_files):
+        files.append('{0}/file{1}{2}'.format(
+            rand.choice(dirs), index, rand.choice(EXTENSIONS)))
+    return files
+
+
+def run(num_files, num_rules, seed=0):
+    '''
+    Runs both implementations, checks that they agree and returns their
+    timings in seconds.
+    '''
+    rand = random.Random(seed)
+    dirs = make_tree(max(num_rules // 2, 10), rand)
+    owners_contents = make_rules(dirs, num_rules, rand)
+    files = make_files(dirs, num_files, rand)
+
+    start = time.perf_counter()
+    legacy_code_owners(files, owners_contents)
+    legacy_time = time.perf_counter() - start
+
+    tamarack.codeowners.compile_rules(owners_contents)
+    start = time.perf_counter()
+    scanned = reverse_scan_code_owners(files, owners_contents)
+    scan_time = time.perf_counter() - start
+
+    tamarack.codeowners.compile_rules.cache_clear()
+    start = time.perf_counter()
+    compiled = compiled_code_owners(files, owners_contents)
+    compiled_time = time.perf_counter() - start
+
+    start = time.perf_counter()
+    compiled_code_owners(files, owners_contents)
+    warm_time = time.perf_counter() - start
+
+    if scanned != compiled:
+        raise AssertionError('Indexed rules disagree with the reverse scan.')
+    return legacy_time, scan_time, compiled_time, warm_time
+
+
+def main():
+    '''
+    Command line entry point.
+    '''
+    parser = argparse.ArgumentParser(description=__doc__.strip().splitlines()[0])
+    parser.add_argument('--files', type=int, default=10000)
+    parser.add_argument('--rules', type=int, default=1000)
+    parser.add_argument('--seed', type=int, default=0)
+    args = parser.parse_args()
+
+    legacy_time, scan_time, compiled_time, warm_time = run(
+        args.files, args.rules, args.seed
+    )
+    print('{0} files x {1} rules'.format(args.files, args.rules))
+    print('  fnmatch loop:          {0:8.3f}s'.format(legacy_time))
+    print('  reverse scan:          {0:8.3f}s  ({1:.0f}x)'.format(
+        scan_time, legacy_time / scan_time))
+    print('  compiled (cold):       {0:8.3f}s  ({1:.0f}x)'.format(
+        compiled_time, legacy_time / compiled_time))
+    print('  compiled (cached):     {0:8.3f}s  ({1:.0f}x)'.format(
+        warm_time, legacy_time / warm_time))
+
+
+if __name__ == '__main__':
+    main()
@@ -0,0 +1,65 @@
+# -*- coding: utf-8 -*-
+'''
+Benchmarks webhook payload parsing: fully decoding the payload into nested
+dictionaries against building a compact ``tamarack.event.Event``.
+
+Reports the time to parse each payload and the memory each parsed event keeps
+alive while it waits in the work queue.
+
+Run from the root of the repository:
+
+    python -m benchmarks.events --events 2000
+'''
+
+# Import Python libs
+import argparse
+import json
+import time
+import tracemalloc
+
+# Import Tamarack libs
+import tamarack.event
+from benchmarks import payloads
+
+
+def measure(parse, body, num_events):
+    '''
+    Parses ``num_events`` copies of the body, keeping every result alive.
+    Returns the time per event in microseconds and the retained bytes per
+    event. Each event gets its own copy of the body, as each webhook request
+    does, so a parsed event that keeps its body is charged for it.
+    '''
+    tracemalloc.start()
+    copies = [bytes(bytearray(body)) for _ in range(num_events)]
+    start = time.perf_counter()
+    kept = [parse(copy) for copy in copies]
+    elapsed = time.perf_counter() - start
+    del copies
+    retained, _ = tracemalloc.get_traced_memory()
+    tracemalloc.stop()
+    del kept
+    return elapsed / num_events * 1e6, retained / num_events
+
+
+def main():
+    '''
+    Command line entry point.
+    '''
+    parser = argparse.ArgumentParser(description=__doc__.strip().splitlines()[0])
+    parser.add_argument('--events', type=int, default=2000)
+    args = parser.parse_args()
+
+    bodies = [('pull_request (small body)', payloads.pull_request_event(body_size=2000)),
+              ('pull_request (large body)', payloads.pull_request_event(body_size=200000)),
+              ('create', payloads.create_event())]
+    for label, body in bodies:
+        print('{0}: {1} KB payload'.format(label, len(body) // 1024))
+        for name, parse in (('json.loads', json.loads),
+                            ('Event', tamarack.event.Event.from_body)):
+            per_event, retained = measure(parse, body, args.events)
+            print('  {0:12} {1:8.1f} us/event  {2:9.0f} bytes retained/event'.format(
+                name, per_event, retained))
+
+
+if __name__ == '__main__':
+    main()
@@ -0,0 +1,100 @@
+# -*- coding: utf-8 -*-
+'''
+Benchmarks the webhook accept path with the event journal turned on and off.
+
+Each simulated webhook is parsed, optionally journaled (waiting for its group
+commit, as the ``/events`` handler does) and queued on a ``WorkQueue`` whose
+workers only mark it as processed.
+
+Run from the root of the repository:
+
+    python -m benchmarks.journal --events 5000 --concurrency 100
+'''
+
+# Import Python libs
+import argparse
+import functools
+import json
+import shutil
+import tempfile
+import time
+
+# Import Tornado libs
+from tornado import gen
+import tornado.ioloop
+
+# Import Tamarack libs
+import tamarack.journal
+import tamarack.worker
+
+
+@gen.coroutine
+def _noop(data, delivery_id, journal):
+    '''
+    Stands in for event processing.
+    '''
+    if journal is not None:
+        journal.mark_processed(delivery_id)
+    yield gen.moment
+
+
+@gen.coroutine
+def run(num_events, concurrency, body_size, use_journal):
+    '''
+    Accepts ``num_events`` webhooks from ``concurrency`` concurrent senders and
+    returns the number of events accepted per second.
+    '''
+    directory = tempfile.mkdtemp()
+    journal = None
+    if use_journal:
+        journal = tamarack.journal.Journal(directory)
+    work_queue = tamarack.worker.WorkQueue(maxsize=num_events, num_workers=8)
+    work_queue.start()
+    body = json.dumps({'action': 'opened', 'padding': 'x' * body_size}).encode('utf-8')
+    counter = iter(range(num_events))
+
+    @gen.coroutine
+    def sender():
+        '''
+        Sends webhooks one after another until all have been sent.
+        '''
+        for index in counter:
+            delivery_id = 'delivery-{0}'.format(index)
+            data = json.loads(body)
+            if journal is not None:
+                yield journal.append(delivery_id, body)
+            work_queue.put(_noop, data, delivery_id, journal)
+
+    start = time.perf_counter()
+    yield [sender() for _ in range(concurrency)]
+    elapsed = time.perf_counter() - start
+    yield work_queue.join()
+
+    commits = journal.commits if journal is not None else 0
+    if journal is not None:
+        journal.close()
+    shutil.rmtree(directory)
+    return num_events / elapsed, commits
+
+
+def main():
+    '''
+    Command line entry point.
+    '''
+    parser = argparse.ArgumentParser(description=__doc__.strip().splitlines()[0])
+    parser.add_argument('--events', type=int, default=5000)
+    parser.add_argument('--concurrency', type=int, default=100)
+    parser.add_argument('--body-size', type=int, default=20000)
+    args = parser.parse_args()
+
+    io_loop = tornado.ioloop.IOLoop.current()
+    for use_journal in (False, True):
+        rate, commits = io_loop.run_sync(functools.partial(
+            run, args.events, args.concurrency, args.body_size, use_journal))
+        label = 'journal on ' if use_journal else 'journal off'
+        print('{0}: {1:10.0f} events/s  ({2} fsync commits for {3} events)'.format(
+            label, rate, commits, args.events))
+
+
+if __name__ == '__main__':
+    main()
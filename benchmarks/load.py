@@ -0,0 +1,230 @@
+# -*- coding: utf-8 -*-
+'''
+Load tests the webhook server against local mock GitHub and Slack services.
+
+Starts ``tamarack.server.make_app`` and the mocks from
+``benchmarks.mock_services`` on local ports, then sends signed synthetic
+``pull_request`` and ``create`` webhooks at a fixed rate, whether or not
+earlier ones have been answered. Reports the throughput, the p50 and p99
+latency of acknowledging the webhooks and of processing them from receipt to
+completion, and the number of GitHub requests made per pull request event.
+
+Everything runs on one IOLoop, so the sender and the mocks compete with the
+server for the CPU; compare runs made with the same settings on the same
+machine.
+
+Run from the root of the repository:
+
+    python -m benchmarks.load --events 1000 --rate 100 --github-latency 0.05
+'''
+
+# Import Python libs
+import argparse
+import hashlib
+import hmac
+import random
+import time
+import uuid
+
+# Import Tornado libs
+from tornado import gen
+import tornado.httpclient
+import tornado.ioloop
+import tornado.netutil
+import tornado.httpserver
+
+# Import Tamarack libs
+import tamarack.github
+import tamarack.server
+import tamarack.slack
+from benchmarks import codeowners, mock_services, payloads
+
+SECRET = 'load-test-secret'
+
+
+def percentile(values, fraction):
+    '''
+    Returns the value below which the given fraction of the values fall.
+    '''
+    if not values:
+        return float('nan')
+    values = sorted(values)
+    return values[min(int(len(values) * fraction), len(values) - 1)]
+
+
+def listen(app):
+    '''
+    Serves the application on a free local port and returns its base url.
+    '''
+    sockets = tornado.netutil.bind_sockets(0, '127.0.0.1')
+    server = tornado.httpserver.HTTPServer(app)
+    server.add_sockets(sockets)
+    return 'http://127.0.0.1:{0}'.format(sockets[0].getsockname()[1])
+
+
+def configure(slack_url, github_rate, graphql=True):
+    '''
+    Points the server at the mocks and lifts the GitHub request pacing, which
+    would otherwise be the only thing measured. With ``graphql`` off, the
+    files and CODEOWNERS file are fetched from the REST API.
+    '''
+    tamarack.server.HOOK_SECRET_KEY = SECRET
+    tamarack.server.GITHUB_TOKEN = 'load-test-token'
+    tamarack.slack.SLACK_WEBHOOK_URL = slack_url
+    tamarack.github.GITHUB_RATE = github_rate
+    tamarack.github.GITHUB_BURST = int(github_rate)
+    tamarack.github.GITHUB_GRAPHQL = graphql
+
+
+def make_bodies(args, api_url):
+    '''
+    Returns the ``(event name, body)`` webhooks to send. Every pull request
+    event is for a different pull request, so none of them are coalesced.
+    '''
+    rand = random.Random(args.seed)
+    pull_request = payloads.pull_request_event(body_size=args.body_size)
+    bodies = []
+    for index in range(args.events):
+        if rand.random() < args.create_ratio:
+            bodies.append(('create', payloads.create_event(ref='branch-{0}'.format(index))))
+            continue
+        body = pull_request.replace(b'/pulls/49517', '/pulls/{0}'.format(index).encode())
+        body = body.replace(b'"number": 49517', '"number": {0}'.format(index).encode())
+        bodies.append(('pull_request', body.replace(payloads.API.encode(), api_url.encode())))
+    return bodies
+
+
+@gen.coroutine
+def run(args):
+    '''
+    Runs the load test and returns a dictionary of results.
+    '''
+    rand = random.Random(args.seed)
+    dirs = codeowners.make_tree(max(args.rules // 2, 10), rand)
+    github = mock_services.MockGitHub(
+        codeowners.make_rules(dirs, args.rules, rand),
+        codeowners.make_files(dirs, args.files, rand),
+        latency=args.github_latency
+    )
+    slack = mock_services.MockSlack(latency=args.slack_latency)
+    github_url = listen(github.make_app())
+    configure(listen(slack.make_app()), args.github_rate, graphql=not args.rest)
+    server_url = listen(tamarack.server.make_app()) + '/events'
+
+    sent = {}
+    done = {}
+    process_event = tamarack.server.process_event
+
+    @gen.coroutine
+    def timed_process_event(event_data, token, delivery_id=None, journal=None):
+        try:
+            yield process_event(event_data, token, delivery_id=delivery_id,
+                                journal=journal)
+        finally:
+            done[delivery_id] = time.monotonic()
+
+    tamarack.server.process_event = timed_process_event
+
+    client = tornado.httpclient.AsyncHTTPClient(force_instance=True, max_clients=1000)
+    acks = []
+    statuses = {}
+
+    @gen.coroutine
+    def send(name, body):
+        delivery_id = str(uuid.uuid4())
+        signature = hmac.new(SECRET.encode('utf-8'), body, hashlib.sha1).hexdigest()
+        headers = {'X-GitHub-Event': name, 'X-GitHub-Delivery': delivery_id,
+                   'X-Hub-Signature': 'sha1=' + signature,
+                   'Content-Type': 'application/json'}
+        start = sent[delivery_id] = time.monotonic()
+        response = yield client.fetch(server_url, method='POST', body=body,
+                                      headers=headers, raise_error=False)
+        acks.append(time.monotonic() - start)
+        statuses[response.code] = statuses.get(response.code, 0) + 1
+
+    bodies = make_bodies(args, github_url)
+    start = time.monotonic()
+    requests = []
+    for index, (name, body) in enumerate(bodies):
+        delay = start + index / args.rate - time.monotonic()
+        if delay > 0:
+            yield gen.sleep(delay)
+        requests.append(send(name, body))
+    yield requests
+
+    while len(done) < statuses.get(202, 0) and time.monotonic() - start < args.timeout:
+        yield gen.sleep(0.01)
+    elapsed = max(done.values(), default=time.monotonic()) - start
+
+    num_creates = sum(1 for name, _ in bodies if name == 'create')
+    for buf in tamarack.slack.buffers():
+        buf.flush()
+    while slack.attachments < num_creates and time.monotonic() - start < args.timeout:
+        yield gen.sleep(0.01)
+
+    num_prs = len(bodies) - num_creates
+    latencies = [done[key] - sent[key] for key in done if key in sent]
+    return {
+        'events': len(bodies),
+        'pull_requests': num_prs,
+        'creates': num_creates,
+        'statuses': statuses,
+        'throughput': len(done) / elapsed if elapsed > 0 else float('nan'),
+        'ack_p50': percentile(acks, 0.5),
+        'ack_p99': percentile(acks, 0.99),
+        'process_p50': percentile(latencies, 0.5),
+        'process_p99': percentile(latencies, 0.99),
+        'github_requests': github.requests,
+        'github_per_pr': github.total() / num_prs if num_prs else 0,
+        'review_requests': github.review_requests,
+        'slack_messages': slack.messages,
+        'slack_attachments': slack.attachments,
+    }
+
+
+def main():
+    '''
+    Command line entry point.
+    '''
+    parser = argparse.ArgumentParser(description=__doc__.strip().splitlines()[0])
+    parser.add_argument('--events', type=int, default=1000)
+    parser.add_argument('--rate', type=float, default=100,
+                        help='webhooks sent per second')
+    parser.add_argument('--create-ratio', type=float, default=0.1,
+                        help='fraction of the webhooks that are create events')
+    parser.add_argument('--files', type=int, default=50,
+                        help='changed files per pull request')
+    parser.add_argument('--rules', type=int, default=300,
+                        help='CODEOWNERS rules')
+    parser.add_argument('--body-size', type=int, default=2000)
+    parser.add_argument('--github-latency', type=float, default=0.05)
+    parser.add_argument('--slack-latency', type=float, default=0.05)
+    parser.add_argument('--github-rate', type=float, default=100000,
+                        help='GITHUB_RATE for the server')
+    parser.add_argument('--rest', action='store_true',
+                        help='fetch pull request files from the REST API, not GraphQL')
+    parser.add_argument('--timeout', type=float, default=300)
+    parser.add_argument('--seed', type=int, default=0)
+    args = parser.parse_args()
+
+    results = tornado.ioloop.IOLoop.current().run_sync(lambda: run(args))
+    print('{events} webhooks ({pull_requests} pull_request, {creates} create) '
+          'at {rate:.0f}/s'.format(rate=args.rate, **results))
+    print('  responses:          {0}'.format(
+        ', '.join('{0}: {1}'.format(code, count)
+                  for code, count in sorted(results['statuses'].items()))))
+    print('  throughput:         {0:10.1f} events/s'.format(results['throughput']))
+    print('  ack latency:        p50 {0:8.1f} ms   p99 {1:8.1f} ms'.format(
+        results['ack_p50'] * 1000, results['ack_p99'] * 1000))
+    print('  processing latency: p50 {0:8.1f} ms   p99 {1:8.1f} ms'.format(
+        results['process_p50'] * 1000, results['process_p99'] * 1000))
+    print('  GitHub requests:    {0:10.2f} per pull_request event'.format(
+        results['github_per_pr']))
+    for (method, endpoint, status), count in sorted(results['github_requests'].items()):
+        print('    {0:5} {1} {2}: {3}'.format(method, endpoint, status, count))
+    print('  Slack:              {slack_messages} messages for {slack_attachments} '
+          'branches'.format(**results))
+
+
+if __name__ == '__main__':
+    main()
@@ -0,0 +1,138 @@
+# -*- coding: utf-8 -*-
+'''
+Micro-benchmarks of the per-webhook hot paths: verifying the signature,
+parsing the payload and resolving the code owners of a pull request.
+
+Results can be saved to a JSON file and later runs compared against it. The
+comparison exits with status 1 if any benchmark got slower than the allowed
+tolerance, so it can gate a deploy.
+
+Run from the root of the repository:
+
+    python -m benchmarks.micro --save baseline.json
+    python -m benchmarks.micro --compare baseline.json --tolerance 0.2
+'''
+
+# Import Python libs
+import argparse
+import hashlib
+import hmac
+import json
+import random
+import sys
+import timeit
+
+# Import Tornado libs
+import tornado.httputil
+
+# Import Tamarack libs
+import tamarack.event
+import tamarack.pull_request
+import tamarack.server
+from benchmarks import codeowners, payloads
+
+SECRET = 'micro-benchmark-secret'
+
+
+def _signed_request(body):
+    '''
+    Returns a request object with a valid GitHub signature for the body.
+    '''
+    signature = hmac.new(SECRET.encode('utf-8'), body, hashlib.sha1).hexdigest()
+    return tornado.httputil.HTTPServerRequest(
+        method='POST', uri='/events', body=body,
+        headers=tornado.httputil.HTTPHeaders({'X-Hub-Signature': 'sha1=' + signature})
+    )
+
+
+def make_benchmarks(body_size, num_files, num_rules):
+    '''
+    Returns a dictionary mapping benchmark names to functions to time.
+    '''
+    tamarack.server.HOOK_SECRET_KEY = SECRET
+    pull_request = payloads.pull_request_event(body_size=body_size)
+    create = payloads.create_event()
+    request = _signed_request(pull_request)
+
+    rand = random.Random(0)
+    dirs = codeowners.make_tree(max(num_rules // 2, 10), rand)
+    owners_contents = codeowners.make_rules(dirs, num_rules, rand)
+    files = codeowners.make_files(dirs, num_files, rand)
+    tamarack.pull_request._get_code_owners(files, owners_contents)
+
+    if not tamarack.server.validate_github_signature(request):
+        raise AssertionError('The benchmark request is not signed correctly.')
+
+    return {
+        'validate_github_signature': lambda: tamarack.server.validate_github_signature(
+            request),
+        'parse_pull_request': lambda: tamarack.event.Event.from_body(
+            pull_request, name='pull_request').get('pull_request'),
+        'parse_create': lambda: tamarack.event.Event.from_body(
+            create, name='create').get('ref_type'),
+        'get_code_owners': lambda: tamarack.pull_request._get_code_owners(
+            files, owners_contents),
+    }
+
+
+def measure(func, repeat=7):
+    '''
+    Returns the best time per call of the function, in microseconds. Each of
+    the ``repeat`` runs lasts at least 0.2 seconds.
+    '''
+    timer = timeit.Timer(func)
+    number, _ = timer.autorange()
+    return min(timer.repeat(repeat=repeat, number=number)) / number * 1e6
+
+
+def compare(results, baseline, tolerance):
+    '''
+    Prints the change of each result against the baseline. Returns the names
+    of the benchmarks that got slower than the tolerance allows.
+    '''
+    regressions = []
+    for name, usec in sorted(results.items()):
+        if name not in baseline:
+            continue
+        change = usec / baseline[name] - 1
+        flag = ''
+        if change > tolerance:
+            regressions.append(name)
+            flag = '  REGRESSION'
+        print('  {0:28} {1:+7.1%}{2}'.format(name, change, flag))
+    return regressions
+
+
+def main():
+    '''
+    Command line entry point.
+    '''
+    parser = argparse.ArgumentParser(description=__doc__.strip().splitlines()[0])
+    parser.add_argument('--body-size', type=int, default=2000)
+    parser.add_argument('--files', type=int, default=300)
+    parser.add_argument('--rules', type=int, default=300)
+    parser.add_argument('--save', help='write the results to this JSON file')
+    parser.add_argument('--compare', help='compare against results saved earlier')
+    parser.add_argument('--tolerance', type=float, default=0.2,
+                        help='allowed slowdown against the baseline, as a fraction')
+    args = parser.parse_args()
+
+    results = {}
+    for name, func in make_benchmarks(args.body_size, args.files, args.rules).items():
+        results[name] = measure(func)
+        print('{0:30} {1:12.2f} us'.format(name, results[name]))
+
+    if args.save:
+        with open(args.save, 'w') as results_file:
+            json.dump(results, results_file, indent=2, sort_keys=True)
+
+    if args.compare:
+        with open(args.compare) as baseline_file:
+            baseline = json.load(baseline_file)
+        print('Against {0}:'.format(args.compare))
+        if compare(results, baseline, args.tolerance):
+            sys.exit(1)
+
+
+if __name__ == '__main__':
+    main()
@@ -0,0 +1,168 @@
+# -*- coding: utf-8 -*-
+'''
+Compares listing the changed files of large pull requests from a local git
+mirror against the GitHub API.
+
+For each pull request size, a local source repository is built with
+``git fast-import``: a base commit holding the files and a CODEOWNERS file,
+and a head commit changing every file. The mirror path is timed cold (creating
+the mirror and fetching both refs) and warm (both commits already mirrored),
+and the REST and GraphQL paths are timed against ``benchmarks.mock_services``,
+which answers after the given latency and, like GitHub, lists at most 3000
+files.
+
+Run from the root of the repository:
+
+    python -m benchmarks.mirror --sizes 100 1000 10000 --github-latency 0.05
+'''
+
+# Import Python libs
+import argparse
+import os
+import random
+import shutil
+import subprocess
+import tempfile
+import time
+
+# Import Tornado libs
+from tornado import gen
+import tornado.ioloop
+
+# Import Tamarack libs
+import tamarack.github
+import tamarack.mirror
+import tamarack.pull_request
+from benchmarks import codeowners, mock_services
+from benchmarks.load import listen
+
+
+def make_source(directory, files, owners_contents):
+    '''
+    Creates a bare repository with a "develop" branch and a pull request, #1,
+    changing every file. Returns its path and the base and head SHAs.
+    '''
+    path = os.path.join(directory, 'source.git')
+    subprocess.check_call(['git', 'init', '--bare', '--quiet', path])
+
+    def blob(contents):
+        data = contents.encode('utf-8')
+        return b'data %d\n%s\n' % (len(data), data)
+
+    stream = [b'commit refs/heads/develop\n',
+              b'committer Tamarack <bot@example.com> 1500000000 +0000\n',
+              blob('base'),
+              b'M 644 inline .github/CODEOWNERS\n', blob(owners_contents)]
+    for name in files:
+        stream += [b'M 644 inline ', name.encode('utf-8'), b'\n', blob(name)]
+    stream += [b'\ncommit refs/pull/1/head\n',
+               b'committer Tamarack <bot@example.com> 1500000001 +0000\n',
+               blob('head'), b'from refs/heads/develop\n']
+    for name in files:
+        stream += [b'M 644 inline ', name.encode('utf-8'), b'\n', blob(name + ' changed')]
+    subprocess.run(['git', 'fast-import', '--quiet'], cwd=path, input=b''.join(stream),
+                   check=True)
+
+    def rev_parse(ref):
+        return subprocess.check_output(['git', 'rev-parse', ref], cwd=path).decode().strip()
+    return path, rev_parse('refs/heads/develop'), rev_parse('refs/pull/1/head')
+
+
+def make_event(source, base, head, api_url, num_files):
+    '''
+    Returns a pull request event for the source repository.
+    '''
+    return {
+        'number': 1,
+        'repository': {'full_name': 'saltstack/salt', 'clone_url': source,
+                       'url': api_url + '/repos/saltstack/salt'},
+        'pull_request': {'url': api_url + '/repos/saltstack/salt/pulls/1',
+                         'base': {'ref': 'develop', 'sha': base},
+                         'head': {'sha': head},
+                         'changed_files': num_files},
+    }
+
+
+@gen.coroutine
+def timed(func, *args, **kwargs):
+    '''
+    Returns the result of the coroutine and the seconds it took.
+    '''
+    start = time.perf_counter()
+    result = yield func(*args, **kwargs)
+    return result, time.perf_counter() - start
+
+
+@gen.coroutine
+def run_size(num_files, args, directory):
+    '''
+    Returns the results of every path for a pull request of the given size.
+    '''
+    rand = random.Random(args.seed)
+    dirs = codeowners.make_tree(max(args.rules // 2, 10), rand)
+    owners_contents = codeowners.make_rules(dirs, args.rules, rand)
+    files = codeowners.make_files(dirs, num_files, rand)
+
+    source, base, head = make_source(directory, files, owners_contents)
+    github = mock_services.MockGitHub(owners_contents, files, latency=args.github_latency)
+    api_url = listen(github.make_app())
+    event_data = make_event(source, base, head, api_url, num_files)
+    mirrors = os.path.join(directory, 'mirrors')
+
+    results = {}
+    for name in ('mirror (cold)', 'mirror (warm)'):
+        (listed, _, _), seconds = yield timed(
+            tamarack.mirror.get_pull_request_data, event_data, '',
+            tamarack.pull_request.OWNERS_PATH, directory=mirrors
+        )
+        results[name] = (seconds, len(listed), 0)
+
+    requests = github.total()
+    tamarack.github.RESPONSE_CACHE.clear()
+    listed, seconds = yield timed(tamarack.pull_request.get_pr_file_names, event_data, 'token')
+    results['REST'] = (seconds, len(listed), github.total() - requests)
+
+    requests = github.total()
+    review_data, seconds = yield timed(
+        tamarack.github.get_review_data, event_data['repository']['url'], 1, 'develop',
+        tamarack.pull_request.OWNERS_PATH, 'token'
+    )
+    results['GraphQL'] = (seconds, len(review_data.files), github.total() - requests)
+    return results
+
+
+@gen.coroutine
+def run(args):
+    '''
+    Runs the benchmark for every size and prints the results.
+    '''
+    tamarack.github.GITHUB_RATE = 100000
+    tamarack.github.GITHUB_BURST = 100000
+    for num_files in args.sizes:
+        directory = tempfile.mkdtemp()
+        try:
+            results = yield run_size(num_files, args, directory)
+        finally:
+            shutil.rmtree(directory)
+        print('{0} changed files:'.format(num_files))
+        for name, (seconds, listed, requests) in results.items():
+            print('  {0:15} {1:9.1f} ms  {2:6} files  {3:4} GitHub requests'.format(
+                name, seconds * 1000, listed, requests))
+
+
+def main():
+    '''
+    Command line entry point.
+    '''
+    parser = argparse.ArgumentParser(description=__doc__.strip().splitlines()[0])
+    parser.add_argument('--sizes', type=int, nargs='+', default=[100, 1000, 10000],
+                        help='changed files per pull request')
+    parser.add_argument('--rules', type=int, default=300, help='CODEOWNERS rules')
+    parser.add_argument('--github-latency', type=float, default=0.05)
+    parser.add_argument('--seed', type=int, default=0)
+    args = parser.parse_args()
+    tornado.ioloop.IOLoop.current().run_sync(lambda: run(args))
+
+
+if __name__ == '__main__':
+    main()
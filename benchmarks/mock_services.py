@@ -0,0 +1,233 @@
+# -*- coding: utf-8 -*-
+'''
+Local stand-ins for the GitHub API and a Slack webhook, for load testing the
+server without touching the real services.
+
+Both answer after a configurable latency and count the requests they get.
+The GitHub mock serves the endpoints Tamarack uses: the CODEOWNERS contents
+(with ETags, answering ``304 Not Modified`` to revalidations), the paginated
+files and the reviews of a pull request, review requests, and the GraphQL
+query fetching the files and CODEOWNERS file together. Like GitHub, it lists
+at most ``MAX_FILES`` changed files of a pull request.
+'''
+
+# Import Python libs
+import base64
+import collections
+import hashlib
+import json
+import urllib.parse
+
+# Import Tornado libs
+from tornado import gen
+import tornado.web
+
+MAX_FILES = 3000
+
+
+class MockHandler(tornado.web.RequestHandler):
+    '''
+    Base handler that waits for the configured latency and counts requests by
+    method and endpoint.
+    '''
+    def initialize(self, service):
+        # pylint: disable=attribute-defined-outside-init
+        self.service = service
+
+    @gen.coroutine
+    def prepare(self):
+        if self.service.latency:
+            yield gen.sleep(self.service.latency)
+
+    def on_finish(self):
+        self.service.record(self.request.method, self.endpoint(), self.get_status())
+
+    def endpoint(self):
+        '''
+        Returns the request path with numbers replaced, to count requests per
+        endpoint rather than per pull request.
+        '''
+        return '/'.join(':number' if part.isdigit() else part
+                        for part in self.request.path.split('/'))
+
+
+class ContentsHandler(MockHandler):
+    '''
+    Serves ``/repos/<owner>/<repo>/contents/.github/CODEOWNERS``.
+    '''
+    def get(self, *args):
+        contents = self.service.owners_contents.encode('utf-8')
+        sha = hashlib.sha1(contents).hexdigest()
+        etag = '"{0}"'.format(sha)
+        self.set_header('Etag', etag)
+        if self.request.headers.get('If-None-Match') == etag:
+            self.set_status(304)
+            return
+        self.write({'sha': sha, 'encoding': 'base64',
+                    'content': base64.b64encode(contents).decode('ascii')})
+
+
+class FilesHandler(MockHandler):
+    '''
+    Serves ``/repos/<owner>/<repo>/pulls/<number>/files``, paginated with
+    ``Link`` headers like GitHub.
+    '''
+    def get(self, *args):
+        per_page = int(self.get_argument('per_page', 30))
+        page = int(self.get_argument('page', 1))
+        files = self.service.files[:MAX_FILES]
+        last_page = max((len(files) + per_page - 1) // per_page, 1)
+        if last_page > 1:
+            self.set_header('Link', ', '.join(
+                '<{0}>; rel="{1}"'.format(self._page_url(number), rel)
+                for number, rel in ((min(page + 1, last_page), 'next'),
+                                    (last_page, 'last'))
+            ))
+        items = [{'filename': name, 'status': 'modified'}
+                 for name in files[(page - 1) * per_page:page * per_page]]
+        self.set_header('Content-Type', 'application/json')
+        self.write(json.dumps(items))
+
+    def _page_url(self, page):
+        query = dict(urllib.parse.parse_qsl(self.request.query))
+        query['page'] = page
+        return '{0}://{1}{2}?{3}'.format(self.request.protocol, self.request.host,
+                                         self.request.path, urllib.parse.urlencode(query))
+
+
+class GraphQLHandler(MockHandler):
+    '''
+    Answers the GraphQL queries of ``tamarack.github.get_review_data``, using
+    the offset of the next file as the page cursor.
+    '''
+    def post(self, *args):
+        variables = json.loads(self.request.body)['variables']
+        files = self.service.files[:MAX_FILES]
+        start = int(variables.get('cursor') or 0)
+        end = start + variables['first']
+        pull_request = {'files': {
+            'pageInfo': {'hasNextPage': end < len(files), 'endCursor': str(end)},
+            'nodes': [{'path': name} for name in files[start:end]],
+        }}
+        repository = {'pullRequest': pull_request}
+
+        if 'expression' in variables:
+            contents = self.service.owners_contents.encode('utf-8')
+            blob = {'oid': hashlib.sha1(contents).hexdigest(), 'isTruncated': False}
+            if variables['withText']:
+                blob['text'] = self.service.owners_contents
+            repository['object'] = blob
+            empty = {'pageInfo': {'hasNextPage': False, 'endCursor': None}, 'nodes': []}
+            pull_request['reviewRequests'] = empty
+            pull_request['reviews'] = empty
+        self.write({'data': {'repository': repository}})
+
+
+class ReviewsHandler(MockHandler):
+    '''
+    Serves ``/repos/<owner>/<repo>/pulls/<number>/reviews``, which are empty.
+    '''
+    def get(self, *args):
+        self.set_header('Content-Type', 'application/json')
+        self.write('[]')
+
+
+class ReviewersHandler(MockHandler):
+    '''
+    Accepts ``/repos/<owner>/<repo>/pulls/<number>/requested_reviewers``.
+    '''
+    def post(self, *args):
+        self.service.review_requests += 1
+        self.set_status(201)
+        self.write({})
+
+
+class SlackHandler(MockHandler):
+    '''
+    Accepts Slack webhook messages.
+    '''
+    def post(self, *args):
+        message = json.loads(self.request.body)
+        self.service.messages += 1
+        self.service.attachments += len(message.get('attachments', []))
+        self.write('ok')
+
+
+class MockService:
+    '''
+    Request counts and settings shared by the handlers of a mock service.
+
+    latency
+        The number of seconds to wait before answering each request.
+    '''
+
+    def __init__(self, latency=0.0):
+        self.latency = latency
+        self.requests = collections.Counter()
+
+    def record(self, method, endpoint, status):
+        '''
+        Counts a request.
+        '''
+        self.requests[(method, endpoint, status)] += 1
+
+    def total(self):
+        '''
+        Returns the number of requests received.
+        '''
+        return sum(self.requests.values())
+
+
+class MockGitHub(MockService):
+    '''
+    The mock GitHub API.
+
+    owners_contents
+        The contents of the CODEOWNERS file to serve.
+
+    files
+        The file names to serve as the changed files of every pull request.
+
+    latency
+        The number of seconds to wait before answering each request.
+    '''
+
+    def __init__(self, owners_contents, files, latency=0.0):
+        super().__init__(latency)
+        self.owners_contents = owners_contents
+        self.files = files
+        self.review_requests = 0
+
+    def make_app(self):
+        '''
+        Returns the ``tornado.web.Application`` serving the mock.
+        '''
+        repo = r'/repos/[^/]+/[^/]+'
+        return tornado.web.Application([
+            (repo + r'/contents/\.github/CODEOWNERS', ContentsHandler, {'service': self}),
+            (repo + r'/pulls/(\d+)/files', FilesHandler, {'service': self}),
+            (repo + r'/pulls/(\d+)/reviews', ReviewsHandler, {'service': self}),
+            (repo + r'/pulls/(\d+)/requested_reviewers', ReviewersHandler,
+             {'service': self}),
+            (r'/graphql', GraphQLHandler, {'service': self}),
+        ])
+
+
+class MockSlack(MockService):
+    '''
+    The mock Slack webhook.
+
+    latency
+        The number of seconds to wait before answering each request.
+    '''
+
+    def __init__(self, latency=0.0):
+        super().__init__(latency)
+        self.messages = 0
+        self.attachments = 0
+
+    def make_app(self):
+        '''
+        Returns the ``tornado.web.Application`` serving the mock.
+        '''
+        return tornado.web.Application([(r'/.*', SlackHandler, {'service': self})])
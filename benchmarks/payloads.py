@@ -0,0 +1,113 @@
+# -*- coding: utf-8 -*-
+'''
+Builds synthetic GitHub webhook payloads with the shape and size of real ones,
+for use by the benchmarks.
+'''
+
+# Import Python libs
+import json
+
+API = 'https://api.github.com'
+
+
+def user(login, user_id):
+    '''
+    Returns a GitHub user object.
+    '''
+    url = '{0}/users/{1}'.format(API, login)
+    return {
+        'login': login, 'id': user_id, 'node_id': 'MDQ6VXNlcj{0}'.format(user_id),
+        'avatar_url': 'https://avatars.githubusercontent.com/u/{0}?v=4'.format(user_id),
+        'gravatar_id': '', 'url': url, 'html_url': 'https://github.com/' + login,
+        'followers_url': url + '/followers',
+        'following_url': url + '/following{/other_user}',
+        'gists_url': url + '/gists{/gist_id}',
+        'starred_url': url + '/starred{/owner}{/repo}',
+        'subscriptions_url': url + '/subscriptions',
+        'organizations_url': url + '/orgs', 'repos_url': url + '/repos',
+        'events_url': url + '/events{/privacy}',
+        'received_events_url': url + '/received_events',
+        'type': 'User', 'site_admin': False,
+    }
+
+
+def repository(full_name, repo_id):
+    '''
+    Returns a GitHub repository object.
+    '''
+    url = '{0}/repos/{1}'.format(API, full_name)
+    repo = {'id': repo_id, 'node_id': 'MDEwOlJlcG9zaXRvcnk{0}'.format(repo_id),
+            'name': full_name.split('/')[1], 'full_name': full_name, 'private': False,
+            'owner': user(full_name.split('/')[0], repo_id + 1),
+            'html_url': 'https://github.com/' + full_name,
+            'description': 'Software to automate the management and configuration '
+                           'of any infrastructure or application at scale.',
+            'fork': False, 'url': url, 'homepage': 'https://saltproject.io',
+            'size': 350000, 'stargazers_count': 13000, 'watchers_count': 13000,
+            'language': 'Python', 'has_issues': True, 'has_projects': True,
+            'forks_count': 5500, 'open_issues_count': 2300, 'default_branch': 'develop',
+            'created_at': '2011-02-20T20:16:56Z', 'updated_at': '2018-10-01T12:00:00Z',
+            'pushed_at': '2018-10-01T12:00:00Z'}
+    for name in ('forks', 'keys', 'collaborators', 'teams', 'hooks', 'issue_events',
+                 'events', 'assignees', 'branches', 'tags', 'blobs', 'git_tags',
+                 'git_refs', 'trees', 'statuses', 'languages', 'stargazers',
+                 'contributors', 'subscribers', 'subscription', 'commits',
+                 'git_commits', 'comments', 'issue_comment', 'contents', 'compare',
+                 'merges', 'archive', 'downloads', 'issues', 'pulls', 'milestones',
+                 'notifications', 'labels', 'releases', 'deployments'):
+        repo[name + '_url'] = '{0}/{1}{{/number}}'.format(url, name)
+    return repo
+
+
+def pull_request_event(number=49517, action='opened', body_size=2000):
+    '''
+    Returns the raw body of a ``pull_request`` webhook.
+
+    number
+        The pull request number.
+
+    action
+        The pull request action.
+
+    body_size
+        The size of the pull request description, in characters. Large
+        descriptions are what make some real payloads hundreds of KB.
+    '''
+    repo = repository('saltstack/salt', 1390248)
+    url = '{0}/repos/saltstack/salt/pulls/{1}'.format(API, number)
+    pull = {
+        'url': url, 'id': 215000000 + number, 'number': number, 'state': 'open',
+        'html_url': 'https://github.com/saltstack/salt/pull/{0}'.format(number),
+        'diff_url': 'https://github.com/saltstack/salt/pull/{0}.diff'.format(number),
+        'issue_url': '{0}/repos/saltstack/salt/issues/{1}'.format(API, number),
+        'commits_url': url + '/commits', 'review_comments_url': url + '/comments',
+        'statuses_url': '{0}/repos/saltstack/salt/statuses/abc'.format(API),
+        'title': 'Fix yumpkg when listing upgrades',
+        'user': user('octocat', 583231),
+        'body': ('Lorem ipsum dolor sit amet. ' * (body_size // 28 + 1))[:body_size],
+        'created_at': '2018-10-01T12:00:00Z', 'updated_at': '2018-10-01T12:00:00Z',
+        'assignees': [], 'requested_reviewers': [], 'requested_teams': [],
+        'labels': [{'id': i, 'name': 'label-{0}'.format(i), 'color': 'ededed',
+                    'url': '{0}/labels/{1}'.format(API, i)} for i in range(3)],
+        'head': {'label': 'octocat:fix', 'ref': 'fix', 'sha': 'f' * 40,
+                 'user': user('octocat', 583231), 'repo': repository('octocat/salt', 2)},
+        'base': {'label': 'saltstack:develop', 'ref': 'develop', 'sha': 'b' * 40,
+                 'user': user('saltstack', 1147473), 'repo': repo},
+        'merged': False, 'mergeable': None, 'comments': 0, 'review_comments': 0,
+        'commits': 3, 'additions': 120, 'deletions': 14, 'changed_files': 4,
+    }
+    payload = {'action': action, 'number': number, 'pull_request': pull,
+               'repository': repo, 'organization': user('saltstack', 1147473),
+               'sender': user('octocat', 583231)}
+    return json.dumps(payload).encode('utf-8')
+
+
+def create_event(ref='2018.3.4'):
+    '''
+    Returns the raw body of a ``create`` webhook for a new branch.
+    '''
+    payload = {'ref': ref, 'ref_type': 'branch', 'master_branch': 'develop',
+               'description': None, 'pusher_type': 'user',
+               'repository': repository('saltstack/salt', 1390248),
+               'sender': user('octocat', 583231)}
+    return json.dumps(payload).encode('utf-8')
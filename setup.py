@@ -23,4 +23,7 @@ setup(
     install_requires=[
         'tornado>=4.5.2,<5.0',
     ],
+    extras_require={
+        'curl': ['pycurl'],
+    },
 )
@@ -0,0 +1,411 @@
+# -*- coding: utf-8 -*-
+'''
+Authenticates Tamarack as a GitHub App.
+
+A GitHub App gets a rate limit per installation instead of sharing the quota
+of one user, so the quota grows with the organizations Tamarack serves. The
+App signs a short-lived JWT with its private key and trades it for an
+installation access token, which is valid for one hour, for each
+installation.
+
+Set ``GITHUB_APP_ID`` and either ``GITHUB_APP_PRIVATE_KEY`` (the PEM contents)
+or ``GITHUB_APP_PRIVATE_KEY_FILE`` to authenticate as an App. Signing the JWT
+requires the optional ``PyJWT`` and ``cryptography`` packages.
+
+Installation tokens are cached per installation. When the server starts,
+tokens are minted for every installation of the App, and a background
+coroutine mints new ones ``GITHUB_TOKEN_REFRESH_MARGIN`` seconds before the
+old ones expire, so events only wait for a token when the App was installed
+on a new account since the server started.
+
+In a multi-process server, the installations and tokens are kept in the
+``tamarack.shared.SharedStore`` as well, see ``InstallationTokens.share``.
+Only one process loads the installations when the servers start, and a token
+is minted by one process and picked up from the store by the others.
+'''
+
+# Import Python libs
+import calendar
+import collections
+import json
+import logging
+import os
+import time
+
+# Import Tornado libs
+from tornado import gen
+import tornado.ioloop
+
+# Import Tamarack libs
+import tamarack.cache
+import tamarack.github
+
+try:
+    import jwt
+    HAS_JWT = True
+except ImportError:
+    HAS_JWT = False
+
+LOG = logging.getLogger(__name__)
+
+GITHUB_API_URL = os.environ.get('GITHUB_API_URL', 'https://api.github.com').rstrip('/')
+GITHUB_APP_ID = os.environ.get('GITHUB_APP_ID')
+GITHUB_APP_PRIVATE_KEY = os.environ.get('GITHUB_APP_PRIVATE_KEY')
+GITHUB_APP_PRIVATE_KEY_FILE = os.environ.get('GITHUB_APP_PRIVATE_KEY_FILE')
+GITHUB_TOKEN_REFRESH_MARGIN = float(os.environ.get('GITHUB_TOKEN_REFRESH_MARGIN', 600))
+
+# GitHub rejects JWTs valid for more than ten minutes. The issue time is set
+# in the past to allow for clock drift.
+JWT_LIFETIME = 540
+JWT_DRIFT = 60
+
+# Seconds between checks for tokens to refresh.
+REFRESH_INTERVAL = 60
+
+# Seconds a process holds its claim to load the installations or to mint a
+# token in a shared store, and waits for another process's token to appear.
+CLAIM_WINDOW = 10
+CLAIM_POLL_INTERVAL = 0.1
+
+# Installation endpoints required a preview media type in early API versions.
+APP_HEADERS = dict(tamarack.github.DEFAULT_HEADERS,
+                   Accept='application/vnd.github.machine-man-preview+json')
+
+InstallationToken = collections.namedtuple('InstallationToken', ['token', 'expires'])
+
+# The installations, tokens and claims kept in a tamarack.shared.SharedStore.
+SharedTokens = collections.namedtuple('SharedTokens', ['installations', 'tokens', 'claims'])
+
+_INSTALLATION_TOKENS = None
+
+
+class InstallationTokens:  # pylint: disable=too-many-instance-attributes
+    '''
+    Mints, caches and refreshes the installation access tokens of a GitHub
+    App.
+
+    app_id
+        The ID of the GitHub App.
+
+    private_key
+        The PEM encoded private key of the GitHub App.
+
+    margin
+        The number of seconds before its expiry a token is replaced. Defaults
+        to ``GITHUB_TOKEN_REFRESH_MARGIN``.
+
+    api_url
+        The base url of the GitHub API. Defaults to ``GITHUB_API_URL``.
+
+    timer
+        The function used to get the current wall clock time, which token
+        expiry times are based on. Defaults to ``time.time``.
+    '''
+
+    def __init__(self, app_id, private_key, margin=None, api_url=None, timer=time.time):
+        self.app_id = app_id
+        self.private_key = private_key
+        self.margin = GITHUB_TOKEN_REFRESH_MARGIN if margin is None else margin
+        self.api_url = api_url or GITHUB_API_URL
+        self.timer = timer
+        self.minted = 0
+        self._jwt = None
+        self._jwt_expires = 0
+        self._installations = {}
+        self._tokens = {}
+        self._in_flight = tamarack.cache.SingleFlight()
+        self._started = False
+        self._shared = None
+
+    def make_jwt(self):
+        '''
+        Returns a JWT authenticating as the App, reusing the previous one
+        while it is valid for at least another minute.
+        '''
+        now = self.timer()
+        if self._jwt is None or self._jwt_expires - now < 60:
+            self._jwt_expires = int(now) + JWT_LIFETIME
+            self._jwt = encode_jwt(self.app_id, self.private_key,
+                                   int(now) - JWT_DRIFT, self._jwt_expires)
+        return self._jwt
+
+    @gen.coroutine
+    def get_token(self, owner, repo_url=None):
+        '''
+        Returns an installation token for a repository owner. A cached token is
+        returned right away; a token close to its expiry is replaced in the
+        background.
+
+        owner
+            The login of the user or organization the App is installed on.
+
+        repo_url
+            The API url of one of the owner's repositories. Optional. Used to
+            look up the installation if it is not known yet.
+        '''
+        owner = owner.lower()
+        installation_id = self._installations.get(owner)
+        if installation_id is None:
+            installation_id = yield self._in_flight.run(
+                ('installation', owner), self._find_installation, owner, repo_url
+            )
+
+        cached = self._tokens.get(installation_id)
+        if cached is not None and cached.expires - self.timer() > JWT_DRIFT:
+            if cached.expires - self.timer() < self.margin:
+                self.refresh(installation_id)
+            return cached.token
+
+        token = yield self.refresh(installation_id)
+        return token.token
+
+    def refresh(self, installation_id):
+        '''
+        Mints a new token for an installation, unless one is being minted
+        already. Returns a future resolving to the ``InstallationToken``.
+
+        installation_id
+            The ID of the installation.
+        '''
+        return self._in_flight.run(('token', installation_id), self._mint, installation_id)
+
+    def share(self, store):
+        '''
+        Shares the installations and tokens with the other server processes
+        through a ``tamarack.shared.SharedStore``.
+
+        store
+            The ``SharedStore`` to keep the installations and tokens in.
+        '''
+        self._shared = SharedTokens(
+            store.cache('app-installations', maxsize=10000),
+            store.cache('app-tokens', maxsize=10000, load=InstallationToken._make),
+            store.timed_set('app-claims', CLAIM_WINDOW)
+        )
+
+    def start(self):
+        '''
+        Mints tokens for every installation of the App, then keeps them
+        refreshed ahead of their expiry, on the current IOLoop.
+        '''
+        if self._started:
+            return
+        self._started = True
+        tornado.ioloop.IOLoop.current().spawn_callback(self._run)
+
+    def stats(self):
+        '''
+        Returns a dictionary with the number of known installations, cached
+        tokens and tokens minted.
+        '''
+        return {'installations': len(self._installations),
+                'tokens': len(self._tokens),
+                'minted': self.minted}
+
+    def _app_headers(self):
+        return dict(APP_HEADERS, Authorization='Bearer {0}'.format(self.make_jwt()))
+
+    @gen.coroutine
+    def load_installations(self):
+        '''
+        Learns every installation of the App and mints a token for each.
+        '''
+        pages = tamarack.github.PageIterator(
+            '{0}/app/installations'.format(self.api_url), headers=self._app_headers()
+        )
+        while not pages.done():
+            for installation in (yield pages.next()):
+                login = installation.get('account', {}).get('login', '')
+                self._installations[login.lower()] = installation['id']
+                if self._shared is not None:
+                    self._shared.installations.set(login.lower(), installation['id'])
+
+        LOG.info('GitHub App is installed on %s accounts.', len(self._installations))
+        yield [self.refresh(installation_id)
+               for installation_id in set(self._installations.values())]
+
+    @gen.coroutine
+    def _find_installation(self, owner, repo_url=None):
+        '''
+        Looks up the installation of the App on an account.
+        '''
+        if self._shared is not None:
+            installation_id = self._shared.installations.get(owner)
+            if installation_id is not None:
+                self._installations[owner] = installation_id
+                return installation_id
+
+        if repo_url:
+            url = '{0}/installation'.format(repo_url)
+        else:
+            url = '{0}/users/{1}/installation'.format(self.api_url, owner)
+        response = yield tamarack.github.fetch(url, headers=self._app_headers())
+        installation_id = json.loads(response.body)['id']
+        self._installations[owner] = installation_id
+        if self._shared is not None:
+            self._shared.installations.set(owner, installation_id)
+        LOG.info('Found GitHub App installation %s for \'%s\'.', installation_id, owner)
+        return installation_id
+
+    @gen.coroutine
+    def _mint(self, installation_id):
+        '''
+        Trades a JWT for a new installation token, unless another server
+        process has minted one, see ``_shared_token``.
+        '''
+        token = yield self._shared_token(installation_id)
+        if token is not None:
+            self._tokens[installation_id] = token
+            return token
+
+        response = yield tamarack.github.fetch(
+            '{0}/app/installations/{1}/access_tokens'.format(self.api_url, installation_id),
+            method='POST',
+            headers=self._app_headers(),
+            post_data={}
+        )
+        data = json.loads(response.body)
+        token = InstallationToken(data['token'], _parse_time(data['expires_at']))
+        self._tokens[installation_id] = token
+        if self._shared is not None:
+            self._shared.tokens.set(installation_id, token)
+        self.minted += 1
+        LOG.info('Minted a token for GitHub App installation %s.', installation_id)
+        return token
+
+    @gen.coroutine
+    def _shared_token(self, installation_id):
+        '''
+        Returns a token for the installation that another server process
+        minted and that is not due for a refresh, or ``None`` if this process
+        should mint one. While another process holds the claim to mint it, the
+        token is waited for for up to ``CLAIM_WINDOW`` seconds.
+        '''
+        if self._shared is None:
+            return None
+        for _ in range(int(CLAIM_WINDOW / CLAIM_POLL_INTERVAL)):
+            token = self._shared.tokens.get(installation_id)
+            if token is not None and token.expires - self.timer() >= self.margin:
+                return token
+            if self._shared.claims.add('token-{0}'.format(installation_id)):
+                return None
+            yield gen.sleep(CLAIM_POLL_INTERVAL)
+        return None
+
+    @gen.coroutine
+    def _run(self):
+        '''
+        Refreshing coroutine. Runs forever.
+        '''
+        try:
+            if self._shared is None or self._shared.claims.add('installations'):
+                yield self.load_installations()
+        except Exception as err:  # pylint: disable=broad-except
+            LOG.error('Failed to load the GitHub App installations: %s', err)
+
+        while True:
+            yield gen.sleep(min(REFRESH_INTERVAL, self.margin / 2))
+            now = self.timer()
+            expiring = [installation_id for installation_id, token in self._tokens.items()
+                        if token.expires - now < self.margin]
+            for installation_id in expiring:
+                try:
+                    yield self.refresh(installation_id)
+                except Exception as err:  # pylint: disable=broad-except
+                    LOG.error('Failed to refresh the token of GitHub App installation '
+                              '%s: %s', installation_id, err)
+
+
+def encode_jwt(app_id, private_key, issued, expires):
+    '''
+    Returns a JWT for a GitHub App, signed with RS256.
+
+    app_id
+        The ID of the GitHub App.
+
+    private_key
+        The PEM encoded private key of the GitHub App.
+
+    issued
+        The issue time, in seconds since the epoch.
+
+    expires
+        The expiry time, in seconds since the epoch.
+    '''
+    if not HAS_JWT:
+        raise RuntimeError('GitHub App authentication requires the PyJWT and '
+                           'cryptography packages.')
+    token = jwt.encode({'iat': issued, 'exp': expires, 'iss': int(app_id)},
+                       private_key, algorithm='RS256')
+    # PyJWT 1.x returns bytes, 2.x returns str.
+    if isinstance(token, bytes):
+        token = token.decode('ascii')
+    return token
+
+
+def app_configured():
+    '''
+    Returns ``True`` if the environment configures a GitHub App.
+    '''
+    return bool(GITHUB_APP_ID and (GITHUB_APP_PRIVATE_KEY or GITHUB_APP_PRIVATE_KEY_FILE))
+
+
+def get_installation_tokens():
+    '''
+    Returns the ``InstallationTokens`` of the configured GitHub App, or
+    ``None`` if no App is configured.
+    '''
+    global _INSTALLATION_TOKENS  # pylint: disable=global-statement
+    if _INSTALLATION_TOKENS is None and app_configured():
+        private_key = GITHUB_APP_PRIVATE_KEY
+        if not private_key:
+            with open(GITHUB_APP_PRIVATE_KEY_FILE, encoding='utf-8') as key_file:
+                private_key = key_file.read()
+        _INSTALLATION_TOKENS = InstallationTokens(GITHUB_APP_ID, private_key)
+    return _INSTALLATION_TOKENS
+
+
+def set_installation_tokens(tokens):
+    '''
+    Replaces the ``InstallationTokens`` events are authenticated with.
+
+    tokens
+        The new ``InstallationTokens``, or ``None`` to use the GitHub token.
+    '''
+    global _INSTALLATION_TOKENS  # pylint: disable=global-statement
+    _INSTALLATION_TOKENS = tokens
+
+
+@gen.coroutine
+def event_token(event_data, token):
+    '''
+    Returns the token to process an event with: the installation token for
+    the owner of the event's repository if a GitHub App is configured, or
+    else the given token.
+
+    event_data
+        Payload sent from GitHub.
+
+    token
+        GitHub user token.
+    '''
+    tokens = get_installation_tokens()
+    if tokens is None:
+        return token
+
+    # Events are compacted to the repository's full name and url, see
+    # tamarack.event. The url of push events is not an API url.
+    full_name = (event_data.get('repository') or {}).get('full_name')
+    if not full_name:
+        return token
+    repo_url = '{0}/repos/{1}'.format(tokens.api_url, full_name)
+    installation_token = yield tokens.get_token(full_name.split('/')[0], repo_url)
+    return installation_token
+
+
+def _parse_time(value):
+    '''
+    Helper function that converts a GitHub ISO 8601 UTC timestamp to seconds
+    since the epoch.
+    '''
+    return calendar.timegm(time.strptime(value, '%Y-%m-%dT%H:%M:%SZ'))
@@ -0,0 +1,296 @@
+# -*- coding: utf-8 -*-
+'''
+In-process caches used to keep repeated GitHub lookups off the hot path of
+event handling.
+'''
+
+# Import Python libs
+import collections
+import time
+
+
+class LRUCache:
+    '''
+    A dictionary-like cache that holds at most ``maxsize`` entries and evicts
+    the least recently used entry first. Entries older than ``ttl`` seconds
+    are dropped when they are looked up.
+
+    maxsize
+        The maximum number of entries to keep. Defaults to ``128``.
+
+    ttl
+        The number of seconds an entry is kept. Optional. If not provided,
+        entries are only evicted when the cache is full.
+
+    timer
+        The function used to get the current time. Defaults to
+        ``time.monotonic``.
+    '''
+
+    def __init__(self, maxsize=128, ttl=None, timer=time.monotonic):
+        self.maxsize = maxsize
+        self.ttl = ttl
+        self.timer = timer
+        self.hits = 0
+        self.misses = 0
+        self._entries = collections.OrderedDict()
+
+    def __len__(self):
+        return len(self._entries)
+
+    def __contains__(self, key):
+        return self._lookup(key) is not None
+
+    def _lookup(self, key):
+        '''
+        Returns the ``(expires, value)`` pair stored for the key, dropping it if
+        it has expired.
+        '''
+        item = self._entries.get(key)
+        if item is None:
+            return None
+        expires = item[0]
+        if expires is not None and expires <= self.timer():
+            self._remove(key)
+            return None
+        return item
+
+    def _remove(self, key):
+        '''
+        Removes the key from the cache and returns its stored item.
+        '''
+        return self._entries.pop(key)
+
+    def get(self, key, default=None):
+        '''
+        Returns the value stored for the key and marks it as recently used.
+
+        key
+            The key to look up.
+
+        default
+            The value to return if the key is missing or expired.
+        '''
+        item = self._lookup(key)
+        if item is None:
+            self.misses += 1
+            return default
+        self.hits += 1
+        self._entries.move_to_end(key)
+        return item[1]
+
+    def set(self, key, value):
+        '''
+        Stores the value for the key, evicting the least recently used entry
+        if the cache is full.
+
+        key
+            The key to store the value under.
+
+        value
+            The value to store.
+        '''
+        expires = None
+        if self.ttl is not None:
+            expires = self.timer() + self.ttl
+        self._entries[key] = (expires, value)
+        self._entries.move_to_end(key)
+        while len(self._entries) > self.maxsize:
+            self._remove(next(iter(self._entries)))
+
+    def pop(self, key, default=None):
+        '''
+        Removes the key from the cache and returns its value.
+
+        key
+            The key to remove.
+
+        default
+            The value to return if the key is missing.
+        '''
+        if key not in self._entries:
+            return default
+        return self._remove(key)[1]
+
+    def clear(self):
+        '''
+        Removes all entries from the cache.
+        '''
+        self._entries.clear()
+
+
+class SizedLRUCache(LRUCache):
+    '''
+    An ``LRUCache`` bounded by the total size of its values, in bytes, rather
+    than by the number of entries.
+
+    maxbytes
+        The maximum total size of the cached values.
+
+    ttl
+        The number of seconds an entry is kept. Optional.
+
+    sizeof
+        The function returning the size of a value. Defaults to ``len``.
+
+    timer
+        The function used to get the current time. Defaults to
+        ``time.monotonic``.
+    '''
+
+    def __init__(self, maxbytes, ttl=None, sizeof=len, timer=time.monotonic):
+        super().__init__(maxsize=None, ttl=ttl, timer=timer)
+        self.maxbytes = maxbytes
+        self.sizeof = sizeof
+        self.nbytes = 0
+        self.evictions = 0
+
+    def _remove(self, key):
+        item = self._entries.pop(key)
+        self.nbytes -= item[2]
+        return item
+
+    def set(self, key, value):
+        '''
+        Stores the value for the key, evicting the least recently used entries
+        until the cached values fit in ``maxbytes``. Values larger than
+        ``maxbytes`` are not cached.
+
+        key
+            The key to store the value under.
+
+        value
+            The value to store.
+        '''
+        size = self.sizeof(value)
+        if key in self._entries:
+            self._remove(key)
+        if size > self.maxbytes:
+            return
+
+        expires = None
+        if self.ttl is not None:
+            expires = self.timer() + self.ttl
+        self._entries[key] = (expires, value, size)
+        self.nbytes += size
+        while self.nbytes > self.maxbytes:
+            self._remove(next(iter(self._entries)))
+            self.evictions += 1
+
+    def clear(self):
+        '''
+        Removes all entries from the cache.
+        '''
+        self._entries.clear()
+        self.nbytes = 0
+
+
+class TimedSet:
+    '''
+    A set that remembers each key for ``window`` seconds and holds at most
+    ``maxsize`` keys, forgetting the oldest keys first. Since every key is
+    kept for the same amount of time, keys expire in insertion order and
+    expiring them is a cheap pop from the front.
+
+    window
+        The number of seconds a key is remembered.
+
+    maxsize
+        The maximum number of keys to remember. Defaults to ``50000``.
+
+    timer
+        The function used to get the current time. Defaults to
+        ``time.monotonic``.
+    '''
+
+    def __init__(self, window, maxsize=50000, timer=time.monotonic):
+        self.window = window
+        self.maxsize = maxsize
+        self.timer = timer
+        self._entries = collections.OrderedDict()
+
+    def __len__(self):
+        self._expire()
+        return len(self._entries)
+
+    def __contains__(self, key):
+        self._expire()
+        return key in self._entries
+
+    def _expire(self):
+        now = self.timer()
+        entries = self._entries
+        while entries:
+            key, expires = next(iter(entries.items()))
+            if expires > now:
+                break
+            del entries[key]
+
+    def add(self, key):
+        '''
+        Adds the key to the set. Returns ``False`` if the key was already in
+        the set, and ``True`` otherwise.
+
+        key
+            The key to add.
+        '''
+        self._expire()
+        if key in self._entries:
+            return False
+        self._entries[key] = self.timer() + self.window
+        while len(self._entries) > self.maxsize:
+            self._entries.popitem(last=False)
+        return True
+
+    def discard(self, key):
+        '''
+        Removes the key from the set, if present.
+
+        key
+            The key to remove.
+        '''
+        self._entries.pop(key, None)
+
+
+class SingleFlight:
+    '''
+    Shares one in-flight call between callers asking for the same key. While
+    the coroutine started for a key is running, further calls for that key get
+    the same future instead of starting a second call.
+    '''
+
+    def __init__(self):
+        self._calls = {}
+
+    def __len__(self):
+        return len(self._calls)
+
+    def run(self, key, func, *args, **kwargs):
+        '''
+        Returns the future of the in-flight call for the key, or starts one by
+        calling the coroutine function ``func``.
+
+        key
+            The key identifying the call.
+
+        func
+            The coroutine function to call.
+
+        args, kwargs
+            The arguments to pass to ``func``.
+        '''
+        future = self._calls.get(key)
+        if future is not None:
+            return future
+
+        future = func(*args, **kwargs)
+        if future.done():
+            return future
+
+        self._calls[key] = future
+
+        def _forget(done_future):
+            if self._calls.get(key) is done_future:
+                del self._calls[key]
+        future.add_done_callback(_forget)
+        return future
@@ -0,0 +1,330 @@
+# -*- coding: utf-8 -*-
+'''
+Parses a CODEOWNERS file and resolves the owners of the files of a pull
+request the way GitHub does.
+
+Each CODEOWNERS line holds a file pattern followed by zero or more owners, and
+may end with a ``#`` comment. Patterns follow the ``.gitignore`` rules that
+GitHub supports:
+
+- A pattern starting with ``/`` or containing a ``/`` before its end is
+  anchored to the root of the repository. Other patterns match at any depth.
+- A pattern ending with ``/`` only matches directories, and so every file
+  beneath them. A pattern without wildcards in its last segment matches a
+  file or a directory of that name.
+- ``*`` and ``?`` do not match ``/``. A ``**`` segment matches any number of
+  directories: ``**/logs``, ``docs/**`` and ``a/**/b``.
+- ``!`` negation is not supported and such lines are ignored. Brackets are
+  matched literally.
+
+The last matching rule in the file takes precedence, and a matching rule
+without owners leaves the file without owners.
+
+Instead of trying every rule against every changed file, the rules are
+compiled once per CODEOWNERS revision and indexed: anchored rules by the
+literal prefix of their pattern (in a character trie), unanchored rules
+without wildcards by file or directory name, and unanchored wildcard rules by
+the file extension they require. Each file then only collects the few rules
+that could match it, and tries them from the last one in the file to the
+first, stopping at the first match.
+'''
+
+# Import Python libs
+import collections
+import functools
+import logging
+import re
+
+LOG = logging.getLogger(__name__)
+
+WILDCARD_CHARS = '*?'
+
+
+class Rule:  # pylint: disable=too-few-public-methods
+    '''
+    A single compiled CODEOWNERS entry.
+
+    index
+        The position of the entry among the entries of the CODEOWNERS file.
+
+    pattern
+        The file pattern of the entry.
+
+    owners
+        The owners of the files matching the pattern. May be empty.
+    '''
+    __slots__ = ('index', 'pattern', 'owners', 'anchored', 'body', 'regex', 'suffix')
+
+    def __init__(self, index, pattern, owners=()):
+        self.index = index
+        self.pattern = pattern
+        self.owners = tuple(owners)
+        self.anchored = pattern.startswith('/') or '/' in pattern.rstrip('/')
+        self.body = pattern.strip('/')
+        self.regex = re.compile(translate(pattern))
+
+        # Patterns whose last segment holds a wildcard only match files, so
+        # every matching path ends with the literal part after the wildcard.
+        self.suffix = ''
+        last_segment = self.body.rsplit('/', 1)[-1]
+        if not pattern.endswith('/') and _has_wildcard(last_segment):
+            self.suffix = _literal_suffix(last_segment)
+
+    def matches(self, file_name):
+        '''
+        Returns ``True`` if the rule matches the given file name.
+
+        file_name
+            The path of the file, relative to the root of the repository.
+        '''
+        if self.suffix and not file_name.endswith(self.suffix):
+            return False
+        return self.regex.match(file_name) is not None
+
+
+class _TrieNode:  # pylint: disable=too-few-public-methods
+    '''
+    A node of the literal prefix trie. ``rules`` holds the rules whose literal
+    prefix ends at this node, ``by_ext`` holds the subset of those rules that
+    can only match files with a given extension.
+    '''
+    __slots__ = ('children', 'rules', 'by_ext')
+
+    def __init__(self):
+        self.children = {}
+        self.rules = []
+        self.by_ext = {}
+
+
+class OwnersRules:
+    '''
+    The compiled rule set of a CODEOWNERS file. Use ``compile_rules`` to build
+    one from the contents of the file.
+
+    entries
+        A list of ``(pattern, owners)`` tuples, in the order they appear in the
+        CODEOWNERS file.
+    '''
+
+    def __init__(self, entries):
+        self.rules = []
+        self._names = {}
+        self._root = _TrieNode()
+
+        for index, (pattern, owners) in enumerate(entries):
+            rule = Rule(index, pattern, owners)
+            self.rules.append(rule)
+            self._index_rule(rule)
+
+    def __len__(self):
+        return len(self.rules)
+
+    def _index_rule(self, rule):
+        '''
+        Places the rule in the name table or in the prefix trie.
+        '''
+        if not rule.anchored and not _has_wildcard(rule.body):
+            self._names.setdefault(rule.body, []).append(rule)
+            return
+
+        node = self._root
+        if rule.anchored:
+            for char in _literal_prefix(rule.body):
+                node = node.children.setdefault(char, _TrieNode())
+
+        ext = _suffix_ext(rule.suffix)
+        if ext:
+            node.by_ext.setdefault(ext, []).append(rule)
+        else:
+            node.rules.append(rule)
+
+    def _candidates(self, file_name):
+        '''
+        Returns the rules that could match the given file name.
+        '''
+        candidates = []
+        for name in file_name.split('/'):
+            candidates.extend(self._names.get(name, ()))
+
+        ext = _file_ext(file_name)
+        node = self._root
+        position = 0
+        while True:
+            candidates.extend(node.rules)
+            if ext and node.by_ext:
+                candidates.extend(node.by_ext.get(ext, ()))
+            if position == len(file_name):
+                break
+            node = node.children.get(file_name[position])
+            if node is None:
+                break
+            position += 1
+        return candidates
+
+    def match(self, file_name):
+        '''
+        Returns the rule that decides the owners of the given file, which is
+        the last matching rule of the CODEOWNERS file, or ``None`` if no rule
+        matches.
+
+        file_name
+            The path of the file to find the owning rule for.
+        '''
+        candidates = self._candidates(file_name)
+        candidates.sort(key=_rule_index, reverse=True)
+        for rule in candidates:
+            if rule.matches(file_name):
+                return rule
+        return None
+
+    def owners(self, files):
+        '''
+        Returns the owners of the given files, without duplicates, in the order
+        they are first found.
+
+        files
+            The list of file names to find the owners of.
+        '''
+        owners = collections.OrderedDict()
+        for file_name in files:
+            rule = self.match(file_name)
+            if rule is not None:
+                for owner in rule.owners:
+                    owners[owner] = None
+        return list(owners)
+
+
+@functools.lru_cache(maxsize=16)
+def compile_rules(owners_contents):
+    '''
+    Parses and compiles the contents of a CODEOWNERS file. The compiled rules
+    are memoized on the file contents, so each CODEOWNERS revision is only
+    compiled once.
+
+    owners_contents
+        The contents of the CODEOWNERS file.
+    '''
+    return OwnersRules(parse_entries(owners_contents))
+
+
+def parse_entries(owners_contents):
+    '''
+    Returns the ``(pattern, owners)`` entries of a CODEOWNERS file, where
+    ``owners`` is a tuple that may be empty. Comments, blank lines and
+    unsupported negated patterns are ignored.
+
+    owners_contents
+        The contents of the CODEOWNERS file.
+    '''
+    entries = []
+    for line_num, line in enumerate(owners_contents.splitlines(), 1):
+        fields = line.split()
+        if not fields or fields[0].startswith('#'):
+            continue
+        if fields[0].startswith('!'):
+            LOG.warning('Ignoring negated CODEOWNERS pattern on line %s: %s',
+                        line_num, fields[0])
+            continue
+
+        owners = []
+        for field in fields[1:]:
+            if field.startswith('#'):
+                break
+            owners.append(field)
+        entries.append((fields[0], tuple(owners)))
+    return entries
+
+
+def translate(pattern):
+    '''
+    Returns a regular expression matching the file paths a CODEOWNERS pattern
+    applies to. See the module documentation for the pattern rules.
+
+    pattern
+        The CODEOWNERS file pattern.
+    '''
+    dir_only = pattern.endswith('/')
+    anchored = pattern.startswith('/') or '/' in pattern.rstrip('/')
+    segments = pattern.strip('/').split('/')
+
+    regex = '' if anchored else '(?:.*/)?'
+    for position, segment in enumerate(segments):
+        last = position == len(segments) - 1
+        if segment == '**':
+            regex += '.*' if last else '(?:.*/)?'
+            continue
+        regex += _translate_segment(segment)
+        if not last:
+            regex += '/'
+
+    if dir_only:
+        regex += '/.*'
+    elif not _has_wildcard(segments[-1]):
+        # The pattern may name a directory, which owns every file beneath it.
+        regex += '(?:/.*)?'
+    return regex + r'\Z'
+
+
+def _translate_segment(segment):
+    '''
+    Returns the regular expression for one ``/`` separated segment of a
+    pattern. Runs of ``*`` inside a segment act as a single ``*``.
+    '''
+    parts = []
+    for char in re.sub(r'\*+', '*', segment):
+        if char == '*':
+            parts.append('[^/]*')
+        elif char == '?':
+            parts.append('[^/]')
+        else:
+            parts.append(re.escape(char))
+    return ''.join(parts)
+
+
+def _has_wildcard(text):
+    return any(char in text for char in WILDCARD_CHARS)
+
+
+def _rule_index(rule):
+    return rule.index
+
+
+def _literal_prefix(pattern):
+    '''
+    Returns the part of the pattern before its first wildcard character.
+    '''
+    for position, char in enumerate(pattern):
+        if char in WILDCARD_CHARS:
+            return pattern[:position]
+    return pattern
+
+
+def _literal_suffix(pattern):
+    '''
+    Returns the part of the pattern after its last wildcard character. Every
+    file matching the pattern ends with this suffix.
+    '''
+    for position in range(len(pattern) - 1, -1, -1):
+        if pattern[position] in WILDCARD_CHARS:
+            return pattern[position + 1:]
+    return pattern
+
+
+def _suffix_ext(suffix):
+    '''
+    Returns the file extension required by a literal pattern suffix, if any.
+    '''
+    dot = suffix.rfind('.')
+    if dot == -1 or '/' in suffix[dot:]:
+        return ''
+    return suffix[dot:]
+
+
+def _file_ext(file_name):
+    '''
+    Returns the extension of the file name, including the leading dot.
+    '''
+    dot = file_name.rfind('.')
+    if dot == -1 or dot < file_name.rfind('/'):
+        return ''
+    return file_name[dot:]
@@ -0,0 +1,156 @@
+# -*- coding: utf-8 -*-
+'''
+A compact view of a GitHub webhook event.
+
+GitHub payloads are large: a pull request event carries full user,
+repository and pull request objects with dozens of URLs each, while Tamarack
+only routes and acts on a handful of fields. ``Event`` keeps just those
+fields in a ``__slots__`` object; neither the decoded payload nor the raw
+request body is kept, so an event waiting in the work queue holds a few
+hundred bytes whatever the size of its payload. With the event journal on,
+the raw bodies are kept on disk instead, see ``tamarack.journal``.
+
+The saving is in memory, not in parsing time: the body is still decoded in
+full, once, by ``json.loads``, as the standard library cannot skip over a JSON
+value without building it, and the decoded payload is dropped as soon as the
+fields are picked out. For the same reason the full payload cannot be decoded
+again on demand. Keeping the body around for that would cost more than the
+decoded fields save, so code that needs another field adds it to the kept
+fields below.
+
+Events of a type Tamarack does not route, according to the
+``X-GitHub-Event`` header, are not parsed at all.
+'''
+
+# Import Python libs
+import json
+
+# The GitHub event types handled by tamarack.event_processor.
+ROUTED_EVENTS = frozenset(['pull_request', 'create', 'push'])
+
+# The fields kept from the nested pull request and repository objects. Code
+# that needs another field of these objects must add it here.
+PULL_REQUEST_FIELDS = ('title', 'url', 'issue_url', 'base', 'head', 'user', 'changed_files',
+                       'requested_reviewers', 'requested_teams')
+REPOSITORY_FIELDS = ('full_name', 'url', 'clone_url')
+
+# The paths kept from each commit of a push event.
+COMMIT_FIELDS = ('added', 'modified', 'removed')
+
+
+class Event:  # pylint: disable=too-many-instance-attributes
+    '''
+    The routed fields of a GitHub webhook event. Use ``Event.from_body`` to
+    create one from a request body.
+
+    Events behave like the payload dictionary for ``get``, so they can be
+    passed to the functions in ``tamarack.event_processor`` and
+    ``tamarack.pull_request``. Fields that are not kept are missing.
+    '''
+    __slots__ = ('name', 'delivery_id', 'action', 'number', 'ref_type', 'ref',
+                 'deleted', 'commits', 'pull_request', 'repository')
+
+    # The top-level payload keys answered from the kept fields.
+    FIELDS = frozenset(['action', 'number', 'ref_type', 'ref', 'deleted', 'commits',
+                        'pull_request', 'repository'])
+
+    def __init__(self, name=None, delivery_id=None):
+        self.name = name
+        self.delivery_id = delivery_id
+        self.action = None
+        self.number = None
+        self.ref_type = None
+        self.ref = None
+        self.deleted = None
+        self.commits = None
+        self.pull_request = None
+        self.repository = None
+
+    @classmethod
+    def from_body(cls, body, name=None, delivery_id=None):
+        '''
+        Creates an event from a raw webhook request body. The body is decoded
+        once to pick out the routed fields, and the decoded payload is then
+        dropped.
+
+        body
+            The raw request body, as bytes.
+
+        name
+            The event type, from the ``X-GitHub-Event`` header. Optional.
+
+        delivery_id
+            The delivery ID, from the ``X-GitHub-Delivery`` header. Optional.
+        '''
+        event = cls(name=name, delivery_id=delivery_id)
+        payload = json.loads(body)
+        event.action = payload.get('action')
+        event.number = payload.get('number')
+        event.ref_type = payload.get('ref_type')
+        event.ref = payload.get('ref')
+        event.deleted = payload.get('deleted')
+        commits = payload.get('commits')
+        if isinstance(commits, list):
+            event.commits = [commit for commit in
+                             (_compact(commit, COMMIT_FIELDS) for commit in commits)
+                             if commit]
+        event.pull_request = _compact(payload.get('pull_request'), PULL_REQUEST_FIELDS)
+        event.repository = _compact(payload.get('repository'), REPOSITORY_FIELDS)
+        return event
+
+    def get(self, key, default=None):
+        '''
+        Returns a top-level field of the payload, like ``dict.get``.
+
+        key
+            The name of the field.
+
+        default
+            The value to return if the field is missing.
+        '''
+        if key in self.FIELDS:
+            value = getattr(self, key)
+            return default if value is None else value
+        return default
+
+    def __repr__(self):
+        return '<Event {0} action={1} number={2} delivery={3}>'.format(
+            self.name, self.action, self.number, self.delivery_id
+        )
+
+
+def _compact(obj, fields):
+    '''
+    Helper function that returns a dictionary holding only the given fields of
+    a nested payload object. Nested objects of the kept fields are reduced the
+    same way to the fields Tamarack uses (``base.ref``, ``base.sha``,
+    ``head.sha``, ``user.login``, and the ``login`` of requested reviewers and
+    ``slug`` of requested teams). Returns ``None`` if the object holds none of
+    the fields.
+
+    obj
+        The nested payload object. May be ``None``.
+
+    fields
+        The names of the fields to keep.
+    '''
+    if not obj or not isinstance(obj, dict):
+        return None
+
+    compact = {}
+    for field in fields:
+        if field not in obj:
+            continue
+        value = obj[field]
+        if field == 'base' and isinstance(value, dict):
+            value = {'ref': value.get('ref'), 'sha': value.get('sha')}
+        elif field == 'head' and isinstance(value, dict):
+            value = {'sha': value.get('sha')}
+        elif field == 'user' and isinstance(value, dict):
+            value = {'login': value.get('login')}
+        elif field == 'requested_reviewers' and isinstance(value, list):
+            value = [{'login': user.get('login')} for user in value]
+        elif field == 'requested_teams' and isinstance(value, list):
+            value = [{'slug': team.get('slug')} for team in value]
+        compact[field] = value
+    return compact or None
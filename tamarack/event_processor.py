@@ -5,40 +5,101 @@ The event processor handles incoming events and is called from server.py.
 
 # Import Python libs
 import logging
+import os
 
 # Import Tornado libs
 from tornado import gen
+import tornado.concurrent
 
 # Import Tamarack libs
+import tamarack.auth
 import tamarack.github
+import tamarack.logs
 import tamarack.pull_request
 import tamarack.slack
+import tamarack.tracing
 
 LOG = logging.getLogger(__name__)
 
+# Seconds to wait before processing the first event for a pull request, so
+# events that follow it closely are coalesced into the same decision.
+COALESCE_DELAY = float(os.environ.get('COALESCE_DELAY', 0))
+
+# Pull requests with events being processed, keyed by repository and number.
+PENDING_PULL_REQUESTS = {}
+
+
+class PullRequestBatch:
+    '''
+    Collects the events received for one pull request while an earlier event
+    for it is being processed. The events are merged: the most recent payload
+    is kept, along with the list of every action that was received.
+
+    event_data
+        Payload of the first event sent from GitHub.
+    '''
+
+    def __init__(self, event_data):
+        self.event_data = None
+        self.actions = []
+        self.waiters = []
+        self.add(event_data)
+
+    def add(self, event_data):
+        '''
+        Merges an event into the batch. Returns a future that resolves once the
+        batch the event is part of has been processed.
+
+        event_data
+            Payload sent from GitHub.
+        '''
+        self.event_data = event_data
+        self.actions.append(event_data.get('action', 'unknown'))
+        waiter = tornado.concurrent.Future()
+        self.waiters.append(waiter)
+        return waiter
+
+    def take(self):
+        '''
+        Returns the merged ``(event_data, actions, waiters)`` of the batch and
+        empties it.
+        '''
+        merged = (self.event_data, self.actions, self.waiters)
+        self.event_data = None
+        self.actions = []
+        self.waiters = []
+        return merged
+
 
 @gen.coroutine
-def handle_event(event_data, token):
+def handle_event(event_data, token, trace=None):
     '''
     An event has been received. Decide what to do with it.
 
-    Presently, only pull requests are handled. However, this can be expanded
-    later.
+    Pull request, create and push events are handled. Returns the future of a
+    Slack notification the event queued, see ``handle_create_event``, or
+    ``None``.
 
     event_data
         Payload sent from GitHub.
 
     token
         GitHub user token.
+
+    trace
+        The ``tamarack.tracing.Trace`` to record the stages on. Optional.
     '''
     if event_data.get('pull_request'):
-        yield handle_pull_request(event_data, token)
+        yield handle_pull_request(event_data, token, trace=trace)
     elif event_data.get('ref_type'):
-        yield handle_create_event(event_data)
+        return handle_create_event(event_data)
+    elif event_data.get('ref', '').startswith('refs/'):
+        yield handle_push_event(event_data, token, trace=trace)
+    return None
 
 
 @gen.coroutine
-def handle_pull_request(event_data, token):
+def handle_pull_request(event_data, token, trace=None):
     '''
     Handles Pull Request events by examining the type of action that was triggered
     and then decides what to do next.
@@ -47,45 +108,114 @@ def handle_pull_request(event_data, token):
     the pull request with the list of teams that should be reviewing the pull
     request, if applicable.
 
+    Events for a pull request that arrive while another event for the same pull
+    request is being processed are coalesced: they are merged into a single
+    decision that is made once the current one is done. The returned future
+    resolves once the decision the event was part of has been carried out, and
+    fails if that decision failed.
+
+    event_data
+        Payload sent from GitHub.
+
+    token
+        GitHub user token.
+
+    trace
+        The ``tamarack.tracing.Trace`` to record the stages on. Optional. The
+        stages of a coalesced event are recorded on the trace of the event
+        that processes the batch; the coalesced event only records how long
+        it waited for it.
+    '''
+    key = _pull_request_key(event_data)
+    batch = PENDING_PULL_REQUESTS.get(key)
+    if batch is not None:
+        LOG.info('PR #%s: Coalescing \'%s\' event with pending events.',
+                 event_data.get('number', 'unknown'),
+                 event_data.get('action', 'unknown'))
+        with tamarack.tracing.span(trace, 'coalesced'):
+            yield batch.add(event_data)
+        return
+
+    batch = PENDING_PULL_REQUESTS[key] = PullRequestBatch(event_data)
+    done = batch.waiters[0]
+    try:
+        if COALESCE_DELAY:
+            with tamarack.tracing.span(trace, 'coalesce.delay'):
+                yield gen.sleep(COALESCE_DELAY)
+
+        # A failed decision fails the events merged into it, but the events
+        # coalesced while it ran still get their own decision.
+        while batch.waiters:
+            merged_data, actions, waiters = batch.take()
+            try:
+                yield process_pull_request(merged_data, actions, token, trace=trace)
+            except Exception as err:  # pylint: disable=broad-except
+                for waiter in waiters:
+                    waiter.set_exception(err)
+            else:
+                for waiter in waiters:
+                    waiter.set_result(None)
+    finally:
+        del PENDING_PULL_REQUESTS[key]
+    yield done
+
+
+@gen.coroutine
+def process_pull_request(event_data, actions, token, trace=None):
+    '''
+    Decides what to do about a pull request, given the actions of one or more
+    coalesced events.
+
     Currently this function only handles "opened" events for PRs and has the bot
     assign reviewers to the PR with the list of teams/users that should review
     the submission. However, this can be easily expanded in the future.
 
     event_data
-        Payload sent from GitHub.
+        Payload sent from GitHub. The most recent one, if events were coalesced.
+
+    actions
+        The list of actions of the coalesced events.
 
     token
         GitHub user token.
+
+    trace
+        The ``tamarack.tracing.Trace`` to record the stages on. Optional.
     '''
     pr_num = event_data.get('number', 'unknown')
-    action = event_data.get('action', 'unknown')
+    log_context = tamarack.logs.context(trace, pr=pr_num)
 
-    LOG.info('PR #%s: Received pull request event. Processing...', pr_num)
+    LOG.info('PR #%s: Received pull request event. Processing...', pr_num,
+             extra=log_context)
 
     # Assign reviewers on "opened" PRs, as applicable.
-    if action == 'opened':
+    if 'opened' in actions:
         # Skip Merge Forward PRs
         if 'Merge forward' in event_data.get('pull_request', {}).get('title', ''):
             LOG.info('PR #%s: Skipping. PR is a merge-forward. Reviewers are not '
-                     'assigned to merge-forward PRs via Tamarack.', pr_num)
+                     'assigned to merge-forward PRs via Tamarack.', pr_num,
+                     extra=log_context)
             return
 
         # Assign reviewers!
-        yield tamarack.pull_request.assign_reviewers(event_data, token)
+        yield tamarack.pull_request.assign_reviewers(event_data, token, trace=trace)
     else:
-        LOG.info('PR #%s: Skipping. Action is \'%s\'. We only care about '
-                 '\'opened\'.', pr_num, action)
+        LOG.info('PR #%s: Skipping. Actions are %s. We only care about '
+                 '\'opened\'.', pr_num, actions, extra=log_context)
         return
 
 
-@gen.coroutine
 def handle_create_event(event_data):
     '''
     Handles Create events by examining the type of reference object that was
     created and then decides what to do next.
 
     For example, if a new branch is pushed to the repository, the bot needs to
-    send a slack message to the configured Slack App Webhook URL.
+    send a slack message to the configured Slack App Webhook URL. Messages are
+    queued on the Slack notification buffer, so branches created together are
+    announced in a single message. Returns the future resolving once the
+    message has been sent, without waiting for it, or ``None`` if no message
+    was queued.
 
     event_data
         Payload sent from GitHub.
@@ -99,7 +229,7 @@ def handle_create_event(event_data):
     # Send message to Slack when new branch is created.
     if event_type == 'branch':
         LOG.info('New branch \'%s\' was created in GitHub. Posting to Slack.', ref_name)
-        post_data = {'attachments': [
+        return tamarack.slack.notify(
             {'color': 'good',
              'fields': [{
                  'value':
@@ -107,13 +237,77 @@ def handle_create_event(event_data):
                          ref_name
                      )
                  }]}
-        ]}
-
-        yield tamarack.slack.api_request(
-            method='POST',
-            post_data=post_data
         )
-    else:
-        LOG.info('Skipping. Create event is of \'%s\' type. We only care about '
-                 '\'branch\'.', event_type)
-        return
+
+    LOG.info('Skipping. Create event is of \'%s\' type. We only care about '
+             '\'branch\'.', event_type)
+    return None
+
+
+@gen.coroutine
+def handle_push_event(event_data, token, trace=None):
+    '''
+    Handles Push events. When a push changes the CODEOWNERS file of a base
+    branch, the file is fetched again and its rules compiled, so the next pull
+    request against the branch finds it cached. Only the ``OWNERS_BRANCHES``
+    and branches whose file is already cached are refreshed, see
+    ``tamarack.pull_request.is_owners_branch``. Returns ``True`` if the file
+    was refreshed, and ``False`` if the push was skipped.
+
+    event_data
+        Payload sent from GitHub.
+
+    token
+        GitHub user token.
+
+    trace
+        The ``tamarack.tracing.Trace`` to record the stages on. Optional.
+    '''
+    ref = event_data.get('ref', '')
+    if not ref.startswith('refs/heads/'):
+        LOG.debug('Skipping. Push to \'%s\' is not to a branch.', ref)
+        return False
+
+    branch = ref[len('refs/heads/'):]
+    repo_url = '{0}/repos/{1}'.format(
+        tamarack.auth.GITHUB_API_URL, event_data.get('repository', {}).get('full_name')
+    )
+    if not tamarack.pull_request.is_owners_branch(repo_url, branch):
+        LOG.debug('Skipping. Push to branch \'%s\' is not to a base branch.', branch)
+        return False
+    if event_data.get('deleted') or not _touches_owners_file(event_data):
+        LOG.debug('Skipping. Push to branch \'%s\' does not change CODEOWNERS.', branch)
+        return False
+
+    LOG.info('CODEOWNERS file of branch \'%s\' changed. Refreshing it.', branch)
+    with tamarack.tracing.span(trace, 'owners.refresh', branch=branch):
+        yield tamarack.pull_request.refresh_owners_file(repo_url, branch, token, trace=trace)
+    return True
+
+
+def _touches_owners_file(event_data):
+    '''
+    Helper function that returns ``True`` if any commit of a push event adds,
+    modifies or removes the CODEOWNERS file.
+
+    event_data
+        Payload sent from GitHub.
+    '''
+    path = tamarack.pull_request.OWNERS_PATH
+    for commit in event_data.get('commits') or []:
+        for change in ('added', 'modified', 'removed'):
+            if path in (commit.get(change) or []):
+                return True
+    return False
+
+
+def _pull_request_key(event_data):
+    '''
+    Helper function that returns the key identifying the pull request of an
+    event: its repository and number.
+
+    event_data
+        Payload sent from GitHub.
+    '''
+    repo = event_data.get('repository', {}).get('full_name')
+    return repo, event_data.get('number', 'unknown')
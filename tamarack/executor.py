@@ -0,0 +1,107 @@
+# -*- coding: utf-8 -*-
+'''
+The pool CPU-heavy work is offloaded to, so it does not block the IOLoop.
+
+Matching the changed files of a large pull request against a large CODEOWNERS
+file can take long enough to delay every other webhook handled by the same
+IOLoop. Such work is run in a pool instead:
+
+- ``thread`` (the default) runs the work in a thread pool. The work still
+  holds the GIL, but the IOLoop gets to run between the interpreter's thread
+  switches, so other requests are delayed by milliseconds rather than by the
+  whole match.
+- ``process`` runs the work in a pool of processes, so it also runs in
+  parallel with the IOLoop. Arguments and results are pickled.
+- ``inline`` runs the work on the IOLoop, as before.
+
+Set the pool type with the ``OFFLOAD_EXECUTOR`` environment variable and its
+size with ``OFFLOAD_WORKERS``.
+'''
+
+# Import Python libs
+import concurrent.futures
+import logging
+import os
+
+# Import Tornado libs
+import tornado.concurrent
+
+LOG = logging.getLogger(__name__)
+
+OFFLOAD_EXECUTOR = os.environ.get('OFFLOAD_EXECUTOR', 'thread')
+OFFLOAD_WORKERS = int(os.environ.get('OFFLOAD_WORKERS', os.cpu_count() or 1))
+
+EXECUTORS = {
+    'thread': concurrent.futures.ThreadPoolExecutor,
+    'process': concurrent.futures.ProcessPoolExecutor,
+}
+
+_UNSET = object()
+_EXECUTOR = _UNSET
+
+
+def make_executor(kind=None, max_workers=None):
+    '''
+    Returns a new executor of the given kind, or ``None`` for ``inline``.
+
+    kind
+        ``thread``, ``process`` or ``inline``. Defaults to ``OFFLOAD_EXECUTOR``.
+
+    max_workers
+        The number of threads or processes. Defaults to ``OFFLOAD_WORKERS``.
+    '''
+    kind = kind or OFFLOAD_EXECUTOR
+    if kind == 'inline':
+        return None
+    if kind not in EXECUTORS:
+        LOG.error('Unknown OFFLOAD_EXECUTOR \'%s\'. Using a thread pool.', kind)
+        kind = 'thread'
+    return EXECUTORS[kind](max_workers=max_workers or OFFLOAD_WORKERS)
+
+
+def get_executor():
+    '''
+    Returns the shared executor, creating one with the default settings if the
+    application has not set one up.
+    '''
+    global _EXECUTOR  # pylint: disable=global-statement
+    if _EXECUTOR is _UNSET:
+        _EXECUTOR = make_executor()
+    return _EXECUTOR
+
+
+def set_executor(executor):
+    '''
+    Sets the shared executor.
+
+    executor
+        The ``concurrent.futures.Executor`` to use, or ``None`` to run work
+        inline on the IOLoop.
+    '''
+    global _EXECUTOR  # pylint: disable=global-statement
+    _EXECUTOR = executor
+
+
+def run(func, *args):
+    '''
+    Runs ``func(*args)`` in the shared executor. Returns a future that can be
+    yielded from a coroutine. If the executor is set to run work inline, the
+    function is called right away and the future is already resolved.
+
+    func
+        The function to call. For a process pool, it must be a module-level
+        function, and its arguments and result must be picklable.
+
+    args
+        The arguments to pass to ``func``.
+    '''
+    executor = get_executor()
+    if executor is not None:
+        return executor.submit(func, *args)
+
+    future = tornado.concurrent.Future()
+    try:
+        future.set_result(func(*args))
+    except Exception as err:  # pylint: disable=broad-except
+        future.set_exception(err)
+    return future
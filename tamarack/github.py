@@ -2,25 +2,158 @@
 '''
 Contains functions required for interacting with GitHub. The main function
 used is the ``api_request`` function. This function handles the GET/POST
-interactions to GitHub APIv3.
+interactions to GitHub APIv3. Data that would take several APIv3 requests is
+fetched in one GitHub GraphQL (APIv4) query with ``graphql``.
 '''
 
 # Import Python libs
+import collections
+import datetime
+import heapq
+import io
+import itertools
 import json
 import logging
+import os
+import random
+import re
+import time
+import urllib.parse
 
 # Import Tornado libs
 from tornado import gen
+import tornado.concurrent
 import tornado.escape
 import tornado.httpclient
 import tornado.httputil
+import tornado.ioloop
+import tornado.locks
 import tornado.web
 
+# Import Tamarack libs
+import tamarack.cache
+import tamarack.http_client
+import tamarack.metrics
+import tamarack.tracing
+
 LOG = logging.getLogger(__name__)
+DEFAULT_HEADERS = {'User-Agent': 'tamarack-bot',
+                   'Content-Type': 'application/json'}
+LINK_RE = re.compile(r'<([^>]+)>;\s*rel="([^"]+)"')
+
+# Request priorities. Writes, such as requesting reviewers, are sent before
+# reads when requests have to wait for the rate limiter.
+PRIORITY_WRITE = 0
+PRIORITY_READ = 1
+
+# Token bucket settings: the sustained number of requests per second and the
+# size of the bursts allowed above it. Once less than GITHUB_PACING_FRACTION of
+# the hourly quota is left, requests are spread evenly over the time left until
+# the quota resets, and GITHUB_WRITE_RESERVE requests are kept for writes.
+GITHUB_RATE = float(os.environ.get('GITHUB_RATE', 10))
+GITHUB_BURST = int(os.environ.get('GITHUB_BURST', 20))
+GITHUB_PACING_FRACTION = float(os.environ.get('GITHUB_PACING_FRACTION', 0.2))
+GITHUB_WRITE_RESERVE = int(os.environ.get('GITHUB_WRITE_RESERVE', 50))
+GITHUB_MAX_RETRIES = int(os.environ.get('GITHUB_MAX_RETRIES', 3))
+GITHUB_RETRY_BASE = float(os.environ.get('GITHUB_RETRY_BASE', 1))
+
+# Additional tokens reads may be sent with, so reads are spread over the
+# hourly quotas of several accounts. Each token has its own rate limiter.
+GITHUB_READ_TOKENS = [token.strip() for token in
+                      os.environ.get('GITHUB_READ_TOKENS', '').split(',') if token.strip()]
+MAX_RATE_LIMITERS = 64
+
+# GET responses of api_request are cached with their ETag and Last-Modified
+# headers, up to GITHUB_CACHE_BYTES bytes of response bodies, and revalidated
+# with conditional requests. GitHub does not count 304 responses against the
+# rate limit.
+GITHUB_CACHE_BYTES = int(os.environ.get('GITHUB_CACHE_BYTES', 32 * 1024 * 1024))
+
+CachedResponse = collections.namedtuple(
+    'CachedResponse', ['etag', 'last_modified', 'body', 'headers']
+)
+RESPONSE_CACHE = tamarack.cache.SizedLRUCache(
+    GITHUB_CACHE_BYTES, sizeof=lambda cached: len(cached.body)
+)
+CACHE_STATS = collections.Counter()
+
+# The files, CODEOWNERS file and review requests of a pull request are fetched
+# in one GraphQL query instead of several REST requests, unless GITHUB_GRAPHQL
+# is turned off. GitHub serves up to 100 files per query.
+GITHUB_GRAPHQL = os.environ.get('GITHUB_GRAPHQL', 'true').lower() not in ('0', 'false', 'no', 'off')
+GRAPHQL_PAGE_SIZE = 100
+
+REVIEW_DATA_QUERY = '''
+query($owner: String!, $name: String!, $number: Int!, $expression: String!,
+      $withText: Boolean!, $first: Int!, $cursor: String) {
+  repository(owner: $owner, name: $name) {
+    object(expression: $expression) {
+      ... on Blob { oid isTruncated text @include(if: $withText) }
+    }
+    pullRequest(number: $number) {
+      files(first: $first, after: $cursor) {
+        pageInfo { hasNextPage endCursor }
+        nodes { path }
+      }
+      reviewRequests(first: $first) {
+        pageInfo { hasNextPage endCursor }
+        nodes { requestedReviewer { ... on User { login } ... on Team { combinedSlug } } }
+      }
+      reviews(first: $first) {
+        pageInfo { hasNextPage endCursor }
+        nodes { author { login } }
+      }
+    }
+  }
+}
+'''
+
+REVIEWERS_QUERY = '''
+query($owner: String!, $name: String!, $number: Int!, $first: Int!,
+      $withRequests: Boolean!, $requestsCursor: String,
+      $withReviews: Boolean!, $reviewsCursor: String) {
+  repository(owner: $owner, name: $name) {
+    pullRequest(number: $number) {
+      reviewRequests(first: $first, after: $requestsCursor) @include(if: $withRequests) {
+        pageInfo { hasNextPage endCursor }
+        nodes { requestedReviewer { ... on User { login } ... on Team { combinedSlug } } }
+      }
+      reviews(first: $first, after: $reviewsCursor) @include(if: $withReviews) {
+        pageInfo { hasNextPage endCursor }
+        nodes { author { login } }
+      }
+    }
+  }
+}
+'''
+
+FILES_QUERY = '''
+query($owner: String!, $name: String!, $number: Int!, $first: Int!, $cursor: String) {
+  repository(owner: $owner, name: $name) {
+    pullRequest(number: $number) {
+      files(first: $first, after: $cursor) {
+        pageInfo { hasNextPage endCursor }
+        nodes { path }
+      }
+    }
+  }
+}
+'''
+
+# An empty connection, for the lists of a query that are not fetched again.
+_LAST_PAGE = {'pageInfo': {'hasNextPage': False, 'endCursor': None}, 'nodes': []}
+
+ReviewData = collections.namedtuple(
+    'ReviewData', ['files', 'owners_sha', 'owners_text', 'owners_truncated',
+                   'requested_reviewers', 'reviewed_by']
+)
+
+_RATE_LIMITERS = collections.OrderedDict()
 
 
 @gen.coroutine
-def api_request(url, token=None, method='GET', headers=None, post_data=None):
+def api_request(url, token=None, method='GET', headers=None, post_data=None,
+                trace=None):
     '''
     The main function used to interact with the GitHub API. This function
     performs the actual requests to GitHub when responding to various events.
@@ -49,25 +182,755 @@ def api_request(url, token=None, method='GET', headers=None, post_data=None):
         to issues/pull request require a ``'{"body": "My comment message."}'``
         structure, while other API calls require other options.
 
-    '''
-    if token:
-        url = tornado.httputil.url_concat(url, {'access_token': token})
-
-    if headers is None:
-        headers = {'User-Agent': 'tamarack-bot',
-                   'Content-Type': 'application/json'}
-
-    body = None
-    if post_data:
-        body = json.dumps(post_data)
-        body = body.encode('utf-8')
+    trace
+        The ``tamarack.tracing.Trace`` to record the request on. Optional.
 
-    http_client = tornado.httpclient.AsyncHTTPClient()
-    request = tornado.httpclient.HTTPRequest(
+    ``GET`` responses are cached by URL, see ``fetch``.
+    '''
+    # pylint: disable=too-many-arguments,too-many-positional-arguments
+    response = yield fetch(
         url,
+        token=token,
         method=method,
         headers=headers,
-        body=body,
+        post_data=post_data,
+        trace=trace
     )
-    response = yield http_client.fetch(request)
     return json.loads(response.body)
+
+
+def cache_stats():
+    '''
+    Returns a dictionary describing the GET response cache: the number of
+    entries and bytes cached, the lookups that found (``hits``) or did not
+    find (``misses``) a cached response, and the revalidations GitHub answered
+    with ``304 Not Modified`` (``not_modified``) or with a new response
+    (``modified``).
+    '''
+    return {'entries': len(RESPONSE_CACHE),
+            'bytes': RESPONSE_CACHE.nbytes,
+            'max_bytes': RESPONSE_CACHE.maxbytes,
+            'evictions': RESPONSE_CACHE.evictions,
+            'hits': RESPONSE_CACHE.hits,
+            'misses': RESPONSE_CACHE.misses,
+            'not_modified': CACHE_STATS['not_modified'],
+            'modified': CACHE_STATS['modified']}
+
+
+@gen.coroutine
+def graphql(url, query, variables, token, trace=None):
+    '''
+    Runs a query against the GitHub GraphQL API and returns its ``data``.
+
+    GraphQL queries are sent as ``POST`` requests, but are paced as reads,
+    against the separate GraphQL rate limit.
+    Errors reported in the response body are raised as a ``502``
+    ``tornado.web.HTTPError``.
+
+    url
+        The GraphQL endpoint, see ``graphql_url``.
+
+    query
+        The GraphQL query.
+
+    variables
+        A dictionary of the query's variables.
+
+    token
+        GitHub user token. GitHub does not answer GraphQL queries without one.
+
+    trace
+        The ``tamarack.tracing.Trace`` to record the request on. Optional.
+    '''
+    response = yield fetch(
+        url,
+        token=token,
+        method='POST',
+        post_data={'query': query, 'variables': variables},
+        priority=PRIORITY_READ,
+        trace=trace,
+        resource='graphql'
+    )
+    result = json.loads(response.body)
+    if result.get('errors') or result.get('data') is None:
+        raise tornado.web.HTTPError(
+            502, 'GitHub GraphQL query failed: %s',
+            '; '.join(error.get('message', '') for error in result.get('errors') or [])
+        )
+    return result['data']
+
+
+def graphql_url(repo_url):
+    '''
+    Returns the GraphQL endpoint of the GitHub instance serving a repository:
+    ``/graphql`` on github.com, ``/api/graphql`` on GitHub Enterprise.
+
+    repo_url
+        The APIv3 url of the repository.
+    '''
+    base = repo_url.split('/repos/', 1)[0]
+    if base.endswith('/api/v3'):
+        return base[:-len('/v3')] + '/graphql'
+    return base + '/graphql'
+
+
+@gen.coroutine
+def get_review_data(repo_url, number, ref, path, token, with_text=True, trace=None):
+    '''
+    Returns what assigning reviewers to a pull request needs as a
+    ``ReviewData`` tuple: the paths of the changed files, the blob SHA and
+    text of the CODEOWNERS file, the requested reviewers, with teams given
+    as ``org/team``, and the users who already reviewed it.
+
+    Everything is fetched in a single GraphQL query for pull requests of up to
+    ``GRAPHQL_PAGE_SIZE`` files, review requests and reviews. Further pages
+    are fetched with one more query each.
+
+    repo_url
+        The APIv3 url of the repository.
+
+    number
+        The number of the pull request.
+
+    ref
+        The branch the CODEOWNERS file is read from.
+
+    path
+        The path of the CODEOWNERS file in the repository.
+
+    token
+        GitHub user token.
+
+    with_text
+        Whether to fetch the text of the CODEOWNERS file, or only its SHA.
+        Defaults to ``True``. The SHA is enough to revalidate a cached file.
+
+    trace
+        The ``tamarack.tracing.Trace`` to record the requests on. Optional.
+
+    If the CODEOWNERS file does not exist, ``owners_sha`` is ``None``. If it is
+    too large for GraphQL, ``owners_truncated`` is ``True``.
+    '''
+    # pylint: disable=too-many-arguments,too-many-positional-arguments,too-many-locals
+    url = graphql_url(repo_url)
+    owner, name = repo_url.rstrip('/').split('/')[-2:]
+    variables = {'owner': owner, 'name': name, 'number': int(number),
+                 'expression': '{0}:{1}'.format(ref or 'HEAD', path),
+                 'withText': with_text, 'first': GRAPHQL_PAGE_SIZE, 'cursor': None}
+
+    data = yield graphql(url, REVIEW_DATA_QUERY, variables, token, trace=trace)
+    repository = data['repository']
+    pull_request = repository['pullRequest']
+    blob = repository.get('object') or {}
+
+    requests = pull_request['reviewRequests']
+    reviews = pull_request['reviews']
+    requested, reviewed_by = [], []
+    _add_reviewers(requests, reviews, requested, reviewed_by)
+
+    files = pull_request['files']
+    paths = [node['path'] for node in files['nodes']]
+    del variables['expression'], variables['withText']
+    while files['pageInfo']['hasNextPage']:
+        variables['cursor'] = files['pageInfo']['endCursor']
+        data = yield graphql(url, FILES_QUERY, variables, token, trace=trace)
+        files = data['repository']['pullRequest']['files']
+        paths.extend(node['path'] for node in files['nodes'])
+
+    del variables['cursor']
+    while requests['pageInfo']['hasNextPage'] or reviews['pageInfo']['hasNextPage']:
+        variables.update(withRequests=requests['pageInfo']['hasNextPage'],
+                         requestsCursor=requests['pageInfo']['endCursor'],
+                         withReviews=reviews['pageInfo']['hasNextPage'],
+                         reviewsCursor=reviews['pageInfo']['endCursor'])
+        data = yield graphql(url, REVIEWERS_QUERY, variables, token, trace=trace)
+        pull_request = data['repository']['pullRequest']
+        requests = pull_request.get('reviewRequests') or _LAST_PAGE
+        reviews = pull_request.get('reviews') or _LAST_PAGE
+        _add_reviewers(requests, reviews, requested, reviewed_by)
+
+    return ReviewData(
+        files=paths,
+        owners_sha=blob.get('oid'),
+        owners_text=blob.get('text'),
+        owners_truncated=bool(blob.get('isTruncated')),
+        requested_reviewers=requested,
+        reviewed_by=reviewed_by
+    )
+
+
+def _add_reviewers(requests, reviews, requested, reviewed_by):
+    '''
+    Helper function that adds the requested reviewers of a page of review
+    requests, and the authors of a page of reviews, to the given lists.
+    '''
+    for node in requests['nodes']:
+        reviewer = node.get('requestedReviewer') or {}
+        login = reviewer.get('login') or reviewer.get('combinedSlug')
+        if login:
+            requested.append(login)
+
+    for node in reviews['nodes']:
+        login = (node.get('author') or {}).get('login')
+        if login and login not in reviewed_by:
+            reviewed_by.append(login)
+
+
+@gen.coroutine
+def fetch(url, token=None, method='GET', headers=None, post_data=None, priority=None,
+          trace=None, resource='core'):
+    '''
+    Performs a request against the GitHub API and returns the raw
+    ``tornado.httpclient.HTTPResponse``, so callers can inspect the response
+    headers. The arguments are the same as for ``api_request``.
+
+    ``GET`` responses with an ``ETag`` or ``Last-Modified`` header are cached
+    by URL, up to ``GITHUB_CACHE_BYTES`` bytes of bodies. A cached response is
+    revalidated with an ``If-None-Match`` or ``If-Modified-Since`` request,
+    which GitHub does not count against the rate limit, and is returned with
+    its original headers, such as the ``Link`` header of a page, when GitHub
+    answers ``304 Not Modified``.
+
+    Callers sending their own conditional headers keep their own cache: their
+    requests bypass this one, and a ``304 Not Modified`` response is returned
+    to them instead of being raised as an error.
+
+    Requests are paced by the shared ``RateLimiter`` of the token and
+    ``resource``, which also learns the remaining quota from each response.
+    Requests rejected by GitHub's primary or secondary rate limits (``403`` or
+    ``429``) are retried up to ``GITHUB_MAX_RETRIES`` times, honoring
+    ``Retry-After`` and the quota reset time, or else backing off
+    exponentially with jitter.
+
+    The token is sent in the ``Authorization`` header. Reads made with a token
+    are sent with whichever of it and the ``GITHUB_READ_TOKENS`` has the most
+    quota left. Callers authenticating some other way, such as with a GitHub
+    App JWT, pass their own ``Authorization`` header and no token.
+
+    priority
+        ``PRIORITY_WRITE`` or ``PRIORITY_READ``. Optional. If not provided,
+        ``GET`` and ``HEAD`` requests are reads and everything else is a write.
+
+    resource
+        The GitHub rate limit the request counts against: ``core`` for the
+        REST API, which is the default, or ``graphql``.
+
+    Each attempt is recorded as a ``github.fetch`` span on the ``trace``, with
+    the time it waited for the rate limiter as ``queued``.
+    '''
+    # pylint: disable=too-many-arguments,too-many-positional-arguments
+    headers = dict(DEFAULT_HEADERS if headers is None else headers)
+    if priority is None:
+        priority = PRIORITY_READ if method in ('GET', 'HEAD') else PRIORITY_WRITE
+    if token and priority == PRIORITY_READ and GITHUB_READ_TOKENS:
+        token = pick_read_token(token, resource)
+    if token:
+        headers['Authorization'] = 'token {0}'.format(token)
+
+    body = None
+    if post_data is not None:
+        body = json.dumps(post_data).encode('utf-8')
+
+    conditional = {name.lower() for name in headers} & {'if-none-match', 'if-modified-since'}
+    if method != 'GET' or body is not None or conditional:
+        response = yield _send(tornado.httpclient.HTTPRequest(
+            url, method=method, headers=headers, body=body
+        ), get_rate_limiter(token, resource), priority, trace)
+        return response
+
+    cached = RESPONSE_CACHE.get(url)
+    if cached is not None:
+        if cached.etag:
+            headers['If-None-Match'] = cached.etag
+        if cached.last_modified:
+            headers['If-Modified-Since'] = cached.last_modified
+
+    request = tornado.httpclient.HTTPRequest(url, headers=headers)
+    response = yield _send(request, get_rate_limiter(token, resource), priority, trace)
+    if response.code == 304 and cached is not None:
+        CACHE_STATS['not_modified'] += 1
+        return tornado.httpclient.HTTPResponse(
+            request, 200, headers=tornado.httputil.HTTPHeaders(cached.headers),
+            buffer=io.BytesIO(cached.body), effective_url=url
+        )
+
+    etag = response.headers.get('Etag')
+    last_modified = response.headers.get('Last-Modified')
+    if response.code == 200 and (etag or last_modified):
+        if cached is not None:
+            CACHE_STATS['modified'] += 1
+        RESPONSE_CACHE.set(url, CachedResponse(
+            etag, last_modified, response.body, tornado.httputil.HTTPHeaders(response.headers)
+        ))
+    return response
+
+
+@gen.coroutine
+def _send(request, limiter, priority, trace):
+    '''
+    Helper function that sends a request once the rate limiter lets it
+    through, retrying it when GitHub rate limits it, see ``fetch``. A
+    ``304 Not Modified`` response is returned instead of being raised.
+    '''
+    endpoint = _endpoint(request.url)
+    attempt = 0
+    while True:
+        queued = time.monotonic()
+        yield limiter.acquire(priority)
+        start = time.monotonic()
+        try:
+            response = yield tamarack.http_client.get_client().fetch(
+                tornado.httpclient.HTTPRequest(request.url, method=request.method,
+                                               headers=dict(request.headers),
+                                               body=request.body)
+            )
+        except tornado.httpclient.HTTPError as err:
+            _record_fetch(trace, request.method, endpoint, err.code, queued, start, attempt)
+            if err.response is not None:
+                limiter.update(err.response.headers)
+            if err.code == 304 and err.response is not None:
+                return err.response
+
+            delay = _retry_delay(err, attempt)
+            if delay is None or attempt >= GITHUB_MAX_RETRIES:
+                raise
+            attempt += 1
+            limiter.pause(delay)
+            LOG.warning('GitHub rate limit hit (HTTP %s). Retrying in %.1f seconds '
+                        '(attempt %s of %s).', err.code, delay, attempt,
+                        GITHUB_MAX_RETRIES)
+            continue
+
+        _record_fetch(trace, request.method, endpoint, response.code, queued, start, attempt)
+        limiter.update(response.headers)
+        return response
+
+
+def _record_fetch(trace, method, endpoint, status, queued, start, attempt):
+    '''
+    Helper function that records the latency of a request in the metrics and,
+    if a trace is given, as a ``github.fetch`` span.
+    '''
+    # pylint: disable=too-many-arguments,too-many-positional-arguments
+    duration = time.monotonic() - start
+    tamarack.metrics.GITHUB_REQUEST_SECONDS.observe(duration, method, endpoint, status)
+    if trace is not None:
+        trace.add('github.fetch', queued, duration + start - queued,
+                  method=method, endpoint=endpoint, status=status,
+                  queued=round(start - queued, 6), attempt=attempt)
+
+
+class RateLimiter:  # pylint: disable=too-many-instance-attributes
+    '''
+    Paces GitHub API requests with a token bucket that is informed by the rate
+    limit headers GitHub sends back.
+
+    Requests wait in a priority queue, so writes are let through before reads.
+    While plenty of quota is left, requests flow at up to ``rate`` per second
+    with bursts of up to ``burst`` requests. When less than
+    ``pacing_fraction`` of the quota is left, the rate drops to spread the
+    remaining requests over the time left until the quota resets, and reads
+    stop once only ``write_reserve`` requests remain.
+
+    rate
+        The sustained number of requests per second.
+
+    burst
+        The maximum number of requests let through at once.
+
+    pacing_fraction
+        The fraction of the quota below which requests are paced to the reset.
+
+    write_reserve
+        The number of requests reserved for writes.
+
+    timer
+        The function used to get the current wall clock time, which GitHub's
+        reset times are based on. Defaults to ``time.time``.
+
+    resource
+        The GitHub rate limit tracked, as named by the
+        ``X-RateLimit-Resource`` header. Defaults to ``core``, the REST API.
+        Headers reporting another resource are ignored.
+    '''
+
+    def __init__(self, rate=None, burst=None, pacing_fraction=None,
+                 write_reserve=None, timer=time.time, resource='core'):
+        # pylint: disable=too-many-arguments,too-many-positional-arguments
+        self.resource = resource
+        self.rate = rate or GITHUB_RATE
+        self.burst = burst or GITHUB_BURST
+        self.pacing_fraction = GITHUB_PACING_FRACTION if pacing_fraction is None \
+            else pacing_fraction
+        self.write_reserve = GITHUB_WRITE_RESERVE if write_reserve is None \
+            else write_reserve
+        self.timer = timer
+        self.io_loop = tornado.ioloop.IOLoop.current()
+
+        self.limit = None
+        self.remaining = None
+        self.reset = None
+        self.paused_until = 0
+        self.throttled = 0
+
+        self._tokens = float(self.burst)
+        self._updated = timer()
+        self._waiters = []
+        self._counter = itertools.count()
+        self._wake = tornado.locks.Condition()
+        self._dispatching = False
+
+    def update(self, headers):
+        '''
+        Updates the known quota from the rate limit headers of a response.
+
+        headers
+            The response headers.
+        '''
+        resource = headers.get('X-RateLimit-Resource')
+        if resource is not None and resource != self.resource:
+            return
+        try:
+            remaining = headers.get('X-RateLimit-Remaining')
+            if remaining is not None:
+                self.remaining = int(remaining)
+            reset = headers.get('X-RateLimit-Reset')
+            if reset is not None:
+                self.reset = int(reset)
+            limit = headers.get('X-RateLimit-Limit')
+            if limit is not None:
+                self.limit = int(limit)
+        except ValueError:
+            LOG.warning('Ignoring invalid GitHub rate limit headers.')
+
+    def pause(self, seconds):
+        '''
+        Holds back every request for the given number of seconds.
+
+        seconds
+            The number of seconds to pause for.
+        '''
+        self.paused_until = max(self.paused_until, self.timer() + seconds)
+        self._wake.notify_all()
+
+    def acquire(self, priority=PRIORITY_READ):
+        '''
+        Returns a future that resolves once a request of the given priority may
+        be sent.
+
+        priority
+            ``PRIORITY_WRITE`` or ``PRIORITY_READ``.
+        '''
+        future = tornado.concurrent.Future()
+        if not self._waiters and self._delay(priority) <= 0:
+            self._take()
+            future.set_result(None)
+            return future
+
+        self.throttled += 1
+        heapq.heappush(self._waiters, (priority, next(self._counter), future))
+        if self._dispatching:
+            self._wake.notify_all()
+        else:
+            self._dispatching = True
+            self.io_loop.spawn_callback(self._dispatch)
+        return future
+
+    def waiting(self):
+        '''
+        Returns the number of requests waiting to be sent.
+        '''
+        return len(self._waiters)
+
+    def _refill(self):
+        now = self.timer()
+        self._tokens = min(self.burst,
+                           self._tokens + (now - self._updated) * self._rate(now))
+        self._updated = now
+        return now
+
+    def _rate(self, now):
+        '''
+        Returns the current number of requests allowed per second.
+        '''
+        if self.remaining is None or self.reset is None or self.reset <= now:
+            return self.rate
+        if self.limit and self.remaining > self.limit * self.pacing_fraction:
+            return self.rate
+        return min(self.rate, self.remaining / max(self.reset - now, 1))
+
+    def _delay(self, priority):
+        '''
+        Returns the number of seconds a request of the given priority has to
+        wait before it may be sent.
+        '''
+        now = self._refill()
+        if now < self.paused_until:
+            return self.paused_until - now
+
+        if self.remaining is not None and self.reset is not None and self.reset > now:
+            if self.remaining <= 0 or (priority != PRIORITY_WRITE and
+                                       self.remaining <= self.write_reserve):
+                return self.reset - now
+
+        if self._tokens >= 1:
+            return 0
+        rate = self._rate(now)
+        if rate <= 0:
+            return max(self.reset - now, 1)
+        return (1 - self._tokens) / rate
+
+    def _take(self):
+        self._tokens -= 1
+        if self.remaining is not None:
+            self.remaining -= 1
+
+    @gen.coroutine
+    def _dispatch(self):
+        '''
+        Lets waiting requests through, highest priority first, as tokens and
+        quota become available.
+        '''
+        try:
+            while self._waiters:
+                delay = self._delay(self._waiters[0][0])
+                if delay > 0:
+                    yield self._wake.wait(timeout=datetime.timedelta(seconds=delay))
+                    continue
+                _, _, future = heapq.heappop(self._waiters)
+                self._take()
+                future.set_result(None)
+        finally:
+            self._dispatching = False
+
+
+def get_rate_limiter(token=None, resource='core'):
+    '''
+    Returns the rate limiter shared by the GitHub requests made with a token
+    against a rate limit resource on the current IOLoop. Each token has its
+    own quotas, so each gets its own limiters; the ``MAX_RATE_LIMITERS`` most
+    recently created are kept, as GitHub App installation tokens are replaced
+    every hour.
+
+    token
+        The GitHub token. Optional. Requests made without a token, or with a
+        JWT, share one limiter.
+
+    resource
+        The rate limit: ``core`` for the REST API, which is the default, or
+        ``graphql``. Only REST writes are made, so the limiters of other
+        resources keep no reserve for writes.
+    '''
+    io_loop = tornado.ioloop.IOLoop.current()
+    key = (token, resource)
+    limiter = _RATE_LIMITERS.get(key)
+    if limiter is None or limiter.io_loop is not io_loop:
+        if limiter is not None:
+            _RATE_LIMITERS.clear()
+        limiter = _RATE_LIMITERS[key] = RateLimiter(
+            resource=resource, write_reserve=None if resource == 'core' else 0
+        )
+        while len(_RATE_LIMITERS) > MAX_RATE_LIMITERS:
+            _RATE_LIMITERS.popitem(last=False)
+    return limiter
+
+
+def rate_limiters():
+    '''
+    Returns the rate limiters of the tokens used on the current IOLoop.
+    '''
+    io_loop = tornado.ioloop.IOLoop.current()
+    return [limiter for limiter in _RATE_LIMITERS.values() if limiter.io_loop is io_loop]
+
+
+def pick_read_token(token, resource='core'):
+    '''
+    Returns the token a read should be sent with: the one of ``token`` and
+    the ``GITHUB_READ_TOKENS`` with the most quota left. Tokens whose quota
+    is not known yet are tried first.
+
+    token
+        The token the read would otherwise be sent with.
+
+    resource
+        The rate limit the read counts against. Defaults to ``core``.
+    '''
+    best, best_remaining = token, None
+    for candidate in [token] + GITHUB_READ_TOKENS:
+        limiter = _RATE_LIMITERS.get((candidate, resource))
+        if limiter is None or limiter.remaining is None:
+            return candidate
+        if best_remaining is None or limiter.remaining > best_remaining:
+            best, best_remaining = candidate, limiter.remaining
+    return best
+
+
+class PageIterator:  # pylint: disable=too-many-instance-attributes
+    '''
+    Iterates over the pages of a paginated GitHub API listing, in the style of
+    ``tornado.gen.WaitIterator``:
+
+    .. code-block:: python
+
+        pages = tamarack.github.PageIterator(url, token)
+        while not pages.done():
+            items = yield pages.next()
+
+    The first page is fetched on its own. If its ``Link`` header names the last
+    page, all remaining pages are then requested concurrently and returned in
+    the order they arrive; ``page`` holds the number of the page last returned.
+    If GitHub only provides a ``next`` link, the pages are followed one after
+    another.
+
+    url
+        The GitHub API url of the listing.
+
+    token
+        GitHub user token.
+
+    per_page
+        The number of items to request per page. Defaults to ``100``, the
+        maximum GitHub allows.
+
+    trace
+        The ``tamarack.tracing.Trace`` to record the requests on. Optional.
+
+    headers
+        HTTP headers to send with each request. Optional.
+    '''
+
+    def __init__(self, url, token=None, per_page=100, trace=None, headers=None):
+        self.url = tornado.httputil.url_concat(url, {'per_page': per_page})
+        self.token = token
+        self.trace = trace
+        self.headers = headers
+        self.page = None
+        self._next_url = self.url
+        self._waiter = None
+        self._pages = []
+
+    def done(self):
+        '''
+        Returns ``True`` once every page has been returned.
+        '''
+        if self._next_url is not None:
+            return False
+        return self._waiter is None or self._waiter.done()
+
+    @gen.coroutine
+    def next(self):
+        '''
+        Returns the decoded items of the next available page.
+        '''
+        if self._next_url is None:
+            response = yield self._waiter.next()
+            self.page = self._pages[self._waiter.current_index]
+            return json.loads(response.body)
+
+        response = yield fetch(self._next_url, self.token, headers=self.headers,
+                               trace=self.trace)
+        self.page = _page_number(self._next_url) or 1
+        self._next_url = None
+
+        links = _parse_links(response.headers.get('Link'))
+        last_page = _page_number(links.get('last'))
+        if last_page:
+            self._pages = list(range(self.page + 1, last_page + 1))
+            self._waiter = gen.WaitIterator(*[
+                fetch(_page_url(links['last'], page), self.token, headers=self.headers,
+                      trace=self.trace)
+                for page in self._pages
+            ])
+        elif links.get('next'):
+            self._next_url = links['next']
+
+        return json.loads(response.body)
+
+
+def _parse_links(header):
+    '''
+    Helper function that returns a dictionary mapping the ``rel`` names of a
+    ``Link`` header to their urls.
+
+    header
+        The value of the ``Link`` header. May be ``None``.
+    '''
+    if not header:
+        return {}
+    return {rel: url for url, rel in LINK_RE.findall(header)}
+
+
+def _page_number(url):
+    '''
+    Helper function that returns the ``page`` query argument of a url as an
+    integer, or ``None``.
+    '''
+    if not url:
+        return None
+    query = urllib.parse.parse_qs(urllib.parse.urlsplit(url).query)
+    try:
+        return int(query['page'][0])
+    except (KeyError, ValueError):
+        return None
+
+
+def _endpoint(url):
+    '''
+    Helper function that returns the path of a GitHub API url with the owner,
+    repository and numbers replaced by placeholders, to label metrics without
+    creating a series per repository or pull request.
+    '''
+    parts = urllib.parse.urlsplit(url).path.split('/')
+    if len(parts) > 3 and parts[1] == 'repos':
+        parts[2:4] = [':owner', ':repo']
+    return '/'.join(':number' if part.isdigit() else part for part in parts)
+
+
+def _page_url(url, page):
+    '''
+    Helper function that returns the url with its ``page`` query argument
+    replaced.
+    '''
+    parts = urllib.parse.urlsplit(url)
+    query = [(key, value) for key, value in urllib.parse.parse_qsl(parts.query)
+             if key not in ('page', 'access_token')]
+    query.append(('page', str(page)))
+    return urllib.parse.urlunsplit(parts._replace(query=urllib.parse.urlencode(query)))
+
+
+def _retry_delay(err, attempt):
+    '''
+    Helper function that returns the number of seconds to wait before retrying
+    a request that failed with the given error, or ``None`` if it should not
+    be retried.
+
+    err
+        The ``tornado.httpclient.HTTPError`` the request failed with.
+
+    attempt
+        The number of retries made so far.
+    '''
+    if err.code not in (403, 429) or err.response is None:
+        return None
+
+    headers = err.response.headers
+    retry_after = headers.get('Retry-After')
+    if retry_after is not None:
+        try:
+            return float(retry_after)
+        except ValueError:
+            pass
+
+    if headers.get('X-RateLimit-Remaining') == '0':
+        try:
+            return max(int(headers.get('X-RateLimit-Reset')) - time.time(), 1)
+        except (TypeError, ValueError):
+            pass
+    elif err.code == 403:
+        # A 403 without any rate limit information is a permission error.
+        body = err.response.body or b''
+        if b'rate limit' not in body.lower():
+            return None
+
+    backoff = GITHUB_RETRY_BASE * (2 ** attempt)
+    return backoff + random.uniform(0, backoff)
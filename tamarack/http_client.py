@@ -0,0 +1,139 @@
+# -*- coding: utf-8 -*-
+'''
+The long-lived HTTP client shared by the GitHub and Slack integrations.
+
+The client is created once per application in ``server.make_app``. It caps the
+total number of requests in flight as well as the number of requests in flight
+per host, and applies default connect and request timeouts to every request.
+
+If ``pycurl`` is installed, Tornado's curl based client is used. It keeps
+connections alive between requests, so bursts of GitHub API calls reuse open
+TLS connections instead of paying for a handshake per call. It is installed
+with the ``curl`` extra. Otherwise, a warning is logged and the simple HTTP
+client that ships with Tornado is used.
+'''
+
+# Import Python libs
+import logging
+import os
+import urllib.parse
+
+# Import Tornado libs
+from tornado import gen
+import tornado.httpclient
+import tornado.ioloop
+import tornado.locks
+
+try:
+    import tornado.curl_httpclient
+    import pycurl  # pylint: disable=unused-import
+    HAS_CURL = True
+except ImportError:
+    HAS_CURL = False
+
+LOG = logging.getLogger(__name__)
+
+HTTP_MAX_CLIENTS = int(os.environ.get('HTTP_MAX_CLIENTS', 20))
+HTTP_MAX_PER_HOST = int(os.environ.get('HTTP_MAX_PER_HOST', 8))
+HTTP_CONNECT_TIMEOUT = float(os.environ.get('HTTP_CONNECT_TIMEOUT', 10))
+HTTP_REQUEST_TIMEOUT = float(os.environ.get('HTTP_REQUEST_TIMEOUT', 30))
+
+_CLIENT = None
+
+
+class HTTPClient:  # pylint: disable=too-many-instance-attributes
+    '''
+    Wraps a dedicated ``AsyncHTTPClient`` instance with per-host concurrency
+    limits and default timeouts.
+
+    max_clients
+        The maximum number of requests in flight. Defaults to the
+        ``HTTP_MAX_CLIENTS`` environment variable, or ``20``.
+
+    max_per_host
+        The maximum number of requests in flight against a single host.
+        Defaults to the ``HTTP_MAX_PER_HOST`` environment variable, or ``8``.
+
+    connect_timeout
+        The default connect timeout, in seconds. Defaults to the
+        ``HTTP_CONNECT_TIMEOUT`` environment variable, or ``10``.
+
+    request_timeout
+        The default request timeout, in seconds. Defaults to the
+        ``HTTP_REQUEST_TIMEOUT`` environment variable, or ``30``.
+    '''
+
+    def __init__(self, max_clients=None, max_per_host=None,
+                 connect_timeout=None, request_timeout=None):
+        self.max_clients = max_clients or HTTP_MAX_CLIENTS
+        self.max_per_host = max_per_host or HTTP_MAX_PER_HOST
+        self.connect_timeout = connect_timeout or HTTP_CONNECT_TIMEOUT
+        self.request_timeout = request_timeout or HTTP_REQUEST_TIMEOUT
+        self.in_flight = 0
+        self.io_loop = tornado.ioloop.IOLoop.current()
+        self._host_slots = {}
+
+        if HAS_CURL:
+            client_class = tornado.curl_httpclient.CurlAsyncHTTPClient
+        else:
+            LOG.warning('pycurl is not installed, so connections to GitHub are not '
+                        'kept alive. Install tamarack[curl] to use the curl client.')
+            client_class = tornado.httpclient.AsyncHTTPClient
+        self._client = client_class(force_instance=True,
+                                    max_clients=self.max_clients)
+
+    @gen.coroutine
+    def fetch(self, request):
+        '''
+        Performs the request, waiting for a free slot for its host first.
+        Raises ``tornado.httpclient.HTTPError`` for non-200 responses, just
+        like ``AsyncHTTPClient.fetch``.
+
+        request
+            The ``tornado.httpclient.HTTPRequest`` to perform.
+        '''
+        if request.connect_timeout is None:
+            request.connect_timeout = self.connect_timeout
+        if request.request_timeout is None:
+            request.request_timeout = self.request_timeout
+
+        host = urllib.parse.urlsplit(request.url).netloc
+        slots = self._host_slots.get(host)
+        if slots is None:
+            slots = self._host_slots[host] = tornado.locks.Semaphore(self.max_per_host)
+
+        with (yield slots.acquire()):
+            self.in_flight += 1
+            try:
+                response = yield self._client.fetch(request)
+            finally:
+                self.in_flight -= 1
+        return response
+
+    def close(self):
+        '''
+        Closes the underlying HTTP client and its open connections.
+        '''
+        self._client.close()
+
+
+def get_client():
+    '''
+    Returns the shared HTTP client, creating one with the default settings if
+    the application has not set one up for the current IOLoop.
+    '''
+    global _CLIENT  # pylint: disable=global-statement
+    if _CLIENT is None or _CLIENT.io_loop is not tornado.ioloop.IOLoop.current():
+        _CLIENT = HTTPClient()
+    return _CLIENT
+
+
+def set_client(client):
+    '''
+    Sets the shared HTTP client used for GitHub and Slack requests.
+
+    client
+        The ``HTTPClient`` to use.
+    '''
+    global _CLIENT  # pylint: disable=global-statement
+    _CLIENT = client
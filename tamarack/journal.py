@@ -0,0 +1,369 @@
+# -*- coding: utf-8 -*-
+'''
+An append-only, on-disk journal of accepted webhook events.
+
+Events are written to the journal before GitHub is told they were accepted,
+and the delivery IDs of events are recorded in an index once they have been
+processed. When Tamarack starts, every journaled event that is missing from
+the index is replayed, so events accepted just before a crash or restart are
+not lost.
+
+The journal is a directory holding numbered segment files and the processed
+index:
+
+.. code-block:: text
+
+    segment-00000001.log
+    segment-00000002.log
+    processed.idx
+
+Each segment record is a ``crc32, id length, body length`` header followed by
+the delivery ID and the raw request body. A torn record at the end of a
+segment (from a crash in the middle of a write) fails its checksum and is
+ignored. Segments are rotated once they reach ``segment_size`` bytes and are
+deleted as soon as every event in them has been processed. The processed index
+only needs the IDs of events in segments that still exist, so it is rewritten
+with just those whenever a segment is rotated.
+
+Appends are group-committed: records are written as they arrive, and a
+single ``fsync`` in a background thread makes every record written since
+the previous commit durable at once. While one commit is running, new
+appends collect for the next one, so many concurrent webhooks share the
+cost of each ``fsync``.
+'''
+
+# Import Python libs
+import concurrent.futures
+import logging
+import os
+import struct
+import zlib
+
+# Import Tornado libs
+from tornado import gen
+import tornado.concurrent
+import tornado.ioloop
+
+LOG = logging.getLogger(__name__)
+
+HEADER = struct.Struct('>III')
+INDEX_NAME = 'processed.idx'
+SEGMENT_PREFIX = 'segment-'
+SEGMENT_SUFFIX = '.log'
+SEGMENT_SIZE = 16 * 1024 * 1024
+
+
+class Journal:  # pylint: disable=too-many-instance-attributes
+    '''
+    An append-only event journal stored in a local directory.
+
+    directory
+        The directory holding the journal files. It is created if necessary.
+
+    segment_size
+        The size, in bytes, after which a new segment file is started.
+        Defaults to 16 MiB.
+
+    commit_delay
+        The number of seconds to wait before starting a commit, to let more
+        appends join the batch. Defaults to ``0``, which commits as soon as
+        the IOLoop gets to it.
+    '''
+
+    def __init__(self, directory, segment_size=SEGMENT_SIZE, commit_delay=0):
+        self.directory = directory
+        self.segment_size = segment_size
+        self.commit_delay = commit_delay
+        self.appended = 0
+        self.commits = 0
+
+        self._executor = concurrent.futures.ThreadPoolExecutor(max_workers=1)
+        self._waiters = []
+        self._dirty = False
+        self._committing = False
+        self._unsynced = []
+        self._pending = {}
+        self._processed = {}
+        self._locations = {}
+        self._replay = []
+        self._compact_index = False
+        self._compacted_index = None
+
+        os.makedirs(directory, exist_ok=True)
+        self._load()
+
+        # The index stays open for the lifetime of the journal.
+        self._index_file = open(self._index_path(), 'ab')  # pylint: disable=consider-using-with
+        self._active_seq = max(self._pending, default=0) + 1
+        self._active = self._open_segment(self._active_seq)
+        self._active_size = 0
+
+    def _index_path(self):
+        return os.path.join(self.directory, INDEX_NAME)
+
+    def _segment_path(self, seq):
+        return os.path.join(
+            self.directory, '{0}{1:08d}{2}'.format(SEGMENT_PREFIX, seq, SEGMENT_SUFFIX)
+        )
+
+    def _open_segment(self, seq):
+        self._pending[seq] = set()
+        self._processed[seq] = set()
+        return open(self._segment_path(seq), 'ab')  # pylint: disable=consider-using-with
+
+    def _remove_segment(self, seq):
+        del self._pending[seq]
+        self._processed.pop(seq, None)
+        os.remove(self._segment_path(seq))
+
+    def _load(self):
+        '''
+        Reads the processed index and the existing segments, collecting every
+        record that still has to be replayed. Fully processed segments are
+        deleted and the index is compacted.
+        '''
+        index_path = self._index_path()
+        processed = set()
+        if os.path.exists(index_path):
+            with open(index_path, 'rb') as index_file:
+                processed = set(line.strip().decode('utf-8') for line in index_file)
+            processed.discard('')
+
+        for seq in _list_segments(self.directory):
+            path = self._segment_path(seq)
+            pending = set()
+            done = set()
+            for delivery_id, body in read_segment(path):
+                if delivery_id in processed:
+                    done.add(delivery_id)
+                elif delivery_id not in pending:
+                    pending.add(delivery_id)
+                    self._replay.append((delivery_id, body))
+                    self._locations.setdefault(delivery_id, []).append(seq)
+
+            if pending:
+                self._pending[seq] = pending
+                self._processed[seq] = done
+            else:
+                os.remove(path)
+
+        with open(index_path + '.tmp', 'wb') as index_file:
+            self._write_index(index_file)
+            index_file.flush()
+            os.fsync(index_file.fileno())
+        os.replace(index_path + '.tmp', index_path)
+
+    def _write_index(self, index_file):
+        '''
+        Writes the processed IDs of the segments that still exist to a new
+        index file.
+        '''
+        for delivery_id in set().union(*self._processed.values()):
+            index_file.write(delivery_id.encode('utf-8') + b'\n')
+
+    def replay(self):
+        '''
+        Returns the ``(delivery_id, body)`` records that were journaled by a
+        previous run but never marked as processed. Each record is only
+        returned once.
+        '''
+        records, self._replay = self._replay, []
+        if records:
+            LOG.info('Replaying %s unprocessed events from the journal.', len(records))
+        return records
+
+    def append(self, delivery_id, body):
+        '''
+        Appends an event to the journal. Returns a future that resolves once
+        the event has been written to disk.
+
+        delivery_id
+            The GitHub delivery ID of the event.
+
+        body
+            The raw request body of the event, as bytes.
+        '''
+        id_bytes = delivery_id.encode('utf-8')
+        record = HEADER.pack(zlib.crc32(body, zlib.crc32(id_bytes)),
+                             len(id_bytes), len(body)) + id_bytes + body
+
+        if self._active_size and self._active_size + len(record) > self.segment_size:
+            self._rotate()
+
+        self._active.write(record)
+        self._active_size += len(record)
+        self._pending[self._active_seq].add(delivery_id)
+        self._locations.setdefault(delivery_id, []).append(self._active_seq)
+        self.appended += 1
+
+        future = tornado.concurrent.Future()
+        self._waiters.append(future)
+        self._schedule_commit()
+        return future
+
+    def mark_processed(self, delivery_id):
+        '''
+        Records that an event has been processed, so it is not replayed.
+        Segments are deleted once all of their events have been processed.
+
+        delivery_id
+            The GitHub delivery ID of the event.
+        '''
+        seqs = self._locations.pop(delivery_id, None)
+        if seqs is None:
+            return
+
+        self._index_file.write(delivery_id.encode('utf-8') + b'\n')
+        self._dirty = True
+        for seq in seqs:
+            pending = self._pending.get(seq)
+            if pending is None:
+                continue
+            pending.discard(delivery_id)
+            if not pending and seq != self._active_seq:
+                self._remove_segment(seq)
+            else:
+                self._processed[seq].add(delivery_id)
+        self._schedule_commit()
+
+    def pending(self):
+        '''
+        Returns the number of journaled events that have not been processed.
+        '''
+        return len(self._locations)
+
+    def close(self):
+        '''
+        Flushes and closes the journal files.
+        '''
+        for journal_file in self._unsynced + [self._active, self._index_file]:
+            journal_file.flush()
+            os.fsync(journal_file.fileno())
+            journal_file.close()
+        self._unsynced = []
+        if self._compacted_index is not None:
+            os.replace(self._index_path() + '.tmp', self._index_path())
+        self._executor.shutdown()
+
+    def _rotate(self):
+        '''
+        Starts a new segment. The previous one is synced and closed, and the
+        processed index compacted, by the next commit.
+        '''
+        self._unsynced.append(self._active)
+        if not self._pending[self._active_seq]:
+            self._remove_segment(self._active_seq)
+        self._active_seq += 1
+        self._active = self._open_segment(self._active_seq)
+        self._active_size = 0
+        self._compact_index = True
+
+    def _schedule_commit(self):
+        if self._committing:
+            return
+        self._committing = True
+        tornado.ioloop.IOLoop.current().spawn_callback(self._commit)
+
+    @gen.coroutine
+    def _commit(self):
+        '''
+        Commits batches of appended records until nothing is left to commit.
+        '''
+        try:
+            if self.commit_delay:
+                yield gen.sleep(self.commit_delay)
+
+            while self._waiters or self._dirty:
+                waiters, self._waiters = self._waiters, []
+                rotated, self._unsynced = self._unsynced, []
+                self._dirty = False
+
+                # The compacted index replaces the old one once it is synced.
+                # Until then, the old one is kept and synced as well.
+                if self._compact_index and self._compacted_index is None:
+                    self._compact_index = False
+                    self._compacted_index = self._index_file
+                    self._index_file = open(  # pylint: disable=consider-using-with
+                        self._index_path() + '.tmp', 'wb'
+                    )
+                    self._write_index(self._index_file)
+                    rotated.append(self._compacted_index)
+
+                files = rotated + [self._active, self._index_file]
+                for journal_file in files:
+                    journal_file.flush()
+
+                try:
+                    yield self._executor.submit(
+                        _sync_files, [journal_file.fileno() for journal_file in files]
+                    )
+                except Exception as err:  # pylint: disable=broad-except
+                    LOG.error('Failed to commit the event journal: %s', err)
+                    for waiter in waiters:
+                        waiter.set_exception(err)
+                    continue
+                finally:
+                    for journal_file in rotated:
+                        journal_file.close()
+
+                if self._compacted_index is not None:
+                    os.replace(self._index_path() + '.tmp', self._index_path())
+                    self._compacted_index = None
+                self.commits += 1
+                for waiter in waiters:
+                    waiter.set_result(None)
+        finally:
+            self._committing = False
+
+
+def read_segment(path):
+    '''
+    Yields the ``(delivery_id, body)`` records of a segment file, stopping at
+    the first torn or corrupt record.
+
+    path
+        The path of the segment file.
+    '''
+    with open(path, 'rb') as segment:
+        data = segment.read()
+
+    offset = 0
+    while offset + HEADER.size <= len(data):
+        crc, id_len, body_len = HEADER.unpack_from(data, offset)
+        start = offset + HEADER.size
+        end = start + id_len + body_len
+        if end > len(data):
+            break
+        id_bytes = data[start:start + id_len]
+        body = data[start + id_len:end]
+        if zlib.crc32(body, zlib.crc32(id_bytes)) != crc:
+            break
+        yield id_bytes.decode('utf-8'), body
+        offset = end
+
+    if offset != len(data):
+        LOG.warning('Ignoring %s bytes of torn or corrupt data at the end of %s.',
+                    len(data) - offset, path)
+
+
+def _list_segments(directory):
+    '''
+    Returns the sorted sequence numbers of the segments in the directory.
+    '''
+    seqs = []
+    for name in os.listdir(directory):
+        if name.startswith(SEGMENT_PREFIX) and name.endswith(SEGMENT_SUFFIX):
+            try:
+                seqs.append(int(name[len(SEGMENT_PREFIX):-len(SEGMENT_SUFFIX)]))
+            except ValueError:
+                continue
+    return sorted(seqs)
+
+
+def _sync_files(fds):
+    '''
+    Flushes the given file descriptors to disk. Runs in the journal's
+    background thread.
+    '''
+    for fileno in fds:
+        os.fsync(fileno)
@@ -0,0 +1,237 @@
+# -*- coding: utf-8 -*-
+'''
+Sets up logging so that writing log records never blocks the IOLoop.
+
+By default, the root logger only gets a ``QueueHandler``, which puts records
+on a bounded in-memory queue. A ``QueueListener`` thread takes them off the
+queue and writes them to the rotating log file and the console. If the
+queue is full, records are dropped and counted instead of making the caller
+wait.
+
+Records are written as plain text, or as one JSON object per line if
+``LOG_FORMAT`` is ``json``. JSON records include the context passed with
+``extra=tamarack.logs.context(...)``, such as the delivery ID and type of the
+event being processed.
+'''
+
+# Import Python libs
+import atexit
+import json
+import logging
+import logging.handlers
+import os
+import queue
+
+LOG_FORMAT = os.environ.get('LOG_FORMAT', 'text').lower()
+LOG_QUEUE = os.environ.get('LOG_QUEUE', 'true').lower() not in ('0', 'false', 'no', 'off')
+LOG_QUEUE_SIZE = int(os.environ.get('LOG_QUEUE_SIZE', 10000))
+LOG_MAX_BYTES = int(os.environ.get('LOG_MAX_BYTES', 10 * 1024 * 1024))
+LOG_BACKUP_COUNT = int(os.environ.get('LOG_BACKUP_COUNT', 5))
+
+# The maximum number of items, such as file names, logged at INFO for a single
+# pull request. The full list is logged at DEBUG.
+LOG_ITEMS_MAX = int(os.environ.get('LOG_ITEMS_MAX', 20))
+
+TEXT_FORMAT = '[%(levelname)s] %(message)s'
+CONTEXT_FIELDS = ('delivery_id', 'event', 'action', 'pr')
+
+_QUEUE_HANDLER = None
+_LISTENER = None
+
+
+class JsonFormatter(logging.Formatter):
+    '''
+    Formats log records as single line JSON objects.
+    '''
+
+    def format(self, record):
+        data = {'time': self.formatTime(record),
+                'level': record.levelname,
+                'logger': record.name,
+                'message': record.getMessage()}
+        for field in CONTEXT_FIELDS:
+            value = getattr(record, field, None)
+            if value is not None:
+                data[field] = value
+        if record.exc_info:
+            data['exc_info'] = self.formatException(record.exc_info)
+        return json.dumps(data, default=str)
+
+
+class DroppingQueueHandler(logging.handlers.QueueHandler):
+    '''
+    A ``QueueHandler`` that drops records when the queue is full, instead of
+    blocking or reporting an error.
+
+    log_queue
+        The bounded ``queue.Queue`` to put records on.
+    '''
+
+    def __init__(self, log_queue):
+        super().__init__(log_queue)
+        self.dropped = 0
+
+    def enqueue(self, record):
+        try:
+            self.queue.put_nowait(record)
+        except queue.Full:
+            self.dropped += 1
+
+
+def setup(log_path, level, log_format=None, use_queue=None):
+    '''
+    Attaches the log handlers to the root logger.
+
+    log_path
+        The path of the log file. It is rotated once it reaches
+        ``LOG_MAX_BYTES``, keeping ``LOG_BACKUP_COUNT`` old files.
+
+    level
+        The log level.
+
+    log_format
+        ``text`` or ``json``. Defaults to ``LOG_FORMAT``.
+
+    use_queue
+        Whether records are written from a background thread. Defaults to
+        ``LOG_QUEUE``.
+    '''
+    global _QUEUE_HANDLER  # pylint: disable=global-statement
+    log_format = log_format or LOG_FORMAT
+    use_queue = LOG_QUEUE if use_queue is None else use_queue
+
+    if log_format == 'json':
+        formatter = JsonFormatter()
+    else:
+        formatter = logging.Formatter(TEXT_FORMAT)
+
+    handlers = [
+        logging.handlers.RotatingFileHandler(
+            log_path, maxBytes=LOG_MAX_BYTES, backupCount=LOG_BACKUP_COUNT, delay=True
+        ),
+        logging.StreamHandler(),
+    ]
+    for handler in handlers:
+        handler.setFormatter(formatter)
+        handler.setLevel(level)
+
+    root = logging.getLogger('')
+    root.setLevel(level)
+    if not use_queue:
+        for handler in handlers:
+            root.addHandler(handler)
+        return
+
+    _QUEUE_HANDLER = DroppingQueueHandler(queue.Queue(LOG_QUEUE_SIZE))
+    root.addHandler(_QUEUE_HANDLER)
+    _start_listener(handlers)
+    atexit.register(stop)
+
+
+def after_fork(task_id):
+    '''
+    Restarts the background writer in a forked server process, which does not
+    inherit the parent's thread. Each process writes to its own log file,
+    ``<name>.<task_id><ext>``, so processes do not rotate each other's files.
+
+    task_id
+        The number of the server process.
+    '''
+    root = logging.getLogger('')
+    if _LISTENER is None:
+        for handler in list(root.handlers):
+            if isinstance(handler, logging.handlers.RotatingFileHandler):
+                root.removeHandler(handler)
+                root.addHandler(_process_file_handler(handler, task_id))
+        return
+
+    handlers = []
+    for handler in _LISTENER.handlers:
+        if isinstance(handler, logging.handlers.RotatingFileHandler):
+            handler = _process_file_handler(handler, task_id)
+        else:
+            # The lock may have been held by the parent's writer thread.
+            handler.createLock()
+        handlers.append(handler)
+
+    _QUEUE_HANDLER.queue = queue.Queue(LOG_QUEUE_SIZE)
+    _start_listener(handlers)
+
+
+def stop():
+    '''
+    Writes the queued records and stops the background writer, if any.
+    '''
+    global _LISTENER  # pylint: disable=global-statement
+    if _LISTENER is not None:
+        _LISTENER.stop()
+        _LISTENER = None
+
+
+def dropped():
+    '''
+    Returns the number of log records dropped because the queue was full.
+    '''
+    return _QUEUE_HANDLER.dropped if _QUEUE_HANDLER is not None else 0
+
+
+def context(trace=None, **fields):
+    '''
+    Returns the ``extra`` dictionary for a log call about an event, so JSON
+    records can be correlated with the event and its trace.
+
+    trace
+        The ``tamarack.tracing.Trace`` of the event. Optional. Its delivery
+        ID, event type and action are included.
+
+    fields
+        Other context fields, such as ``pr``.
+    '''
+    if trace is not None:
+        fields.setdefault('delivery_id', trace.delivery_id)
+        fields.setdefault('event', trace.event)
+        fields.setdefault('action', trace.action)
+    return fields
+
+
+def summarize(items, limit=None):
+    '''
+    Returns a string listing at most ``limit`` items, followed by the number
+    of items left out, to keep log records of large pull requests small.
+
+    items
+        The list of items to log.
+
+    limit
+        The maximum number of items to list. Defaults to ``LOG_ITEMS_MAX``.
+    '''
+    limit = LOG_ITEMS_MAX if limit is None else limit
+    text = ', '.join(str(item) for item in items[:limit])
+    if len(items) > limit:
+        text += ' ... and {0} more'.format(len(items) - limit)
+    return text
+
+
+def _start_listener(handlers):
+    global _LISTENER  # pylint: disable=global-statement
+    _LISTENER = logging.handlers.QueueListener(
+        _QUEUE_HANDLER.queue, *handlers, respect_handler_level=True
+    )
+    _LISTENER.start()
+
+
+def _process_file_handler(handler, task_id):
+    '''
+    Helper function that returns a copy of a rotating file handler writing to
+    the log file of a server process.
+    '''
+    root, ext = os.path.splitext(handler.baseFilename)
+    new_handler = logging.handlers.RotatingFileHandler(
+        '{0}.{1}{2}'.format(root, task_id, ext), maxBytes=handler.maxBytes,
+        backupCount=handler.backupCount, delay=True
+    )
+    new_handler.setFormatter(handler.formatter)
+    new_handler.setLevel(handler.level)
+    handler.createLock()
+    handler.close()
+    return new_handler
@@ -0,0 +1,221 @@
+# -*- coding: utf-8 -*-
+'''
+In-process metrics, exposed in the Prometheus text format on ``/metrics``.
+
+Counters and histograms are plain Python objects updated from the IOLoop
+thread, so recording a sample is a dictionary lookup and a few additions,
+without locks. Histograms have fixed buckets. State owned by other objects,
+such as the work queue depth or the remaining GitHub quota, is read when the
+metrics are scraped instead of being recorded as it changes.
+'''
+
+# Import Python libs
+import bisect
+import collections
+
+# Latency buckets, in seconds.
+DEFAULT_BUCKETS = (0.001, 0.0025, 0.005, 0.01, 0.025, 0.05, 0.1, 0.25, 0.5,
+                   1.0, 2.5, 5.0, 10.0, 30.0)
+
+CONTENT_TYPE = 'text/plain; version=0.0.4; charset=utf-8'
+
+
+class Counter:
+    '''
+    A monotonically increasing count, per combination of label values.
+
+    name
+        The metric name.
+
+    help_text
+        The description of the metric.
+
+    labels
+        The names of the labels. Optional.
+    '''
+    kind = 'counter'
+
+    def __init__(self, name, help_text, labels=()):
+        self.name = name
+        self.help_text = help_text
+        self.labels = tuple(labels)
+        self._values = collections.defaultdict(float)
+
+    def inc(self, *label_values, amount=1):
+        '''
+        Increments the count for the given label values.
+        '''
+        self._values[label_values] += amount
+
+    def samples(self):
+        '''
+        Yields the ``(name, labels, value)`` samples of the metric.
+        '''
+        for label_values, value in sorted(self._values.items()):
+            yield self.name, dict(zip(self.labels, label_values)), value
+
+
+class Histogram:
+    '''
+    Counts observations in fixed buckets, per combination of label values.
+
+    name
+        The metric name.
+
+    help_text
+        The description of the metric.
+
+    labels
+        The names of the labels. Optional.
+
+    buckets
+        The upper bounds of the buckets. Defaults to ``DEFAULT_BUCKETS``.
+    '''
+    kind = 'histogram'
+
+    def __init__(self, name, help_text, labels=(), buckets=DEFAULT_BUCKETS):
+        self.name = name
+        self.help_text = help_text
+        self.labels = tuple(labels)
+        self.buckets = tuple(sorted(buckets))
+        self._values = {}
+
+    def observe(self, value, *label_values):
+        '''
+        Records an observation for the given label values.
+        '''
+        state = self._values.get(label_values)
+        if state is None:
+            # Bucket counts, followed by the sum and the count.
+            state = self._values[label_values] = [0] * (len(self.buckets) + 1) + [0.0]
+        state[bisect.bisect_left(self.buckets, value)] += 1
+        state[-1] += value
+
+    def samples(self):
+        '''
+        Yields the ``(name, labels, value)`` samples of the metric: the
+        cumulative bucket counts, the sum and the count.
+        '''
+        for label_values, state in sorted(self._values.items()):
+            labels = dict(zip(self.labels, label_values))
+            total = 0
+            for bound, count in zip(self.buckets, state):
+                total += count
+                yield self.name + '_bucket', dict(labels, le=_format(bound)), total
+            total += state[len(self.buckets)]
+            yield self.name + '_bucket', dict(labels, le='+Inf'), total
+            yield self.name + '_sum', labels, state[-1]
+            yield self.name + '_count', labels, total
+
+
+class Registry:
+    '''
+    The set of recorded metrics.
+    '''
+
+    def __init__(self):
+        self.metrics = []
+
+    def counter(self, name, help_text, labels=()):
+        '''
+        Creates and registers a ``Counter``.
+        '''
+        return self._register(Counter(name, help_text, labels))
+
+    def histogram(self, name, help_text, labels=(), buckets=DEFAULT_BUCKETS):
+        '''
+        Creates and registers a ``Histogram``.
+        '''
+        return self._register(Histogram(name, help_text, labels, buckets))
+
+    def _register(self, metric):
+        self.metrics.append(metric)
+        return metric
+
+    def render(self):
+        '''
+        Returns the recorded metrics in the Prometheus text format.
+        '''
+        lines = []
+        for metric in self.metrics:
+            lines.extend(render_metric(metric.name, metric.kind, metric.help_text,
+                                       metric.samples()))
+        return '\n'.join(lines) + '\n'
+
+
+REGISTRY = Registry()
+
+WEBHOOK_REQUEST_SECONDS = REGISTRY.histogram(
+    'tamarack_webhook_request_seconds',
+    'Time spent receiving and answering webhook requests.',
+    ('event', 'status')
+)
+EVENT_PROCESSING_SECONDS = REGISTRY.histogram(
+    'tamarack_event_processing_seconds',
+    'Time spent processing queued webhook events.',
+    ('event', 'action')
+)
+GITHUB_REQUEST_SECONDS = REGISTRY.histogram(
+    'tamarack_github_request_seconds',
+    'Latency of GitHub API requests.',
+    ('method', 'endpoint', 'status')
+)
+SLACK_REQUEST_SECONDS = REGISTRY.histogram(
+    'tamarack_slack_request_seconds',
+    'Latency of Slack webhook requests.',
+    ('status',)
+)
+REVIEW_REQUESTS = REGISTRY.counter(
+    'tamarack_review_requests_total',
+    'Reviewer assignments, by whether a review request was sent or skipped '
+    'because every code owner was already requested or had reviewed.',
+    ('result',)
+)
+OWNERS_MATCH_SECONDS = REGISTRY.histogram(
+    'tamarack_owners_match_seconds',
+    'Time spent matching a page of changed files against CODEOWNERS.',
+    ('mode',)
+)
+
+
+def render_metric(name, kind, help_text, samples):
+    '''
+    Returns the lines of one metric in the Prometheus text format.
+
+    name
+        The metric name.
+
+    kind
+        The metric type: ``counter``, ``gauge`` or ``histogram``.
+
+    help_text
+        The description of the metric.
+
+    samples
+        An iterable of ``(name, labels, value)`` samples.
+    '''
+    lines = ['# HELP {0} {1}'.format(name, help_text),
+             '# TYPE {0} {1}'.format(name, kind)]
+    for sample_name, labels, value in samples:
+        if labels:
+            label_text = ','.join('{0}="{1}"'.format(key, _escape(val))
+                                  for key, val in labels.items())
+            sample_name = '{0}{{{1}}}'.format(sample_name, label_text)
+        lines.append('{0} {1}'.format(sample_name, _format(value)))
+    return lines
+
+
+def _escape(value):
+    '''
+    Helper function that escapes a label value.
+    '''
+    return str(value).replace('\\', r'\\').replace('"', r'\"').replace('\n', r'\n')
+
+
+def _format(value):
+    '''
+    Helper function that formats a sample value or bucket bound.
+    '''
+    if isinstance(value, float) and value.is_integer():
+        return str(int(value))
+    return repr(value) if isinstance(value, float) else str(value)
@@ -0,0 +1,297 @@
+# -*- coding: utf-8 -*-
+'''
+Lists the changed files of large pull requests from local git mirrors.
+
+The GitHub API lists the changed files of a pull request 100 at a time, so a
+pull request of thousands of files takes dozens of requests, and GitHub stops
+listing after 3000 files. With ``GIT_MIRROR_DIR`` set, Tamarack keeps a bare
+mirror of each repository it serves in that directory instead. For a pull
+request of at least ``GIT_MIRROR_THRESHOLD`` changed files, only the pull
+request's head and base refs are fetched into the mirror, skipping the fetch
+if both commits are already there, and the changed files are listed with
+``git diff --name-only`` against the merge base. The CODEOWNERS file is read
+from the base commit in the mirror's object store.
+
+The first fetch into a mirror downloads the history of the base branch; later
+fetches only download new objects. Git runs in subprocesses, so the IOLoop is
+not blocked. Like the GitHub API, git detects renames and lists only the new
+path of a renamed file. Git stops detecting renames in diffs with more than
+``diff.renameLimit`` candidate files, and then lists both paths.
+
+The GitHub token is passed to git through ``GIT_CONFIG_COUNT``, which needs
+git 2.31 or later. Older versions fetch without the token, so fetching a
+private repository fails and the pull request falls back to the API.
+'''
+
+# Import Python libs
+import base64
+import logging
+import os
+import re
+import subprocess
+
+# Import Tornado libs
+from tornado import gen
+import tornado.locks
+import tornado.process
+
+LOG = logging.getLogger(__name__)
+
+GIT_MIRROR_DIR = os.environ.get('GIT_MIRROR_DIR')
+GIT_MIRROR_THRESHOLD = int(os.environ.get('GIT_MIRROR_THRESHOLD', 300))
+GIT_BINARY = os.environ.get('GIT_BINARY', 'git')
+
+# Git must never wait for a password on the terminal.
+GIT_ENV = dict(os.environ, GIT_TERMINAL_PROMPT='0')
+
+# The first git version reading its configuration from GIT_CONFIG_COUNT.
+GIT_CONFIG_ENV_VERSION = (2, 31)
+
+_MIRRORS = {}
+_GIT_VERSION = None
+
+
+class Mirror:
+    '''
+    A bare git mirror of one repository. Fetches into the mirror are
+    serialized; reads run concurrently.
+
+    path
+        The directory of the bare repository. It is created on first use.
+
+    url
+        The url to fetch from: the repository's ``clone_url``, or a local path.
+    '''
+
+    def __init__(self, path, url):
+        self.path = path
+        self.url = url
+        self.fetches = 0
+        self._lock = tornado.locks.Lock()
+
+    @gen.coroutine
+    def update(self, refspecs, commits=(), token=None):
+        '''
+        Fetches refs into the mirror, unless every one of the given commits is
+        in it already. Creates the mirror if it does not exist yet.
+
+        refspecs
+            The refspecs to fetch, such as
+            ``+refs/pull/1/head:refs/pull/1/head``.
+
+        commits
+            The SHAs of the commits needed. Optional. If empty, the refs are
+            always fetched.
+
+        token
+            GitHub token to authenticate an ``https`` fetch with. Optional.
+        '''
+        with (yield self._lock.acquire()):
+            if not os.path.isdir(self.path):
+                LOG.info('Creating git mirror %s of %s.', self.path, self.url)
+                yield run_git(['init', '--bare', '--quiet', self.path])
+            elif commits:
+                missing = yield self.missing(commits)
+                if not missing:
+                    return
+
+            # The token is passed in the environment, so it is neither stored in
+            # the mirror's config nor shown in the command line.
+            env = None
+            if token and self.url.startswith('https://'):
+                version = yield git_version()
+                if version >= GIT_CONFIG_ENV_VERSION:
+                    credentials = base64.b64encode(
+                        'x-access-token:{0}'.format(token).encode('utf-8')
+                    ).decode('ascii')
+                    env = {'GIT_CONFIG_COUNT': '1',
+                           'GIT_CONFIG_KEY_0': 'http.extraHeader',
+                           'GIT_CONFIG_VALUE_0': 'Authorization: Basic ' + credentials}
+                else:
+                    LOG.warning('git %s cannot take the GitHub token from the environment '
+                                '(2.31 or later is needed). Fetching %s without it.',
+                                '.'.join(str(part) for part in version), self.url)
+            yield run_git(['fetch', '--quiet', '--no-tags', self.url] + list(refspecs),
+                          cwd=self.path, env=env)
+            self.fetches += 1
+
+    @gen.coroutine
+    def missing(self, commits):
+        '''
+        Returns the commits of the given list that are not in the mirror.
+
+        commits
+            The SHAs of the commits.
+        '''
+        batch = ''.join('{0}^{{commit}}\n'.format(sha) for sha in commits)
+        output = yield run_git(['cat-file', '--batch-check'], cwd=self.path,
+                               stdin=batch.encode('utf-8'))
+        return [sha for sha, line in zip(commits, output.decode('utf-8').splitlines())
+                if line.endswith(' missing')]
+
+    @gen.coroutine
+    def changed_files(self, base, head):
+        '''
+        Returns the paths changed between the merge base of two commits and
+        the second commit, like the files of a pull request. A renamed file is
+        listed by its new path.
+
+        base
+            The base commit or ref.
+
+        head
+            The head commit or ref.
+        '''
+        output = yield run_git(
+            ['diff', '--name-only', '-z', '--find-renames', '{0}...{1}'.format(base, head)],
+            cwd=self.path
+        )
+        return [path for path in output.decode('utf-8').split('\0') if path]
+
+    @gen.coroutine
+    def read_file(self, rev, path):
+        '''
+        Returns the blob SHA and the text of a file at a commit, or
+        ``(None, None)`` if the file does not exist there.
+
+        rev
+            The commit or ref.
+
+        path
+            The path of the file.
+        '''
+        output = yield run_git(['cat-file', '--batch'], cwd=self.path,
+                               stdin='{0}:{1}\n'.format(rev, path).encode('utf-8'))
+        header, _, contents = output.partition(b'\n')
+        fields = header.decode('utf-8').split()
+        if len(fields) != 3 or fields[1] != 'blob':
+            return None, None
+        return fields[0], contents[:int(fields[2])].decode('utf-8')
+
+
+def get_mirror(full_name, url, directory=None):
+    '''
+    Returns the ``Mirror`` of a repository.
+
+    full_name
+        The repository, as ``owner/name``.
+
+    url
+        The url to fetch from.
+
+    directory
+        The directory mirrors are kept in. Defaults to ``GIT_MIRROR_DIR``.
+    '''
+    path = os.path.join(directory or GIT_MIRROR_DIR, full_name + '.git')
+    mirror = _MIRRORS.get(path)
+    if mirror is None or mirror.url != url:
+        mirror = _MIRRORS[path] = Mirror(path, url)
+    return mirror
+
+
+def use_mirror(event_data):
+    '''
+    Returns ``True`` if the changed files of a pull request should be listed
+    from a mirror: ``GIT_MIRROR_DIR`` is set, the repository has a
+    ``clone_url`` to fetch from, and the pull request changes at least
+    ``GIT_MIRROR_THRESHOLD`` files.
+
+    event_data
+        Payload sent from GitHub.
+    '''
+    if not GIT_MIRROR_DIR or not event_data.get('repository', {}).get('clone_url'):
+        return False
+    changed_files = event_data.get('pull_request', {}).get('changed_files') or 0
+    return changed_files >= GIT_MIRROR_THRESHOLD
+
+
+@gen.coroutine
+def get_pull_request_data(event_data, token, owners_path, directory=None):
+    '''
+    Updates the mirror of a pull request's repository and returns the
+    pull request's changed files and the blob SHA and text of its CODEOWNERS
+    file at the base commit, as a ``(files, owners_sha, owners_text)`` tuple.
+
+    event_data
+        Payload sent from GitHub.
+
+    token
+        GitHub user token.
+
+    owners_path
+        The path of the CODEOWNERS file in the repository.
+
+    directory
+        The directory mirrors are kept in. Defaults to ``GIT_MIRROR_DIR``.
+    '''
+    repository = event_data.get('repository', {})
+    pull_req_data = event_data.get('pull_request', {})
+    base = pull_req_data.get('base', {})
+    base_sha = base.get('sha')
+    head_sha = pull_req_data.get('head', {}).get('sha')
+    head_ref = 'refs/pull/{0}/head'.format(event_data.get('number'))
+    base_ref = 'refs/heads/{0}'.format(base.get('ref'))
+
+    mirror = get_mirror(repository.get('full_name'), repository.get('clone_url'), directory)
+    yield mirror.update(
+        ['+{0}:{0}'.format(head_ref), '+{0}:{0}'.format(base_ref)],
+        commits=(base_sha, head_sha) if base_sha and head_sha else (),
+        token=token
+    )
+
+    files, (owners_sha, owners_text) = yield [
+        mirror.changed_files(base_sha or base_ref, head_sha or head_ref),
+        mirror.read_file(base_sha or base_ref, owners_path),
+    ]
+    return files, owners_sha, owners_text
+
+
+@gen.coroutine
+def git_version():
+    '''
+    Returns the version of git as a tuple of integers, such as ``(2, 39)``.
+    Git is only asked once.
+    '''
+    global _GIT_VERSION  # pylint: disable=global-statement
+    if _GIT_VERSION is None:
+        output = yield run_git(['--version'])
+        match = re.search(r'(\d+)\.(\d+)', output.decode('utf-8'))
+        _GIT_VERSION = (int(match.group(1)), int(match.group(2))) if match else (0, 0)
+    return _GIT_VERSION
+
+
+@gen.coroutine
+def run_git(args, cwd=None, stdin=None, env=None):
+    '''
+    Runs git in a subprocess without blocking the IOLoop and returns its
+    output. Raises ``subprocess.CalledProcessError`` if git fails.
+
+    args
+        The arguments to git.
+
+    cwd
+        The directory to run git in. Optional.
+
+    stdin
+        Bytes to write to the standard input of git. Optional.
+
+    env
+        Environment variables to set for git, in addition to ``GIT_ENV``.
+        Optional.
+    '''
+    cmd = [GIT_BINARY] + args
+    proc = tornado.process.Subprocess(
+        cmd, cwd=cwd, env=dict(GIT_ENV, **env) if env else GIT_ENV,
+        stdin=tornado.process.Subprocess.STREAM if stdin is not None else subprocess.DEVNULL,
+        stdout=tornado.process.Subprocess.STREAM,
+        stderr=tornado.process.Subprocess.STREAM
+    )
+    if stdin is not None:
+        yield proc.stdin.write(stdin)
+        proc.stdin.close()
+    output, errors = yield [proc.stdout.read_until_close(),
+                            proc.stderr.read_until_close()]
+    returncode = yield proc.wait_for_exit(raise_error=False)
+    if returncode != 0:
+        raise subprocess.CalledProcessError(returncode, cmd, output, errors)
+    return output
@@ -0,0 +1,97 @@
+# -*- coding: utf-8 -*-
+'''
+Measures how long the IOLoop is blocked.
+
+A coroutine asks the IOLoop to wake it up every ``interval`` seconds. The time
+it wakes up late is the lag: how long callbacks that were ready to run had to
+wait, for example because a handler was busy with CPU-heavy work.
+'''
+
+# pylint: disable=duplicate-code
+# Import Python libs
+import logging
+import os
+import time
+
+# Import Tornado libs
+from tornado import gen
+import tornado.ioloop
+
+LOG = logging.getLogger(__name__)
+
+LOOP_LAG_INTERVAL = float(os.environ.get('LOOP_LAG_INTERVAL', 0.5))
+LOOP_LAG_WARN = float(os.environ.get('LOOP_LAG_WARN', 0.1))
+
+
+class LagMonitor:  # pylint: disable=too-many-instance-attributes
+    '''
+    Samples the lag of the current IOLoop.
+
+    interval
+        The number of seconds between samples. Defaults to
+        ``LOOP_LAG_INTERVAL``.
+
+    warn
+        A lag, in seconds, above which a warning is logged. Defaults to
+        ``LOOP_LAG_WARN``.
+
+    timer
+        The function used to get the current time. Defaults to
+        ``time.monotonic``.
+    '''
+
+    def __init__(self, interval=None, warn=None, timer=time.monotonic):
+        self.interval = LOOP_LAG_INTERVAL if interval is None else interval
+        self.warn = LOOP_LAG_WARN if warn is None else warn
+        self.timer = timer
+        self.samples = 0
+        self.last_lag = 0.0
+        self.total_lag = 0.0
+        self.max_lag = 0.0
+        self._started = False
+
+    def start(self):
+        '''
+        Starts sampling on the current IOLoop.
+        '''
+        if self._started:
+            return
+        self._started = True
+        tornado.ioloop.IOLoop.current().spawn_callback(self._run)
+
+    def record(self, lag):
+        '''
+        Records a lag sample.
+
+        lag
+            The lag, in seconds.
+        '''
+        lag = max(lag, 0.0)
+        self.samples += 1
+        self.last_lag = lag
+        self.total_lag += lag
+        self.max_lag = max(self.max_lag, lag)
+        if lag > self.warn:
+            LOG.warning('The IOLoop was blocked for %.3f seconds.', lag)
+
+    def stats(self):
+        '''
+        Returns a dictionary with the last, mean and maximum lag, in seconds.
+        '''
+        mean_lag = 0.0
+        if self.samples:
+            mean_lag = self.total_lag / self.samples
+        return {'samples': self.samples,
+                'last_lag': self.last_lag,
+                'mean_lag': mean_lag,
+                'max_lag': self.max_lag}
+
+    @gen.coroutine
+    def _run(self):
+        '''
+        Sampling coroutine. Runs forever.
+        '''
+        while True:
+            start = self.timer()
+            yield gen.sleep(self.interval)
+            self.record(self.timer() - start - self.interval)
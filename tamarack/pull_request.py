@@ -5,61 +5,149 @@ Handles common Pull Request tasks.
 
 # Import Python libs
 import base64
-import fnmatch
+import collections
+import json
 import logging
+import os
+import subprocess
+import time
 
 # Import Tornado libs
 from tornado import gen
+import tornado.httpclient
 import tornado.web
 
 # Import Tamarack libs
+import tamarack.auth
+import tamarack.cache
+import tamarack.codeowners
+import tamarack.executor
 import tamarack.github
+import tamarack.logs
+import tamarack.metrics
+import tamarack.mirror
+import tamarack.tracing
 
 LOG = logging.getLogger(__name__)
 
+# CODEOWNERS files are cached per repository and branch. Entries younger than
+# OWNERS_CACHE_FRESH seconds are used as-is, older entries are revalidated with
+# their ETag. Entries are evicted after OWNERS_CACHE_TTL seconds or when more
+# than OWNERS_CACHE_SIZE files are cached. Entries are stored without their
+# compiled rules, so they can be pickled into a shared cache; the rules are
+# compiled again from the contents, which compile_rules memoizes.
+OWNERS_CACHE_SIZE = int(os.environ.get('OWNERS_CACHE_SIZE', 64))
+OWNERS_CACHE_TTL = int(os.environ.get('OWNERS_CACHE_TTL', 3600))
+OWNERS_CACHE_FRESH = int(os.environ.get('OWNERS_CACHE_FRESH', 60))
+
+# Pages of files whose number of files times the number of CODEOWNERS rules is
+# at least OFFLOAD_THRESHOLD are matched in the tamarack.executor pool instead
+# of on the IOLoop.
+OFFLOAD_THRESHOLD = int(os.environ.get('OFFLOAD_THRESHOLD', 50000))
+
+# The CODEOWNERS files of the OWNERS_BRANCHES of the OWNERS_REPOSITORY
+# ("owner/name") are fetched when the server starts, and refreshed when a push
+# to one of them changes the file.
+OWNERS_REPOSITORY = os.environ.get('OWNERS_REPOSITORY')
+OWNERS_BRANCHES = [branch.strip() for branch in
+                   os.environ.get('OWNERS_BRANCHES', '').split(',') if branch.strip()]
+
+OWNERS_PATH = '.github/CODEOWNERS'
+
+OwnersFile = collections.namedtuple(
+    'OwnersFile', ['sha', 'etag', 'contents', 'rules', 'checked']
+)
+OWNERS_CACHE = tamarack.cache.LRUCache(
+    maxsize=OWNERS_CACHE_SIZE, ttl=OWNERS_CACHE_TTL
+)
+
+
+def set_owners_cache(cache):
+    '''
+    Replaces the cache CODEOWNERS files are kept in, for example with a
+    ``tamarack.shared.SharedCache`` shared between server processes. The cache
+    must have the interface of ``tamarack.cache.LRUCache``.
+
+    cache
+        The new cache.
+    '''
+    global OWNERS_CACHE  # pylint: disable=global-statement
+    OWNERS_CACHE = cache
+
+
+# Concurrent lookups of the same CODEOWNERS file or the same pull request's
+# files share a single request to GitHub.
+IN_FLIGHT = tamarack.cache.SingleFlight()
+
 
 @gen.coroutine
-def assign_reviewers(event_data, token):
+def assign_reviewers(event_data, token, trace=None):
     '''
     Assigns reviewers on the pull request to the affiliated code owners. The code
     owners are determined by getting a list of files that were changed in the pull
     request and comparing the list to the entries defined in the CODEOWNERS file.
 
-    If no matches are found, nothing is done.
+    The changed files and the CODEOWNERS file are fetched with a single GraphQL
+    query, see ``tamarack.github.get_review_data``. If ``GITHUB_GRAPHQL`` is
+    turned off or the query fails, they are fetched from the REST API instead.
+    The files of large pull requests are listed from a local git mirror if
+    ``GIT_MIRROR_DIR`` is set, see ``tamarack.mirror``.
+
+    Only the code owners who are not requested yet and have not reviewed the
+    pull request are requested, leaving out its author and email owners. If
+    no matches are found, or every code owner is already requested, nothing
+    is done, so processing a pull request again costs no write request.
 
     event_data
         Payload sent from GitHub.
 
     token
         GitHub user token.
+
+    trace
+        The ``tamarack.tracing.Trace`` to record the stages on. Optional.
     '''
     pr_num = event_data.get('number', 'unknown')
-
-    files = yield get_pr_file_names(event_data, token)
-    owners_contents = yield get_owners_file_contents(
-        event_data, token
-    )
-
-    reviewers = _get_code_owners(files, owners_contents)
+    log_context = tamarack.logs.context(trace, pr=pr_num)
+
+    review_data = None
+    if tamarack.mirror.use_mirror(event_data):
+        try:
+            review_data = yield _find_reviewers_mirror(event_data, token, trace=trace)
+        except (OSError, subprocess.CalledProcessError, tornado.web.HTTPError) as err:
+            LOG.warning('PR #%s: Listing files from the git mirror failed, falling back '
+                        'to the GitHub API: %s', pr_num, err, extra=log_context)
+    if review_data is None and tamarack.github.GITHUB_GRAPHQL and token:
+        try:
+            review_data = yield _find_reviewers_graphql(event_data, token, trace=trace)
+        except (tornado.httpclient.HTTPError, tornado.web.HTTPError) as err:
+            LOG.warning('PR #%s: GraphQL query failed, falling back to the REST API: %s',
+                        pr_num, err, extra=log_context)
+    if review_data is None:
+        review_data = yield _find_reviewers_rest(event_data, token, trace=trace)
+    reviewers, num_files, current = review_data
+
+    LOG.info('PR #%s: Matched %s changed files against CODEOWNERS.',
+             pr_num, num_files, extra=log_context)
     if not reviewers:
         LOG.info('PR #%s: No code owners were found, no reviewers requested.',
-                 pr_num)
+                 pr_num, extra=log_context)
         return
 
-    url = _get_url(event_data, 'pull_request')
-    url += '/requested_reviewers'
+    pr_owner = _get_pr_owner(event_data)
+    individuals, teams = _missing_reviewers(reviewers, pr_owner, current or [])
+    if current is None and (individuals or teams):
+        current = yield _get_current_reviewers(event_data, token, trace=trace)
+        individuals, teams = _missing_reviewers(reviewers, pr_owner, current)
 
-    if not isinstance(reviewers, list):
-        reviewers = [reviewers]
+    if not individuals and not teams:
+        LOG.info('PR #%s: No code owners left to request, no reviewers requested.',
+                 pr_num, extra=log_context)
+        tamarack.metrics.REVIEW_REQUESTS.inc('skipped')
+        return
 
-    teams = []
-    individuals = []
-    for reviewer in reviewers:
-        if '/' in reviewer:
-            _, team = str(reviewer).split('/')
-            teams.append(team)
-        else:
-            individuals.append(reviewer)
+    url = _get_url(event_data, 'pull_request')
+    url += '/requested_reviewers'
 
     post_data = {}
     if individuals:
@@ -68,13 +156,15 @@ def assign_reviewers(event_data, token):
         post_data['team_reviewers'] = teams
 
     LOG.info('PR #%s: Requesting reviewers %s.',
-             pr_num, reviewers)
+             pr_num, tamarack.logs.summarize(individuals + teams), extra=log_context)
+    tamarack.metrics.REVIEW_REQUESTS.inc('sent')
 
     yield tamarack.github.api_request(
         url,
         token,
         method='POST',
-        post_data=post_data
+        post_data=post_data,
+        trace=trace
     )
 
 
@@ -94,28 +184,135 @@ def get_owners_file_contents(event_data, token, branch=None):
         Optional. If not provided, the base branch of the Pull Request
         will be used.
     '''
-    url = _get_url(event_data, 'repository')
-    url += '/contents/.github/CODEOWNERS'
+    owners_file = yield get_owners_file(event_data, token, branch=branch)
+    return owners_file.contents
 
-    if branch is None:
-        pull_req_data = event_data.get('pull_request', {})
-        if pull_req_data:
-            branch = pull_req_data.get('base', {}).get('ref')
 
-    if branch:
-        url += '?ref={0}'.format(branch)
+@gen.coroutine
+def get_owners_file(event_data, token, branch=None, trace=None):
+    '''
+    Returns the CODEOWNERS file as an ``OwnersFile`` tuple holding the blob SHA,
+    the ETag, the decoded contents and the compiled ownership rules.
+
+    The file is cached per repository and branch. A cached file is returned
+    without contacting GitHub for ``OWNERS_CACHE_FRESH`` seconds, after which
+    it is revalidated with an ``If-None-Match`` request. GitHub answers that
+    with a ``304 Not Modified`` if the file has not changed.
+
+    event_data
+        Payload sent from GitHub.
+
+    token
+        GitHub user token.
+
+    branch
+        The name of the branch the CODEOWNERS file should be pulled from.
+        Optional. If not provided, the base branch of the Pull Request
+        will be used.
+
+    trace
+        The ``tamarack.tracing.Trace`` to record the lookup on. Optional.
+    '''
+    pr_num = event_data.get('number', 'unknown')
+    url = _owners_url(event_data, branch)
+    owners_file = yield IN_FLIGHT.run(
+        ('owners', url), _fetch_owners_file, url, token, pr_num, trace
+    )
+    return owners_file
+
+
+@gen.coroutine
+def refresh_owners_file(repo_url, branch, token, trace=None):
+    '''
+    Fetches the CODEOWNERS file of a branch again, compiles its rules and
+    caches it, so the next pull request against the branch finds it cached.
+    A file that no longer exists is removed from the cache.
+
+    repo_url
+        The API url of the repository.
+
+    branch
+        The name of the branch.
 
-    LOG.info('PR #%s: Fetching CODEOWNERS file.',
-             event_data.get('number', 'unknown'))
+    token
+        GitHub user token.
 
-    contents = yield tamarack.github.api_request(url, token)
-    return base64.b64decode(contents.get('content')).decode('utf-8')
+    trace
+        The ``tamarack.tracing.Trace`` to record the lookup on. Optional.
+    '''
+    url = _contents_url(repo_url, branch)
+    try:
+        owners_file = yield IN_FLIGHT.run(
+            ('refresh', url), _fetch_owners_file, url, token, None, trace, revalidate=True
+        )
+    except tornado.httpclient.HTTPError as err:
+        if err.code != 404:
+            raise
+        LOG.info('Branch \'%s\' has no CODEOWNERS file.', branch)
+        OWNERS_CACHE.pop(url)
+        return None
+    return owners_file
+
+
+@gen.coroutine
+def preload_owners_files(token, repository=None, branches=None, api_url=None):
+    '''
+    Fetches the CODEOWNERS files of several branches of a repository
+    concurrently, see ``refresh_owners_file``. Failures are logged.
+
+    token
+        GitHub user token.
+
+    repository
+        The repository, as ``owner/name``. Defaults to ``OWNERS_REPOSITORY``.
+
+    branches
+        The names of the branches. Defaults to ``OWNERS_BRANCHES``.
+
+    api_url
+        The base url of the GitHub API. Defaults to
+        ``tamarack.auth.GITHUB_API_URL``.
+    '''
+    repository = repository or OWNERS_REPOSITORY
+    branches = OWNERS_BRANCHES if branches is None else branches
+    if not repository or not branches:
+        return
+
+    repo_url = '{0}/repos/{1}'.format(api_url or tamarack.auth.GITHUB_API_URL, repository)
+    token = yield tamarack.auth.event_token({'repository': {'full_name': repository}}, token)
+    futures = [refresh_owners_file(repo_url, branch, token) for branch in branches]
+    loaded = 0
+    for branch, future in zip(branches, futures):
+        try:
+            owners_file = yield future
+        except Exception as err:  # pylint: disable=broad-except
+            LOG.error('Failed to preload the CODEOWNERS file of branch \'%s\': %s',
+                      branch, err)
+            continue
+        loaded += owners_file is not None
+    LOG.info('Preloaded %s of %s CODEOWNERS files of %s.', loaded, len(branches), repository)
+
+
+def is_owners_branch(repo_url, branch):
+    '''
+    Returns ``True`` if the CODEOWNERS file of a branch should be kept fresh:
+    the branch is one of the ``OWNERS_BRANCHES``, or its CODEOWNERS file is
+    cached.
+
+    repo_url
+        The API url of the repository.
+
+    branch
+        The name of the branch.
+    '''
+    return branch in OWNERS_BRANCHES or _contents_url(repo_url, branch) in OWNERS_CACHE
 
 
 @gen.coroutine
 def get_pr_file_names(event_data, token):
     '''
-    Returns the list of changed files for a pull request.
+    Returns the list of changed files for a pull request. All pages of the
+    listing are fetched.
 
     event_data
         Payload sent from GitHub.
@@ -125,18 +322,37 @@ def get_pr_file_names(event_data, token):
     '''
     pr_num = event_data.get('number', 'unknown')
     url = _get_url(event_data, 'pull_request')
-    url += '/files'
+    file_names = yield IN_FLIGHT.run(
+        ('files', url), _fetch_pr_file_names, event_data, token
+    )
 
-    LOG.info('PR #%s: Fetching Pull Request file names.', pr_num)
-    response = yield tamarack.github.api_request(url, token)
+    # Large pull requests have thousands of files, so only the first few are
+    # logged at INFO.
+    LOG.info('PR #%s: Found %s changed files: %s', pr_num, len(file_names),
+             tamarack.logs.summarize(file_names), extra={'pr': pr_num})
+    LOG.debug('PR #%s: The following file names were found: %s',
+              pr_num, file_names, extra={'pr': pr_num})
+    return file_names
 
-    file_names = []
-    for item in response:
-        file_names.append(item.get('filename'))
 
-    LOG.info('PR #%s: The following file names were found: %s',
-             pr_num, file_names)
-    return file_names
+def get_pr_file_pages(event_data, token, trace=None):
+    '''
+    Returns a ``tamarack.github.PageIterator`` over the pages of changed files
+    of a pull request. Each page is a list of file entries as returned by the
+    GitHub API.
+
+    event_data
+        Payload sent from GitHub.
+
+    token
+        GitHub user token.
+
+    trace
+        The ``tamarack.tracing.Trace`` to record the requests on. Optional.
+    '''
+    url = _get_url(event_data, 'pull_request')
+    url += '/files'
+    return tamarack.github.PageIterator(url, token, trace=trace)
 
 
 @gen.coroutine
@@ -166,42 +382,343 @@ def create_pr_comment(event_data, token, comment_txt):
     )
 
 
+@gen.coroutine
+def _find_reviewers_graphql(event_data, token, trace=None):
+    '''
+    Helper function that returns the code owners of a pull request's changed
+    files, the number of files, and the requested reviewers and users who have
+    reviewed, fetching all of them and the CODEOWNERS file in one GraphQL
+    query. The text of the CODEOWNERS file is only fetched if it
+    is not cached; a cached file is revalidated with the blob SHA the query
+    returns.
+    '''
+    pr_num = event_data.get('number', 'unknown')
+    url = _owners_url(event_data)
+    cached = _cached_owners_file(url)
+    base_ref = event_data.get('pull_request', {}).get('base', {}).get('ref')
+
+    review_data = yield IN_FLIGHT.run(
+        ('review', _get_url(event_data, 'pull_request'), cached is None),
+        tamarack.github.get_review_data,
+        _get_url(event_data, 'repository'), pr_num, base_ref, OWNERS_PATH, token,
+        with_text=cached is None, trace=trace
+    )
+
+    if review_data.owners_sha is None:
+        raise tornado.web.HTTPError(
+            500, 'PR #%s: CODEOWNERS file could not be found.', pr_num
+        )
+    if cached is not None and cached.sha == review_data.owners_sha:
+        owners_file = cached._replace(checked=time.time())
+        if trace is not None:
+            trace.add('owners.cache', trace.timer(), 0, status='revalidated')
+    elif review_data.owners_text is None or review_data.owners_truncated:
+        owners_file = yield _fetch_owners_file(url, token, pr_num, trace, revalidate=True)
+    else:
+        with tamarack.tracing.span(trace, 'owners.decode', reused=False):
+            owners_file = OwnersFile(
+                sha=review_data.owners_sha,
+                etag=None,
+                contents=review_data.owners_text,
+                rules=tamarack.codeowners.compile_rules(review_data.owners_text),
+                checked=time.time()
+            )
+    OWNERS_CACHE.set(url, owners_file._replace(rules=None))
+
+    matches = yield _match_code_owners(review_data.files, owners_file, trace=trace)
+    current = review_data.requested_reviewers + review_data.reviewed_by
+    return matches, len(review_data.files), current
+
+
+@gen.coroutine
+def _find_reviewers_mirror(event_data, token, trace=None):
+    '''
+    Helper function that returns the code owners of a pull request's changed
+    files and the number of files, listing the files and reading the
+    CODEOWNERS file from a local git mirror. The current reviewers are
+    returned as ``None``, see ``_find_reviewers_rest``.
+    '''
+    pr_num = event_data.get('number', 'unknown')
+    with tamarack.tracing.span(trace, 'mirror'):
+        files, owners_sha, owners_text = yield tamarack.mirror.get_pull_request_data(
+            event_data, token, OWNERS_PATH
+        )
+    if owners_sha is None:
+        raise tornado.web.HTTPError(
+            500, 'PR #%s: CODEOWNERS file could not be found.', pr_num
+        )
+
+    url = _owners_url(event_data)
+    cached = _cached_owners_file(url)
+    if cached is not None and cached.sha == owners_sha:
+        owners_file = cached
+    else:
+        with tamarack.tracing.span(trace, 'owners.decode', reused=False):
+            owners_file = OwnersFile(
+                sha=owners_sha,
+                etag=None,
+                contents=owners_text,
+                rules=tamarack.codeowners.compile_rules(owners_text),
+                checked=time.time()
+            )
+        OWNERS_CACHE.set(url, owners_file._replace(rules=None))
+
+    LOG.info('PR #%s: Listed %s changed files from the git mirror.', pr_num, len(files))
+    matches = yield _match_code_owners(files, owners_file, trace=trace)
+    return matches, len(files), None
+
+
+@gen.coroutine
+def _find_reviewers_rest(event_data, token, trace=None):
+    '''
+    Helper function that returns the code owners of a pull request's changed
+    files and the number of files, fetching them from the REST API. The current
+    reviewers are returned as ``None``; they are only fetched, with
+    ``_get_current_reviewers``, if there are code owners to request.
+    '''
+    # Start fetching the CODEOWNERS file while the first page of changed files
+    # is requested, then match each page of files as soon as it arrives.
+    owners_future = get_owners_file(event_data, token, trace=trace)
+    pages = get_pr_file_pages(event_data, token, trace=trace)
+    page_future = pages.next()
+    with tamarack.tracing.span(trace, 'owners.wait'):
+        owners_file = yield owners_future
+
+    reviewers = []
+    num_files = 0
+    while page_future is not None:
+        with tamarack.tracing.span(trace, 'files.wait'):
+            items = yield page_future
+        page_future = None if pages.done() else pages.next()
+
+        files = [item.get('filename') for item in items]
+        num_files += len(files)
+        matches = yield _match_code_owners(files, owners_file, trace=trace)
+        reviewers.extend(owner for owner in matches if owner not in reviewers)
+    return reviewers, num_files, None
+
+
+@gen.coroutine
+def _get_current_reviewers(event_data, token, trace=None):
+    '''
+    Helper function that returns the reviewers requested on a pull request,
+    as listed in the event, and the users who have reviewed it, fetched from
+    the REST API. Teams are given as ``org/team``; a team requested on a
+    repository belongs to the repository's organization.
+    '''
+    pull_req_data = event_data.get('pull_request', {})
+    org = (event_data.get('repository', {}).get('full_name') or '').split('/')[0]
+    current = [user.get('login') for user in pull_req_data.get('requested_reviewers') or []]
+    current.extend('{0}/{1}'.format(org, team['slug'])
+                   for team in pull_req_data.get('requested_teams') or [] if team.get('slug'))
+
+    pages = tamarack.github.PageIterator(
+        _get_url(event_data, 'pull_request') + '/reviews', token, trace=trace
+    )
+    while not pages.done():
+        for review in (yield pages.next()):
+            current.append((review.get('user') or {}).get('login'))
+    return [login for login in current if login]
+
+
+def _missing_reviewers(owners, pr_owner, current):
+    '''
+    Helper function that returns the users and the teams among the code owners
+    that should be requested to review a pull request, as two lists. The
+    ``@`` prefix is removed and teams are given by their slug.
+
+    The author of the pull request, owners given by email address, who cannot
+    be requested, and users and teams in ``current`` are left out.
+
+    owners
+        The code owners of the pull request's files.
+
+    pr_owner
+        The login of the author of the pull request.
+
+    current
+        The requested reviewers and the users who have reviewed. Teams are
+        given as ``org/team``; anything else is a user login.
+    '''
+    current_users = {login.lower() for login in current if '/' not in login}
+    current_teams = {login.split('/')[-1].lower() for login in current if '/' in login}
+    current_users.add(pr_owner.lower())
+
+    individuals = []
+    teams = []
+    for owner in owners:
+        owner = str(owner).lstrip('@')
+        if '/' in owner:
+            team = owner.split('/')[-1]
+            if team.lower() not in current_teams and team not in teams:
+                teams.append(team)
+        elif '@' not in owner and owner.lower() not in current_users \
+                and owner not in individuals:
+            individuals.append(owner)
+    return individuals, teams
+
+
+def _cached_owners_file(url):
+    '''
+    Helper function that returns the cached CODEOWNERS file at the given url
+    with its rules compiled, or ``None`` if it is not cached.
+    '''
+    cached = OWNERS_CACHE.get(url)
+    if cached is not None and cached.rules is None:
+        cached = cached._replace(
+            rules=tamarack.codeowners.compile_rules(cached.contents)
+        )
+    return cached
+
+
+@gen.coroutine
+def _fetch_owners_file(url, token, pr_num, trace=None, revalidate=False):
+    '''
+    Helper function that returns the CODEOWNERS file at the given url, from the
+    cache or from GitHub. See ``get_owners_file``. If ``revalidate`` is
+    ``True``, a cached file is revalidated even if it is fresh. ``pr_num`` is
+    ``None`` when no pull request asked for the file.
+    '''
+    prefix = '' if pr_num is None else 'PR #{0}: '.format(pr_num)
+    cached = _cached_owners_file(url)
+    if cached is not None and not revalidate and \
+            time.time() - cached.checked < OWNERS_CACHE_FRESH:
+        if trace is not None:
+            trace.add('owners.cache', trace.timer(), 0, status='fresh')
+        return cached
+
+    headers = dict(tamarack.github.DEFAULT_HEADERS)
+    if cached is not None and cached.etag:
+        headers['If-None-Match'] = cached.etag
+
+    LOG.info('%sFetching CODEOWNERS file %s.', prefix, url)
+    response = yield tamarack.github.fetch(url, token, headers=headers, trace=trace)
+
+    if response.code == 304:
+        LOG.info('%sCODEOWNERS file has not changed.', prefix)
+        owners_file = cached._replace(checked=time.time())
+        OWNERS_CACHE.set(url, owners_file._replace(rules=None))
+        return owners_file
+
+    with tamarack.tracing.span(trace, 'owners.decode') as attrs:
+        owners_file = _make_owners_file(response, cached)
+        attrs['reused'] = cached is not None and owners_file.sha == cached.sha
+    OWNERS_CACHE.set(url, owners_file._replace(rules=None))
+    return owners_file
+
+
+@gen.coroutine
+def _fetch_pr_file_names(event_data, token):
+    '''
+    Helper function that fetches every page of a pull request's changed files
+    and returns the file names in page order.
+    '''
+    pr_num = event_data.get('number', 'unknown')
+    pages = get_pr_file_pages(event_data, token)
+
+    LOG.info('PR #%s: Fetching Pull Request file names.', pr_num)
+    names_by_page = {}
+    while not pages.done():
+        items = yield pages.next()
+        names_by_page[pages.page] = [item.get('filename') for item in items]
+
+    file_names = []
+    for page in sorted(names_by_page):
+        file_names.extend(names_by_page[page])
+    return file_names
+
+
+@gen.coroutine
+def _match_code_owners(files, owners_file, trace=None):
+    '''
+    Helper function that returns the code owners matching a page of files,
+    like ``_get_code_owners``. Large matches are run in the ``tamarack.executor``
+    pool, small ones inline.
+
+    files
+        The list of pull request files to find owners for.
+
+    owners_file
+        The ``OwnersFile`` to match the files against.
+
+    trace
+        The ``tamarack.tracing.Trace`` to record the match on. Optional.
+    '''
+    start = time.monotonic()
+    mode = 'inline'
+    if len(files) * len(owners_file.rules) >= OFFLOAD_THRESHOLD:
+        mode = 'offloaded'
+
+    with tamarack.tracing.span(trace, 'owners.match', files=len(files), mode=mode):
+        if mode == 'inline':
+            matches = _get_code_owners(files, owners_file.rules)
+        else:
+            # The contents are passed rather than the rules, as they are cheaper
+            # to pickle for a process pool; compile_rules memoizes in every
+            # process.
+            matches = yield tamarack.executor.run(
+                _get_code_owners, files, owners_file.contents
+            )
+    tamarack.metrics.OWNERS_MATCH_SECONDS.observe(time.monotonic() - start, mode)
+    return matches
+
+
 def _get_code_owners(files, owners_contents):
     '''
-    Helper function that returns a list of code owners who should review a pull
-    request.
+    Helper function that returns the list of code owners who should review a
+    pull request, without duplicates. Each file is owned by the owners of the
+    last CODEOWNERS rule matching it.
 
     files
         The list of pull request files to find owners for.
 
     owners_contents
-        The contents of the CODEOWNERS file.
+        The contents of the CODEOWNERS file, or the rules already compiled
+        from it.
     '''
-    # Filter contents of the owners file. Ignore comments and blank lines.
-    entries = []
-    for line in owners_contents.splitlines():
-        if not line:
-            continue
-        elif line.startswith('#'):
-            continue
-        # define ownership entries as a list of tuples
-        file_name, owner = line.split()
-        entries.append((file_name, owner))
-
-    # Search through PR files to find ownership matches
-    matches = []
-    for entry in entries:
-        for item in files:
-            if fnmatch.fnmatch(item, entry[0]):
-                matches.append(entry[1])
-
-                # SUSE wants to review any PRs the Core team reviews.
-                # Instead of duplicating the CODEOWNERS file, handle
-                # this programmatically here - See Issue #14.
-                if 'team-core' in entry[1]:
-                    matches.append('@saltstack/team-suse')
+    rules = owners_contents
+    if not isinstance(rules, tamarack.codeowners.OwnersRules):
+        rules = tamarack.codeowners.compile_rules(owners_contents)
 
-    return matches
+    owners = rules.owners(files)
+
+    # SUSE wants to review any PRs the Core team reviews.
+    # Instead of duplicating the CODEOWNERS file, handle
+    # this programmatically here - See Issue #14.
+    if '@saltstack/team-suse' not in owners and \
+            any('team-core' in owner for owner in owners):
+        owners.append('@saltstack/team-suse')
+
+    return owners
+
+
+def _make_owners_file(response, cached=None):
+    '''
+    Helper function that builds an ``OwnersFile`` from a GitHub contents API
+    response. If the blob SHA matches the cached file, the cached contents and
+    rules are reused instead of decoding and compiling the file again.
+
+    response
+        The response of the contents API request.
+
+    cached
+        The previously cached ``OwnersFile``, if any.
+    '''
+    data = json.loads(response.body)
+    etag = response.headers.get('Etag')
+    sha = data.get('sha')
+
+    if cached is not None and sha and cached.sha == sha:
+        return cached._replace(etag=etag, checked=time.time())
+
+    contents = base64.b64decode(data.get('content')).decode('utf-8')
+    return OwnersFile(
+        sha=sha,
+        etag=etag,
+        contents=contents,
+        rules=tamarack.codeowners.compile_rules(contents),
+        checked=time.time()
+    )
 
 
 def _get_pr_owner(event_data):
@@ -221,6 +738,30 @@ def _get_pr_owner(event_data):
     return pr_owner
 
 
+def _owners_url(event_data, branch=None):
+    '''
+    Helper function that returns the contents API url of the CODEOWNERS file
+    on a branch, which is also its key in the ``OWNERS_CACHE``. See
+    ``get_owners_file``.
+    '''
+    if branch is None:
+        pull_req_data = event_data.get('pull_request', {})
+        if pull_req_data:
+            branch = pull_req_data.get('base', {}).get('ref')
+    return _contents_url(_get_url(event_data, 'repository'), branch)
+
+
+def _contents_url(repo_url, branch=None):
+    '''
+    Helper function that returns the contents API url of the CODEOWNERS file
+    of a repository, on a branch if one is given.
+    '''
+    url = repo_url + '/contents/' + OWNERS_PATH
+    if branch:
+        url += '?ref={0}'.format(branch)
+    return url
+
+
 def _get_url(event_data, url_type):
     '''
     Helper function to get a GitHub url based on the type provided.
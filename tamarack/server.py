@@ -2,61 +2,534 @@
 '''
 Main file that runs the tornado server for the bot.
 
-Requires the HOOK_SECRET_KEY and GITHUB_TOKEN environment variables to be set.
+Requires the HOOK_SECRET_KEY environment variable to be set, and either the
+GITHUB_TOKEN environment variable or a GitHub App, see ``tamarack.auth``.
 Optionally, set the PORT environment variable as well. Default is ``8080``.
+Set PROCESSES to run several server processes sharing the port; ``0`` starts
+one per CPU. Default is ``1``.
 
 Requires Python 3.6.
 '''
 
 # Import Python libs
+import collections
 import hmac
 import hashlib
-import json
 import logging
 import os
+import socket
 import sys
+import tempfile
+import time
+import uuid
 
 # Import Tornado libs
 from tornado import gen
+import tornado.httpserver
 import tornado.ioloop
+import tornado.netutil
+import tornado.process
+import tornado.queues
 import tornado.web
 import tornado.httpclient
 
 # Import Tamarack libs
+import tamarack.auth
+import tamarack.cache
+import tamarack.event
 import tamarack.event_processor
+import tamarack.http_client
+import tamarack.github
+import tamarack.journal
+import tamarack.logs
+import tamarack.metrics
+import tamarack.monitor
+import tamarack.pull_request
+import tamarack.shared
+import tamarack.slack
+import tamarack.tracing
+import tamarack.worker
 
 HOOK_SECRET_KEY = os.environ.get('HOOK_SECRET_KEY')
 GITHUB_TOKEN = os.environ.get('GITHUB_TOKEN')
 SLACK_WEBHOOK_URL = os.environ.get('SLACK_WEBHOOK_URL')
+WORK_QUEUE_SIZE = int(os.environ.get('WORK_QUEUE_SIZE', 1000))
+WORKERS = int(os.environ.get('WORKERS', 8))
+JOURNAL_DIR = os.environ.get('JOURNAL_DIR')
+DEDUP_WINDOW = int(os.environ.get('DEDUP_WINDOW', 86400))
+DEDUP_SIZE = int(os.environ.get('DEDUP_SIZE', 50000))
+MAX_BODY_SIZE = int(os.environ.get('MAX_BODY_SIZE', 25 * 1024 * 1024))
+PROCESSES = int(os.environ.get('PROCESSES', 1))
+SHARED_STORE = os.environ.get('SHARED_STORE')
+
+# Seconds during which processes starting together leave preloading the
+# CODEOWNERS files to the first one.
+PRELOAD_CLAIM_WINDOW = 60
 
 LOG = logging.getLogger(__name__)
 
 
+@tornado.web.stream_request_body
 class EventHandler(tornado.web.RequestHandler):
     '''
     Main handler for the "/events" endpoint
+
+    Events are verified and queued for the application's workers, and GitHub
+    gets a ``202 Accepted`` response right away. If the queue is full, the
+    event is rejected with a ``503 Service Unavailable`` so GitHub can
+    redeliver it later.
+
+    If the application has an event journal, events are written to it before
+    they are acknowledged.
+
+    GitHub redelivers webhooks that time out. Delivery IDs that were already
+    accepted are answered with a ``200 OK`` as soon as the headers arrive,
+    without reading the body.
+
+    The request body is streamed: each chunk is fed into the signature HMAC as
+    it arrives, and bodies larger than ``MAX_BODY_SIZE`` are rejected with a
+    ``413 Payload Too Large``. The body is only parsed once the signature has
+    been verified, into a compact ``tamarack.event.Event``. Event types that
+    Tamarack does not route are acknowledged without reading the body.
     '''
+    # pylint: disable=attribute-defined-outside-init
+
+    def initialize(self):
+        '''
+        Resets the state of the delivery being received.
+        '''
+        self.delivery_id = None
+        self.delivery_key = None
+        self.signature = None
+        self.mac = None
+        self.chunks = []
+        self.body_size = 0
+
+    def prepare(self):
+        deliveries = self.settings['deliveries']
+        self.delivery_id = self.request.headers.get('X-GitHub-Delivery')
+        self.delivery_key = _delivery_key(self.delivery_id)
+        if self.delivery_key is not None and self.delivery_key in deliveries:
+            LOG.info('Dropping duplicate delivery %s.', self.delivery_id)
+            self.finish('Duplicate delivery.')
+            return
+
+        event_name = self.request.headers.get('X-GitHub-Event')
+        if event_name and event_name not in tamarack.event.ROUTED_EVENTS:
+            LOG.debug('Ignoring \'%s\' event %s.', event_name, self.delivery_id)
+            self.set_status(202)
+            self.finish()
+            return
+
+        self.signature, self.mac = _new_signature_mac(
+            self.request.headers.get('X-Hub-Signature')
+        )
+        if self.mac is None:
+            raise tornado.web.HTTPError(401)
+
+        content_length = self.request.headers.get('Content-Length')
+        if content_length is not None and int(content_length) > MAX_BODY_SIZE:
+            raise tornado.web.HTTPError(413)
+        if hasattr(self.request.connection, 'set_max_body_size'):
+            self.request.connection.set_max_body_size(MAX_BODY_SIZE)
+
+    def on_finish(self):
+        tamarack.metrics.WEBHOOK_REQUEST_SECONDS.observe(
+            self.request.request_time(),
+            self.request.headers.get('X-GitHub-Event', 'unknown'),
+            self.get_status()
+        )
+
     def data_received(self, chunk):
-        pass
+        if self._finished:
+            return
+        self.body_size += len(chunk)
+        if self.body_size > MAX_BODY_SIZE:
+            raise tornado.web.HTTPError(413)
+        self.mac.update(chunk)
+        self.chunks.append(chunk)
 
     @gen.coroutine
     def post(self, *args, **kwargs):
-        if not validate_github_signature(self.request):
+        if not hmac.compare_digest(self.mac.hexdigest(), self.signature):
             raise tornado.web.HTTPError(401)
 
-        data = json.loads(self.request.body)
-        yield tamarack.event_processor.handle_event(
-            data, GITHUB_TOKEN
-        )
+        deliveries = self.settings['deliveries']
+        work_queue = self.settings['work_queue']
+        journal = self.settings.get('journal')
+        if work_queue.full():
+            raise tornado.web.HTTPError(503, 'Work queue is full.')
+
+        delivery_id, delivery_key = self.delivery_id, self.delivery_key
+        if delivery_key is None:
+            delivery_id = uuid.uuid4().hex
+        elif not deliveries.add(delivery_key):
+            # The same delivery was accepted while this one was being received.
+            self.write('Duplicate delivery.')
+            return
+
+        body = b''.join(self.chunks)
+        self.chunks = []
+        try:
+            data = tamarack.event.Event.from_body(
+                body,
+                name=self.request.headers.get('X-GitHub-Event'),
+                delivery_id=delivery_id
+            )
+            if journal is not None:
+                yield journal.append(delivery_id, body)
+
+            work_queue.put(process_event, data, GITHUB_TOKEN,
+                           delivery_id=delivery_id, journal=journal)
+        except tornado.queues.QueueFull as err:
+            deliveries.discard(delivery_key)
+            if journal is not None:
+                journal.mark_processed(delivery_id)
+            raise tornado.web.HTTPError(503, 'Work queue is full.') from err
+        except Exception:
+            deliveries.discard(delivery_key)
+            raise
+        self.set_status(202)
+
+
+class MetricsHandler(tornado.web.RequestHandler):  # pylint: disable=abstract-method
+    '''
+    Handler for the "/metrics" endpoint
+
+    Serves the metrics recorded in ``tamarack.metrics`` along with the current
+    state of the application's queue, caches, loop lag and GitHub quota, in the
+    Prometheus text format.
+    '''
+    def get(self):
+        '''
+        Renders the metrics.
+        '''
+        self.set_header('Content-Type', tamarack.metrics.CONTENT_TYPE)
+        self.write(tamarack.metrics.REGISTRY.render())
+        self.write('\n'.join(_app_metrics(self.settings)) + '\n')
 
 
 def make_app():
     '''
-    Create the tornado web application - uses the "events" endpoint.
+    Create the tornado web application - uses the "events" endpoint, and
+    serves metrics on the "metrics" endpoint.
+
+    The application owns the HTTP client used for all GitHub and Slack
+    requests, so connections and concurrency limits are shared between
+    events. It also owns the work queue events are processed from, whose
+    workers are started on the current IOLoop, and a
+    ``tamarack.monitor.LagMonitor`` measuring how long the IOLoop is blocked.
+
+    If the ``JOURNAL_DIR`` environment variable is set, accepted events are
+    journaled there and any events left unprocessed by a previous run are
+    replayed. In a multi-process server, each process journals to its own
+    subdirectory.
+
+    If the ``SHARED_STORE`` environment variable is set, the accepted delivery
+    IDs and the CODEOWNERS cache are kept in the ``tamarack.shared.SharedStore``
+    database at that path, so they are shared with the other server processes.
+
+    If a GitHub App is configured, tokens are minted for its installations and
+    kept refreshed, see ``tamarack.auth``. With a shared store, the tokens are
+    shared with the other server processes too.
+
+    If the ``OWNERS_REPOSITORY`` and ``OWNERS_BRANCHES`` environment variables
+    are set, the CODEOWNERS files of those branches are fetched in the
+    background, see ``tamarack.pull_request.preload_owners_files``. With a
+    shared store, only the first of the processes starting together fetches
+    them.
+    '''
+    http_client = tamarack.http_client.HTTPClient()
+    tamarack.http_client.set_client(http_client)
+
+    work_queue = tamarack.worker.WorkQueue(
+        maxsize=WORK_QUEUE_SIZE, num_workers=WORKERS
+    )
+    work_queue.start()
+
+    lag_monitor = tamarack.monitor.LagMonitor()
+    lag_monitor.start()
+
+    shared_store = None
+    if SHARED_STORE:
+        shared_store = tamarack.shared.SharedStore(SHARED_STORE)
+        deliveries = shared_store.timed_set(
+            'deliveries', DEDUP_WINDOW, maxsize=DEDUP_SIZE
+        )
+        tamarack.pull_request.set_owners_cache(shared_store.cache(
+            'owners',
+            maxsize=tamarack.pull_request.OWNERS_CACHE_SIZE,
+            ttl=tamarack.pull_request.OWNERS_CACHE_TTL,
+            load=tamarack.pull_request.OwnersFile._make
+        ))
+    else:
+        deliveries = tamarack.cache.TimedSet(DEDUP_WINDOW, maxsize=DEDUP_SIZE)
+
+    installation_tokens = tamarack.auth.get_installation_tokens()
+    if installation_tokens is not None:
+        if shared_store is not None:
+            installation_tokens.share(shared_store)
+        installation_tokens.start()
+
+    # Processes sharing a store share the preloaded files, so one preloads them.
+    if tamarack.pull_request.OWNERS_REPOSITORY and tamarack.pull_request.OWNERS_BRANCHES and \
+            (shared_store is None or
+             shared_store.timed_set('startup', PRELOAD_CLAIM_WINDOW).add('preload')):
+        tornado.ioloop.IOLoop.current().spawn_callback(
+            tamarack.pull_request.preload_owners_files, GITHUB_TOKEN
+        )
+
+    journal = None
+    if JOURNAL_DIR:
+        journal_dir = JOURNAL_DIR
+        if tornado.process.task_id() is not None:
+            journal_dir = os.path.join(
+                JOURNAL_DIR, 'process-{0}'.format(tornado.process.task_id())
+            )
+        journal = tamarack.journal.Journal(journal_dir)
+        tornado.ioloop.IOLoop.current().spawn_callback(
+            replay_journal, journal, work_queue, deliveries
+        )
+
+    return tornado.web.Application(
+        [('/events', EventHandler), ('/metrics', MetricsHandler)],
+        http_client=http_client,
+        work_queue=work_queue,
+        journal=journal,
+        deliveries=deliveries,
+        shared_store=shared_store,
+        lag_monitor=lag_monitor
+    )
+
+
+def start_server(port, processes=1):
+    '''
+    Starts the server on the given port and runs the IOLoop.
+
+    With more than one process, the server forks into ``processes`` worker
+    processes (one per CPU if ``0``). Where the platform supports
+    ``SO_REUSEPORT``, each worker binds its own listening socket to the port
+    and the kernel spreads connections between them. Otherwise, the socket is
+    bound before forking and shared by the workers. The workers share their
+    caches through the ``SHARED_STORE`` database, which defaults to a file in a
+    new private directory under the temporary directory, and the GitHub request
+    rate and burst are divided between them.
+
+    port
+        The port to listen on.
+
+    processes
+        The number of server processes. Defaults to ``1``.
+    '''
+    global SHARED_STORE  # pylint: disable=global-statement
+
+    if processes == 1:
+        app = make_app()
+        app.listen(port)
+        tornado.ioloop.IOLoop.current().start()
+        return
+
+    if not SHARED_STORE:
+        SHARED_STORE = os.path.join(
+            tempfile.mkdtemp(prefix='tamarack-{0}-'.format(port)), 'shared.db'
+        )
+        LOG.info('Sharing caches between processes in \'%s\'.', SHARED_STORE)
+
+    # Every process paces its own requests, so each gets its share of the rate.
+    num_processes = processes or tornado.process.cpu_count()
+    tamarack.github.GITHUB_RATE /= num_processes
+    tamarack.github.GITHUB_BURST = max(1, tamarack.github.GITHUB_BURST // num_processes)
+
+    reuse_port = hasattr(socket, 'SO_REUSEPORT')
+    sockets = None
+    if not reuse_port:
+        sockets = tornado.netutil.bind_sockets(port)
+
+    # Nothing may touch the IOLoop before the processes are forked.
+    task_id = tornado.process.fork_processes(processes)
+    tamarack.logs.after_fork(task_id)
+    LOG.info('Started server process %s.', task_id)
+
+    if reuse_port:
+        sockets = tornado.netutil.bind_sockets(port, reuse_port=True)
+
+    app = make_app()
+    server = tornado.httpserver.HTTPServer(app)
+    server.add_sockets(sockets)
+    tornado.ioloop.IOLoop.current().start()
+
+
+@gen.coroutine
+def process_event(event_data, token, delivery_id=None, journal=None):
+    '''
+    Processes a queued event and marks it as processed in the journal, if one
+    is used. Events that fail are marked as processed too, so they are not
+    replayed over and over. An event that queued a Slack notification is only
+    marked once the notification has been sent, so a restart while it waits in
+    the notification buffer replays the event; the worker does not wait for it.
+
+    The stages of the event are traced and the trace is logged once it has
+    been processed. A sample of events is profiled, see ``tamarack.tracing``.
+
+    If a GitHub App is configured, the event is processed with the
+    installation token for the owner of its repository instead of the given
+    token, see ``tamarack.auth``.
+
+    event_data
+        Payload sent from GitHub.
+
+    token
+        GitHub user token.
+
+    delivery_id
+        The GitHub delivery ID of the event.
+
+    journal
+        The ``tamarack.journal.Journal`` the event was written to. Optional.
+    '''
+    start = time.monotonic()
+    trace = tamarack.tracing.start_trace(event_data, delivery_id)
+    profile = tamarack.tracing.start_profile()
+    notification = None
+    try:
+        with tamarack.tracing.span(trace, 'auth'):
+            token = yield tamarack.auth.event_token(event_data, token)
+        notification = yield tamarack.event_processor.handle_event(
+            event_data, token, trace=trace)
+    finally:
+        tamarack.tracing.stop_profile(profile, delivery_id)
+        if trace is not None:
+            trace.finish()
+        tamarack.metrics.EVENT_PROCESSING_SECONDS.observe(
+            time.monotonic() - start,
+            getattr(event_data, 'name', None) or 'unknown',
+            event_data.get('action') or event_data.get('ref_type') or ''
+        )
+        if journal is not None:
+            if notification is not None and not notification.done():
+                notification.add_done_callback(
+                    lambda future: journal.mark_processed(delivery_id))
+            else:
+                journal.mark_processed(delivery_id)
+
+
+@gen.coroutine
+def replay_journal(journal, work_queue, deliveries=None):
+    '''
+    Queues the events a previous run journaled but did not finish processing.
+
+    journal
+        The ``tamarack.journal.Journal`` to replay.
+
+    work_queue
+        The ``tamarack.worker.WorkQueue`` to queue the events on.
+
+    deliveries
+        The ``tamarack.cache.TimedSet`` of accepted delivery IDs. Optional.
+        Replayed events are added to it, so GitHub redeliveries of them are
+        dropped.
+    '''
+    for delivery_id, body in journal.replay():
+        if deliveries is not None:
+            deliveries.add(_delivery_key(delivery_id))
+        try:
+            data = tamarack.event.Event.from_body(body, delivery_id=delivery_id)
+        except ValueError:
+            LOG.error('Skipping journaled event %s: invalid JSON.', delivery_id)
+            journal.mark_processed(delivery_id)
+            continue
+        yield work_queue.put_wait(process_event, data, GITHUB_TOKEN,
+                                  delivery_id=delivery_id, journal=journal)
+
+
+def _app_metrics(settings):
+    '''
+    Helper function that returns the Prometheus text lines for the state of
+    the application, read at the time of the scrape.
+
+    settings
+        The settings of the tornado application.
     '''
-    return tornado.web.Application([
-        ('/events', EventHandler),
-    ])
+    render = tamarack.metrics.render_metric
+    lines = []
+
+    work_queue = settings['work_queue']
+    stats = work_queue.stats()
+    lines += render('tamarack_work_queue_depth', 'gauge',
+                    'Jobs waiting in the work queue.',
+                    [('tamarack_work_queue_depth', {}, stats['depth'])])
+    lines += render('tamarack_work_queue_busy', 'gauge',
+                    'Workers processing a job.',
+                    [('tamarack_work_queue_busy', {}, stats['busy'])])
+    lines += render('tamarack_work_queue_jobs_total', 'counter',
+                    'Jobs processed, failed or rejected by the work queue.',
+                    [('tamarack_work_queue_jobs_total', {'result': result}, stats[result])
+                     for result in ('processed', 'failed', 'rejected')])
+
+    lag_monitor = settings.get('lag_monitor')
+    if lag_monitor is not None:
+        lag = lag_monitor.stats()
+        lines += render('tamarack_loop_lag_seconds', 'gauge',
+                        'Lag of the IOLoop at the last sample, and the maximum seen.',
+                        [('tamarack_loop_lag_seconds', {'stat': 'last'}, lag['last_lag']),
+                         ('tamarack_loop_lag_seconds', {'stat': 'max'}, lag['max_lag'])])
+
+    cache = tamarack.github.cache_stats()
+    lines += render('tamarack_github_cache_lookups_total', 'counter',
+                    'GitHub response cache lookups.',
+                    [('tamarack_github_cache_lookups_total', {'result': 'hit'}, cache['hits']),
+                     ('tamarack_github_cache_lookups_total', {'result': 'miss'},
+                      cache['misses'])])
+    lines += render('tamarack_github_cache_revalidations_total', 'counter',
+                    'Revalidations of cached GitHub responses.',
+                    [('tamarack_github_cache_revalidations_total', {'result': result},
+                      cache[result]) for result in ('not_modified', 'modified')])
+    lines += render('tamarack_github_cache_bytes', 'gauge',
+                    'Bytes of GitHub responses cached.',
+                    [('tamarack_github_cache_bytes', {}, cache['bytes'])])
+
+    owners_cache = tamarack.pull_request.OWNERS_CACHE
+    lines += render('tamarack_owners_cache_lookups_total', 'counter',
+                    'CODEOWNERS cache lookups.',
+                    [('tamarack_owners_cache_lookups_total', {'result': 'hit'},
+                      owners_cache.hits),
+                     ('tamarack_owners_cache_lookups_total', {'result': 'miss'},
+                      owners_cache.misses)])
+
+    remaining = collections.Counter()
+    for limiter in tamarack.github.rate_limiters():
+        if limiter.remaining is not None:
+            remaining[limiter.resource] += limiter.remaining
+    if remaining:
+        lines += render('tamarack_github_rate_limit_remaining', 'gauge',
+                        'Quota left in the GitHub rate limit windows of all tokens.',
+                        [('tamarack_github_rate_limit_remaining', {'resource': resource},
+                          remaining[resource]) for resource in sorted(remaining)])
+
+    http_client = settings.get('http_client')
+    if http_client is not None:
+        lines += render('tamarack_http_requests_in_flight', 'gauge',
+                        'Outgoing HTTP requests in flight.',
+                        [('tamarack_http_requests_in_flight', {}, http_client.in_flight)])
+
+    buffers = tamarack.slack.buffers()
+    lines += render('tamarack_slack_notifications_total', 'counter',
+                    'Slack notifications sent or dropped.',
+                    [('tamarack_slack_notifications_total', {'result': 'sent'},
+                      sum(buf.sent for buf in buffers)),
+                     ('tamarack_slack_notifications_total', {'result': 'dropped'},
+                      sum(buf.dropped for buf in buffers))])
+
+    lines += render('tamarack_log_records_dropped_total', 'counter',
+                    'Log records dropped because the log queue was full.',
+                    [('tamarack_log_records_dropped_total', {}, tamarack.logs.dropped())])
+
+    journal = settings.get('journal')
+    if journal is not None:
+        lines += render('tamarack_journal_pending', 'gauge',
+                        'Journaled events not yet processed.',
+                        [('tamarack_journal_pending', {}, journal.pending())])
+    return lines
 
 
 def validate_github_signature(request):
@@ -67,15 +540,50 @@ def validate_github_signature(request):
     request
         The incoming request to validate.
     '''
-    sha_type, gh_sig = request.headers.get('X-Hub-Signature').split('=')
-    if sha_type != 'sha1':
+    gh_sig, mac = _new_signature_mac(request.headers.get('X-Hub-Signature'))
+    if mac is None:
         return False
 
-    mac = hmac.new(HOOK_SECRET_KEY.encode('utf-8'),
-                   msg=request.body, digestmod=hashlib.sha1)
+    mac.update(request.body)
     return hmac.compare_digest(mac.hexdigest(), gh_sig)
 
 
+def _new_signature_mac(header):
+    '''
+    Helper function that parses the GitHub signature header. Returns the
+    expected hex digest and a new HMAC object to feed the request body into,
+    or ``(None, None)`` if the header is missing or uses an unsupported
+    algorithm.
+
+    header
+        The value of the ``X-Hub-Signature`` header.
+    '''
+    if not header or '=' not in header:
+        return None, None
+    sha_type, gh_sig = header.split('=', 1)
+    if sha_type != 'sha1':
+        return None, None
+
+    return gh_sig, hmac.new(HOOK_SECRET_KEY.encode('utf-8'), digestmod=hashlib.sha1)
+
+
+def _delivery_key(delivery_id):
+    '''
+    Helper function that returns the compact key a delivery ID is remembered
+    by. GitHub delivery IDs are UUIDs, which are stored as their 16 raw bytes
+    instead of a 36 character string.
+
+    delivery_id
+        The value of the ``X-GitHub-Delivery`` header. May be ``None``.
+    '''
+    if not delivery_id:
+        return None
+    try:
+        return uuid.UUID(delivery_id).bytes
+    except ValueError:
+        return delivery_id
+
+
 def _check_env_vars():
     check_ok = True
 
@@ -93,12 +601,13 @@ def _check_env_vars():
             '"export HOOK_SECRET_KEY=your_secret_key".'
         )
 
-    if GITHUB_TOKEN is None:
+    if GITHUB_TOKEN is None and not tamarack.auth.app_configured():
         check_ok = False
         LOG.error(
             'The bot was started without a GitHub authentication token.\n'
             'Please set the GITHUB_TOKEN environment variable: '
-            '"export GITHUB_TOKEN=your_token".'
+            '"export GITHUB_TOKEN=your_token", or configure a GitHub App with '
+            'the GITHUB_APP_ID and GITHUB_APP_PRIVATE_KEY environment variables.'
         )
 
     if SLACK_WEBHOOK_URL is None:
@@ -135,17 +644,12 @@ def _setup_logging():
     else:
         log_level = logging.INFO
 
-    # Set up the basic logger config
-    logging.basicConfig(
-        filename=log_path,
-        format='[%(levelname)s] %(message)s',
-        level=log_level
-    )
+    # Like logging.basicConfig, leave an already configured root logger alone
+    if logging.getLogger('').handlers:
+        return
 
-    # Add a StreamHandler to the logger to also stream logs to the console
-    console = logging.StreamHandler()
-    console.setLevel(log_level)
-    logging.getLogger('').addHandler(console)
+    # Log to a rotating file and to the console, from a background thread
+    tamarack.logs.setup(log_path, log_level)
 
 
 if __name__ == '__main__':
@@ -165,6 +669,4 @@ if __name__ == '__main__':
     LOG.info('Starting Tamarack server.')
     LOG.info('Listening on port \'%s\'.', PORT)
 
-    APP = make_app()
-    APP.listen(PORT)
-    tornado.ioloop.IOLoop.current().start()
+    start_server(int(PORT), processes=PROCESSES)
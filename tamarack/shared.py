@@ -0,0 +1,415 @@
+# -*- coding: utf-8 -*-
+'''
+A cache store shared between the processes of a multi-process Tamarack server.
+
+Each process keeps its own ``tamarack.cache`` objects, so without a shared
+store every process would fetch the same CODEOWNERS files from GitHub and
+could accept the same redelivered webhook. ``SharedStore`` keeps these entries
+in a local SQLite database instead, which every process opens after it has
+been forked. The database uses write-ahead logging, so lookups do not block
+each other and writes are short local transactions.
+
+``SharedCache`` and ``SharedTimedSet`` have the same interface as
+``tamarack.cache.LRUCache`` and ``tamarack.cache.TimedSet`` and can be used in
+their place. Cached values are stored as JSON, so a process never unpickles
+what another one, or anyone else able to write the file, stored. The database
+file is created readable and writable only by its owner.
+
+SQLite runs on the IOLoop, so a process waits at most
+``SHARED_STORE_TIMEOUT`` seconds for another process's write. If the database
+is still locked by then, the store fails open: lookups miss, writes are
+skipped, and a delivery ID is treated as new.
+'''
+
+# Import Python libs
+import contextlib
+import functools
+import logging
+import json
+import os
+import sqlite3
+import time
+
+LOG = logging.getLogger(__name__)
+
+# Seconds to wait for another process's write before failing open.
+SHARED_STORE_TIMEOUT = float(os.environ.get('SHARED_STORE_TIMEOUT', 0.05))
+
+# Seconds to wait for the database while it is opened and its schema created,
+# which happens once per process, when they all start together.
+OPEN_TIMEOUT = 5.0
+
+# Expired and excess entries are trimmed once every TRIM_INTERVAL writes.
+TRIM_INTERVAL = 100
+
+SCHEMA = (
+    'CREATE TABLE IF NOT EXISTS entries ('
+    ' namespace TEXT NOT NULL,'
+    ' key BLOB NOT NULL,'
+    ' value BLOB,'
+    ' expires REAL,'
+    ' PRIMARY KEY (namespace, key)'
+    ') WITHOUT ROWID',
+    'CREATE INDEX IF NOT EXISTS entries_expires ON entries (namespace, expires)',
+)
+
+
+def _fail_open(default):
+    '''
+    Helper decorator for the ``SharedStore`` methods that returns ``default``
+    instead of raising when the database stays locked, see
+    ``SHARED_STORE_TIMEOUT``.
+    '''
+    def decorator(func):
+        @functools.wraps(func)
+        def wrapper(self, *args, **kwargs):
+            try:
+                return func(self, *args, **kwargs)
+            except sqlite3.OperationalError as err:
+                self.busy += 1
+                LOG.warning('Shared store %s failed, continuing without it: %s',
+                            func.__name__, err)
+                return default
+        return wrapper
+    return decorator
+
+
+class SharedStore:
+    '''
+    A namespaced key-value store in a SQLite database file.
+
+    path
+        The path of the database file. It is created if necessary, readable
+        and writable only by the current user.
+
+    timeout
+        The number of seconds to wait for another process's write to finish
+        before failing open. Defaults to ``SHARED_STORE_TIMEOUT``.
+
+    timer
+        The function used to get the current time. Defaults to ``time.time``,
+        which, unlike ``time.monotonic``, stays meaningful across restarts.
+    '''
+
+    def __init__(self, path, timeout=None, timer=time.time):
+        self.path = path
+        self.timer = timer
+        self.busy = 0
+        # SQLite creates the write-ahead log with the permissions of the file.
+        os.close(os.open(path, os.O_RDWR | os.O_CREAT, 0o600))
+        self._conn = sqlite3.connect(path, timeout=OPEN_TIMEOUT, isolation_level=None)
+        self._conn.execute('PRAGMA journal_mode=WAL')
+        self._conn.execute('PRAGMA synchronous=NORMAL')
+        for statement in SCHEMA:
+            self._conn.execute(statement)
+        timeout = SHARED_STORE_TIMEOUT if timeout is None else timeout
+        self._conn.execute('PRAGMA busy_timeout={0:d}'.format(int(timeout * 1000)))
+
+    @contextlib.contextmanager
+    def _transaction(self):
+        '''
+        Runs the statements of the block in a write transaction, so they are
+        atomic with respect to the other processes.
+        '''
+        self._conn.execute('BEGIN IMMEDIATE')
+        try:
+            yield self._conn
+            self._conn.execute('COMMIT')
+        except BaseException:
+            self._conn.execute('ROLLBACK')
+            raise
+
+    @_fail_open(None)
+    def get(self, namespace, key):
+        '''
+        Returns the value stored for the key, or ``None`` if it is missing or
+        expired.
+        '''
+        row = self._conn.execute(
+            'SELECT value FROM entries WHERE namespace = ? AND key = ? '
+            'AND (expires IS NULL OR expires > ?)',
+            (namespace, _key(key), self.timer())
+        ).fetchone()
+        return None if row is None else row[0]
+
+    @_fail_open(False)
+    def contains(self, namespace, key):
+        '''
+        Returns ``True`` if the key is stored and has not expired.
+        '''
+        return self._conn.execute(
+            'SELECT 1 FROM entries WHERE namespace = ? AND key = ? '
+            'AND (expires IS NULL OR expires > ?)',
+            (namespace, _key(key), self.timer())
+        ).fetchone() is not None
+
+    @_fail_open(None)
+    def set(self, namespace, key, value, ttl=None):
+        '''
+        Stores the value for the key, replacing any previous value.
+
+        ttl
+            The number of seconds to keep the entry. Optional.
+        '''
+        self._conn.execute(
+            'INSERT OR REPLACE INTO entries VALUES (?, ?, ?, ?)',
+            (namespace, _key(key), value, self._expires(ttl))
+        )
+
+    @_fail_open(True)
+    def add(self, namespace, key, ttl=None):
+        '''
+        Stores the key if it is missing or expired. Returns ``True`` if the key
+        was stored, or could not be checked, and ``False`` if another process
+        already holds it.
+
+        ttl
+            The number of seconds to keep the entry. Optional.
+        '''
+        key = _key(key)
+        with self._transaction() as conn:
+            conn.execute(
+                'DELETE FROM entries WHERE namespace = ? AND key = ? AND expires <= ?',
+                (namespace, key, self.timer())
+            )
+            cursor = conn.execute(
+                'INSERT OR IGNORE INTO entries VALUES (?, ?, NULL, ?)',
+                (namespace, key, self._expires(ttl))
+            )
+            return cursor.rowcount == 1
+
+    @_fail_open(None)
+    def delete(self, namespace, key):
+        '''
+        Removes the key, if present.
+        '''
+        self._conn.execute(
+            'DELETE FROM entries WHERE namespace = ? AND key = ?', (namespace, _key(key))
+        )
+
+    @_fail_open(None)
+    def clear(self, namespace):
+        '''
+        Removes every entry of the namespace.
+        '''
+        self._conn.execute('DELETE FROM entries WHERE namespace = ?', (namespace,))
+
+    @_fail_open(0)
+    def count(self, namespace):
+        '''
+        Returns the number of unexpired entries in the namespace.
+        '''
+        return self._conn.execute(
+            'SELECT COUNT(*) FROM entries WHERE namespace = ? '
+            'AND (expires IS NULL OR expires > ?)',
+            (namespace, self.timer())
+        ).fetchone()[0]
+
+    @_fail_open(None)
+    def trim(self, namespace, maxsize):
+        '''
+        Removes the expired entries of the namespace and then, if more than
+        ``maxsize`` entries are left, the ones that expire first.
+        '''
+        with self._transaction() as conn:
+            conn.execute(
+                'DELETE FROM entries WHERE namespace = ? AND expires <= ?',
+                (namespace, self.timer())
+            )
+            conn.execute(
+                'DELETE FROM entries WHERE namespace = ? AND key IN ('
+                ' SELECT key FROM entries WHERE namespace = ?'
+                ' ORDER BY expires DESC LIMIT -1 OFFSET ?)',
+                (namespace, namespace, maxsize)
+            )
+
+    def close(self):
+        '''
+        Closes the database connection.
+        '''
+        self._conn.close()
+
+    def cache(self, namespace, maxsize=128, ttl=None, load=None):
+        '''
+        Returns a ``SharedCache`` stored in the given namespace.
+        '''
+        return SharedCache(self, namespace, maxsize=maxsize, ttl=ttl, load=load)
+
+    def timed_set(self, namespace, window, maxsize=50000):
+        '''
+        Returns a ``SharedTimedSet`` stored in the given namespace.
+        '''
+        return SharedTimedSet(self, namespace, window, maxsize=maxsize)
+
+    def _expires(self, ttl):
+        if ttl is None:
+            return None
+        return self.timer() + ttl
+
+
+class SharedCache:  # pylint: disable=too-many-instance-attributes
+    '''
+    A cache stored in a ``SharedStore``, with the interface of
+    ``tamarack.cache.LRUCache``. Values are stored as JSON. When more than
+    ``maxsize`` entries are stored, the ones that expire first are evicted.
+
+    store
+        The ``SharedStore`` holding the entries.
+
+    namespace
+        The namespace of the entries in the store.
+
+    maxsize
+        The maximum number of entries to keep. Defaults to ``128``.
+
+    ttl
+        The number of seconds an entry is kept. Optional.
+
+    load
+        The function that turns a value decoded from JSON back into the stored
+        type, such as ``_make`` of a namedtuple, which JSON stores as a list.
+        Optional.
+    '''
+
+    def __init__(self, store, namespace, maxsize=128, ttl=None, load=None):
+        self.store = store
+        self.namespace = namespace
+        self.maxsize = maxsize
+        self.ttl = ttl
+        self.load = load
+        self.hits = 0
+        self.misses = 0
+        self._writes = 0
+
+    def __len__(self):
+        return self.store.count(self.namespace)
+
+    def __contains__(self, key):
+        return self.store.contains(self.namespace, key)
+
+    def get(self, key, default=None):
+        '''
+        Returns the value stored for the key.
+
+        key
+            The key to look up.
+
+        default
+            The value to return if the key is missing or expired.
+        '''
+        value = self.store.get(self.namespace, key)
+        if value is None:
+            self.misses += 1
+            return default
+        self.hits += 1
+        return self._load(value)
+
+    def set(self, key, value):
+        '''
+        Stores the value for the key.
+
+        key
+            The key to store the value under.
+
+        value
+            The value to store. It must be JSON serializable.
+        '''
+        self.store.set(self.namespace, key, json.dumps(value), ttl=self.ttl)
+        self._writes += 1
+        if self._writes % TRIM_INTERVAL == 0:
+            self.store.trim(self.namespace, self.maxsize)
+
+    def pop(self, key, default=None):
+        '''
+        Removes the key from the cache and returns its value.
+
+        key
+            The key to remove.
+
+        default
+            The value to return if the key is missing.
+        '''
+        value = self.store.get(self.namespace, key)
+        if value is None:
+            return default
+        self.store.delete(self.namespace, key)
+        return self._load(value)
+
+    def clear(self):
+        '''
+        Removes all entries from the cache.
+        '''
+        self.store.clear(self.namespace)
+
+    def _load(self, value):
+        value = json.loads(value)
+        if self.load is None:
+            return value
+        return self.load(value)
+
+
+class SharedTimedSet:
+    '''
+    A set stored in a ``SharedStore``, with the interface of
+    ``tamarack.cache.TimedSet``. Adding a key is atomic across processes, so
+    only one process gets ``True`` for it.
+
+    store
+        The ``SharedStore`` holding the keys.
+
+    namespace
+        The namespace of the keys in the store.
+
+    window
+        The number of seconds a key is remembered.
+
+    maxsize
+        The maximum number of keys to remember. Defaults to ``50000``.
+    '''
+
+    def __init__(self, store, namespace, window, maxsize=50000):
+        self.store = store
+        self.namespace = namespace
+        self.window = window
+        self.maxsize = maxsize
+        self._writes = 0
+
+    def __len__(self):
+        return self.store.count(self.namespace)
+
+    def __contains__(self, key):
+        return self.store.contains(self.namespace, key)
+
+    def add(self, key):
+        '''
+        Adds the key to the set. Returns ``False`` if the key was already in
+        the set, and ``True`` otherwise.
+
+        key
+            The key to add.
+        '''
+        added = self.store.add(self.namespace, key, ttl=self.window)
+        if added:
+            self._writes += 1
+            if self._writes % TRIM_INTERVAL == 0:
+                self.store.trim(self.namespace, self.maxsize)
+        return added
+
+    def discard(self, key):
+        '''
+        Removes the key from the set, if present.
+
+        key
+            The key to remove.
+        '''
+        self.store.delete(self.namespace, key)
+
+
+def _key(key):
+    '''
+    Helper function that returns the stored form of a key. Strings are stored
+    as UTF-8 bytes.
+    '''
+    if isinstance(key, str):
+        return key.encode('utf-8')
+    return key
@@ -3,24 +3,48 @@
 Contains functions required for interacting with Slack. The main function
 used is the ``api_request`` function. This function handles the GET/POST
 interactions to Slack.
+
+Notifications are sent through a ``NotificationBuffer``, which groups the
+attachments posted to a webhook within a short window into a single message,
+so bursts of events do not run into Slack's rate limits. ``notify`` returns a
+future that resolves once the notification has been sent or given up on, so
+the event journal can wait for it before marking the event processed.
 '''
 
 # Import Python libs
 import json
 import logging
 import os
+import random
+import time
 
 # Import Tornado libs
 from tornado import gen
+import tornado.concurrent
 import tornado.httpclient
+import tornado.ioloop
 
+# Import Tamarack libs
+import tamarack.http_client
+import tamarack.metrics
 
 LOG = logging.getLogger(__name__)
 SLACK_WEBHOOK_URL = os.environ.get('SLACK_WEBHOOK_URL')
 
+# Attachments are collected for SLACK_BATCH_WINDOW seconds, up to
+# SLACK_BATCH_SIZE per message. Messages to the same webhook are sent at least
+# SLACK_MIN_INTERVAL seconds apart, as Slack allows about one per second.
+SLACK_BATCH_WINDOW = float(os.environ.get('SLACK_BATCH_WINDOW', 2))
+SLACK_BATCH_SIZE = int(os.environ.get('SLACK_BATCH_SIZE', 20))
+SLACK_MIN_INTERVAL = float(os.environ.get('SLACK_MIN_INTERVAL', 1))
+SLACK_MAX_RETRIES = int(os.environ.get('SLACK_MAX_RETRIES', 5))
+SLACK_RETRY_BASE = float(os.environ.get('SLACK_RETRY_BASE', 1))
+
+_BUFFERS = {}
+
 
 @gen.coroutine
-def api_request(method='GET', headers=None, post_data=None):
+def api_request(method='GET', headers=None, post_data=None, url=None):
     '''
     The main function used to interact with the Slack API. This function
     performs the actual requests to Slack when responding to various events.
@@ -44,6 +68,9 @@ def api_request(method='GET', headers=None, post_data=None):
         ``'{"text": "My comment message."}'``. Other API calls may require
         different options and structures.
 
+    url
+        The Slack webhook URL to send the request to. Defaults to
+        ``SLACK_WEBHOOK_URL``.
     '''
     if headers is None:
         headers = {'Content-Type': 'application/json'}
@@ -53,11 +80,236 @@ def api_request(method='GET', headers=None, post_data=None):
         data = json.dumps(post_data)
         data = data.encode('utf-8')
 
-    http_client = tornado.httpclient.AsyncHTTPClient()
     request = tornado.httpclient.HTTPRequest(
-        SLACK_WEBHOOK_URL,
+        url or SLACK_WEBHOOK_URL,
         method=method,
         headers=headers,
         body=data
     )
-    yield http_client.fetch(request)
+    start = time.monotonic()
+    status = 599
+    try:
+        response = yield tamarack.http_client.get_client().fetch(request)
+        status = response.code
+    except tornado.httpclient.HTTPError as err:
+        status = err.code
+        raise
+    finally:
+        tamarack.metrics.SLACK_REQUEST_SECONDS.observe(time.monotonic() - start, status)
+
+
+class NotificationBuffer:  # pylint: disable=too-many-instance-attributes
+    '''
+    Groups Slack message attachments posted to one webhook into batched
+    messages.
+
+    The first attachment added to an empty buffer starts a ``window`` second
+    timer. When the timer fires, or as soon as ``max_size`` attachments are
+    waiting, the attachments are sent as one message. Messages are sent one
+    at a time, at least ``min_interval`` seconds apart. If Slack answers with
+    ``429 Too Many Requests``, the message is retried after the delay Slack
+    asks for, or with exponential backoff, up to ``max_retries`` times.
+
+    Each Slack incoming webhook posts to one channel, so each channel's
+    throughput and latency are set by the buffer of its webhook URL. See
+    ``get_buffer``.
+
+    url
+        The Slack webhook URL. Defaults to ``SLACK_WEBHOOK_URL``.
+
+    window
+        The number of seconds to collect attachments for. Defaults to
+        ``SLACK_BATCH_WINDOW``.
+
+    max_size
+        The maximum number of attachments per message. Defaults to
+        ``SLACK_BATCH_SIZE``.
+
+    min_interval
+        The minimum number of seconds between messages. Defaults to
+        ``SLACK_MIN_INTERVAL``.
+
+    max_retries
+        The number of times a message is retried. Defaults to
+        ``SLACK_MAX_RETRIES``.
+    '''
+
+    def __init__(self, url=None, window=None, max_size=None, min_interval=None,
+                 max_retries=None):
+        self.url = url
+        self.window = SLACK_BATCH_WINDOW if window is None else window
+        self.max_size = max_size or SLACK_BATCH_SIZE
+        self.min_interval = SLACK_MIN_INTERVAL if min_interval is None else min_interval
+        self.max_retries = SLACK_MAX_RETRIES if max_retries is None else max_retries
+        self.io_loop = tornado.ioloop.IOLoop.current()
+        self.sent = 0
+        self.retried = 0
+        self.dropped = 0
+        self._pending = []
+        self._timer = None
+        self._sending = False
+        self._last_sent = None
+
+    def __len__(self):
+        return len(self._pending)
+
+    def add(self, attachment):
+        '''
+        Queues an attachment to be sent in the next message. Returns a future
+        that resolves once the message has been sent, or dropped after its
+        retries; failures are logged, not raised.
+
+        attachment
+            The Slack attachment dictionary.
+        '''
+        done = tornado.concurrent.Future()
+        self._pending.append((attachment, done))
+        if len(self._pending) >= self.max_size:
+            self.flush()
+        elif self._timer is None and not self._sending:
+            self._timer = self.io_loop.call_later(self.window, self.flush)
+        return done
+
+    def flush(self):
+        '''
+        Starts sending the waiting attachments right away, without waiting for
+        the window to close.
+        '''
+        if self._timer is not None:
+            self.io_loop.remove_timeout(self._timer)
+            self._timer = None
+        if not self._sending and self._pending:
+            self._sending = True
+            self.io_loop.spawn_callback(self._drain)
+
+    @gen.coroutine
+    def _drain(self):
+        '''
+        Sends messages until no attachments are waiting.
+        '''
+        try:
+            while self._pending:
+                if self._last_sent is not None:
+                    wait = self._last_sent + self.min_interval - self.io_loop.time()
+                    if wait > 0:
+                        yield gen.sleep(wait)
+
+                batch = self._pending[:self.max_size]
+                del self._pending[:self.max_size]
+                try:
+                    yield self._send([attachment for attachment, _ in batch])
+                finally:
+                    for _, done in batch:
+                        done.set_result(None)
+                self._last_sent = self.io_loop.time()
+        finally:
+            self._sending = False
+
+    @gen.coroutine
+    def _send(self, batch):
+        '''
+        Sends one message holding the given attachments, retrying it when
+        Slack asks to slow down.
+        '''
+        attempt = 0
+        while True:
+            try:
+                yield api_request(method='POST', post_data={'attachments': batch},
+                                  url=self.url)
+            except tornado.httpclient.HTTPError as err:
+                delay = _retry_delay(err, attempt)
+                if delay is not None and attempt < self.max_retries:
+                    attempt += 1
+                    self.retried += 1
+                    LOG.warning('Slack returned HTTP %s. Retrying in %.1f seconds '
+                                '(attempt %s of %s).', err.code, delay, attempt,
+                                self.max_retries)
+                    yield gen.sleep(delay)
+                    continue
+                self.dropped += len(batch)
+                LOG.error('Failed to send %s Slack notifications: %s', len(batch), err)
+            except Exception as err:  # pylint: disable=broad-except
+                self.dropped += len(batch)
+                LOG.error('Failed to send %s Slack notifications: %s', len(batch), err)
+            else:
+                self.sent += len(batch)
+            return
+
+
+def get_buffer(url=None, **kwargs):
+    '''
+    Returns the notification buffer of a Slack webhook, creating it for the
+    current IOLoop if necessary.
+
+    url
+        The Slack webhook URL. Defaults to ``SLACK_WEBHOOK_URL``.
+
+    kwargs
+        The settings of a newly created buffer. See ``NotificationBuffer``.
+    '''
+    url = url or SLACK_WEBHOOK_URL
+    buf = _BUFFERS.get(url)
+    if buf is None or buf.io_loop is not tornado.ioloop.IOLoop.current():
+        buf = _BUFFERS[url] = NotificationBuffer(url=url, **kwargs)
+    return buf
+
+
+def buffers():
+    '''
+    Returns the notification buffers of every Slack webhook.
+    '''
+    return list(_BUFFERS.values())
+
+
+def set_buffer(buf):
+    '''
+    Sets the notification buffer used for the buffer's webhook URL, for
+    example to give a channel its own window and size.
+
+    buf
+        The ``NotificationBuffer`` to use.
+    '''
+    _BUFFERS[buf.url or SLACK_WEBHOOK_URL] = buf
+
+
+def notify(attachment, url=None):
+    '''
+    Queues a Slack message attachment on the notification buffer of the
+    webhook. Returns a future that resolves once it has been sent or dropped,
+    see ``NotificationBuffer.add``.
+
+    attachment
+        The Slack attachment dictionary.
+
+    url
+        The Slack webhook URL. Defaults to ``SLACK_WEBHOOK_URL``.
+    '''
+    return get_buffer(url).add(attachment)
+
+
+def _retry_delay(err, attempt):
+    '''
+    Helper function that returns the number of seconds to wait before retrying
+    a Slack request that failed with the given error, or ``None`` if it should
+    not be retried. Rate limited (``429``) and server error responses are
+    retried.
+
+    err
+        The ``tornado.httpclient.HTTPError`` the request failed with.
+
+    attempt
+        The number of retries made so far.
+    '''
+    if err.code != 429 and err.code < 500:
+        return None
+
+    if err.code == 429 and err.response is not None:
+        retry_after = err.response.headers.get('Retry-After')
+        if retry_after is not None:
+            try:
+                return float(retry_after)
+            except ValueError:
+                pass
+
+    backoff = SLACK_RETRY_BASE * (2 ** attempt)
+    return backoff + random.uniform(0, backoff)
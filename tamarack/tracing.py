@@ -0,0 +1,223 @@
+# -*- coding: utf-8 -*-
+'''
+Lightweight tracing of the stages an event goes through, and sampled
+profiling of whole events.
+
+A ``Trace`` is created for each processed event and handed down the call
+chain, from ``tamarack.event_processor`` to ``tamarack.pull_request`` and
+``tamarack.github``. Each stage records a span with its start offset,
+duration and a few attributes. Once the event has been processed, the trace
+is written as one JSON record, tied to the event's GitHub delivery ID, to the
+``tamarack.trace`` logger:
+
+.. code-block:: json
+
+    {"delivery_id": "72d3162e-...", "event": "pull_request", "action": "opened",
+     "duration": 8.104, "spans": [
+        {"name": "github.fetch", "start": 0.001, "duration": 7.52,
+         "endpoint": "/repos/:owner/:repo/pulls/:number/files", "status": 200},
+        {"name": "owners.match", "start": 7.53, "duration": 0.41, "files": 300}]}
+
+Functions take an optional ``trace`` argument and record nothing when it is
+``None``. Set ``TRACING`` to ``false`` to turn tracing off.
+
+Set ``PROFILE_SAMPLE_RATE`` to a fraction of events (for example ``0.01``) to
+run them under ``cProfile``, and ``PROFILE_DIR`` to the directory the stats
+are dumped to, one ``<delivery_id>.prof`` file per profiled event. Only one
+event is profiled at a time, and since events share the IOLoop, the profile
+also includes whatever else ran while the event was being processed.
+'''
+
+# pylint: disable=duplicate-code
+# Import Python libs
+import contextlib
+import cProfile
+import json
+import logging
+import os
+import random
+import re
+import tempfile
+import time
+
+LOG = logging.getLogger(__name__)
+TRACE_LOG = logging.getLogger('tamarack.trace')
+
+TRACING = os.environ.get('TRACING', 'true').lower() not in ('0', 'false', 'no', 'off')
+PROFILE_SAMPLE_RATE = float(os.environ.get('PROFILE_SAMPLE_RATE', 0))
+PROFILE_DIR = os.environ.get('PROFILE_DIR') or os.path.join(
+    tempfile.gettempdir(), 'tamarack-profiles'
+)
+
+_PROFILING = False
+
+
+class Trace:
+    '''
+    The spans recorded while processing one event.
+
+    delivery_id
+        The GitHub delivery ID of the event.
+
+    event
+        The event type. Optional.
+
+    action
+        The event action. Optional.
+
+    timer
+        The function used to get the current time. Defaults to
+        ``time.monotonic``.
+    '''
+    __slots__ = ('delivery_id', 'event', 'action', 'timer', 'started', 'spans')
+
+    def __init__(self, delivery_id, event=None, action=None, timer=time.monotonic):
+        self.delivery_id = delivery_id
+        self.event = event
+        self.action = action
+        self.timer = timer
+        self.started = timer()
+        self.spans = []
+
+    @contextlib.contextmanager
+    def span(self, name, **attrs):
+        '''
+        Records a span covering the body of the ``with`` block. Attributes can
+        be added while the span is open through the yielded dictionary.
+
+        name
+            The name of the stage.
+
+        attrs
+            Attributes to record with the span.
+        '''
+        start = self.timer()
+        try:
+            yield attrs
+        except Exception as err:
+            attrs['error'] = type(err).__name__
+            raise
+        finally:
+            self.add(name, start, self.timer() - start, **attrs)
+
+    def add(self, name, start, duration, **attrs):
+        '''
+        Records a span that has already ended.
+
+        name
+            The name of the stage.
+
+        start
+            The time the stage started, from the trace's timer.
+
+        duration
+            The duration of the stage, in seconds.
+        '''
+        record = {'name': name,
+                  'start': round(start - self.started, 6),
+                  'duration': round(duration, 6)}
+        record.update(attrs)
+        self.spans.append(record)
+
+    def record(self):
+        '''
+        Returns the trace as a dictionary.
+        '''
+        return {'delivery_id': self.delivery_id,
+                'event': self.event,
+                'action': self.action,
+                'duration': round(self.timer() - self.started, 6),
+                'spans': self.spans}
+
+    def finish(self):
+        '''
+        Writes the trace to the ``tamarack.trace`` logger.
+        '''
+        if TRACE_LOG.isEnabledFor(logging.INFO):
+            TRACE_LOG.info(json.dumps(self.record(), default=str))
+
+
+def start_trace(event_data, delivery_id):
+    '''
+    Returns a new ``Trace`` for an event, or ``None`` if tracing is off.
+
+    event_data
+        The event, as a ``tamarack.event.Event`` or payload dictionary.
+
+    delivery_id
+        The GitHub delivery ID of the event.
+    '''
+    if not TRACING:
+        return None
+    return Trace(delivery_id,
+                 event=getattr(event_data, 'name', None),
+                 action=event_data.get('action') or event_data.get('ref_type'))
+
+
+def span(trace, name, **attrs):
+    '''
+    Returns a context manager recording a span on the trace, or doing nothing
+    if the trace is ``None``. See ``Trace.span``.
+    '''
+    if trace is None:
+        return _no_span(attrs)
+    return trace.span(name, **attrs)
+
+
+@contextlib.contextmanager
+def _no_span(attrs):
+    yield attrs
+
+
+def start_profile(rate=None):
+    '''
+    Starts a ``cProfile.Profile`` for a sampled fraction of the calls. Returns
+    the profile, or ``None`` if this call was not sampled or another profile
+    is running.
+
+    rate
+        The fraction of calls to profile. Defaults to ``PROFILE_SAMPLE_RATE``.
+    '''
+    global _PROFILING  # pylint: disable=global-statement
+    rate = PROFILE_SAMPLE_RATE if rate is None else rate
+    if _PROFILING or rate <= 0 or random.random() >= rate:
+        return None
+
+    _PROFILING = True
+    profile = cProfile.Profile()
+    profile.enable()
+    return profile
+
+
+def stop_profile(profile, name, directory=None):
+    '''
+    Stops a profile started by ``start_profile`` and dumps its stats to
+    ``<directory>/<name>.prof``. Does nothing if the profile is ``None``.
+    Returns the path of the stats file.
+
+    profile
+        The ``cProfile.Profile`` to stop.
+
+    name
+        The name of the stats file, usually the delivery ID.
+
+    directory
+        The directory to write the stats to. Defaults to ``PROFILE_DIR``.
+    '''
+    global _PROFILING  # pylint: disable=global-statement
+    if profile is None:
+        return None
+
+    profile.disable()
+    _PROFILING = False
+
+    directory = directory or PROFILE_DIR
+    path = os.path.join(directory, '{0}.prof'.format(re.sub(r'[^\w.-]', '_', str(name))))
+    try:
+        os.makedirs(directory, exist_ok=True)
+        profile.dump_stats(path)
+    except OSError as err:
+        LOG.error('Failed to write profile to %s: %s', path, err)
+        return None
+    LOG.info('Wrote profile of %s to %s.', name, path)
+    return path
@@ -0,0 +1,143 @@
+# -*- coding: utf-8 -*-
+'''
+A bounded work queue drained by a pool of worker coroutines. The webhook
+handler in server.py puts events on the queue and responds to GitHub at once,
+while the workers do the slow GitHub and Slack calls in the background.
+'''
+
+# Import Python libs
+import datetime
+import logging
+import time
+
+# Import Tornado libs
+from tornado import gen
+import tornado.ioloop
+import tornado.queues
+
+LOG = logging.getLogger(__name__)
+
+
+class WorkQueue:  # pylint: disable=too-many-instance-attributes
+    '''
+    Runs queued jobs on a fixed number of worker coroutines.
+
+    maxsize
+        The maximum number of jobs waiting in the queue. When the queue is
+        full, ``put`` raises ``tornado.queues.QueueFull``.
+
+    num_workers
+        The number of worker coroutines draining the queue.
+    '''
+
+    def __init__(self, maxsize=1000, num_workers=8):
+        self.maxsize = maxsize
+        self.num_workers = num_workers
+        self.processed = 0
+        self.failed = 0
+        self.rejected = 0
+        self.busy = 0
+        self.last_latency = 0.0
+        self.total_latency = 0.0
+        self.max_latency = 0.0
+        self._queue = tornado.queues.Queue(maxsize=maxsize)
+        self._started = False
+
+    def start(self):
+        '''
+        Starts the worker coroutines on the current IOLoop.
+        '''
+        if self._started:
+            return
+        self._started = True
+        io_loop = tornado.ioloop.IOLoop.current()
+        for _ in range(self.num_workers):
+            io_loop.spawn_callback(self._work)
+
+    def put(self, func, *args, **kwargs):
+        '''
+        Queues a call to the coroutine function ``func`` without waiting.
+        Raises ``tornado.queues.QueueFull`` if the queue is full.
+
+        func
+            The coroutine function to call.
+
+        args, kwargs
+            The arguments to pass to ``func``.
+        '''
+        try:
+            self._queue.put_nowait((time.monotonic(), func, args, kwargs))
+        except tornado.queues.QueueFull:
+            self.rejected += 1
+            LOG.warning('Work queue is full (%s jobs). Rejecting job.', self.maxsize)
+            raise
+
+    @gen.coroutine
+    def put_wait(self, func, *args, **kwargs):
+        '''
+        Queues a call to the coroutine function ``func``, waiting for room in
+        the queue if it is full. The arguments are the same as for ``put``.
+        '''
+        yield self._queue.put((time.monotonic(), func, args, kwargs))
+
+    def full(self):
+        '''
+        Returns ``True`` if the queue is full.
+        '''
+        return self._queue.full()
+
+    def join(self, timeout=None):
+        '''
+        Returns a future that resolves once every queued job has been processed.
+
+        timeout
+            The maximum time to wait, in seconds. Optional.
+        '''
+        if timeout is not None:
+            timeout = datetime.timedelta(seconds=timeout)
+        return self._queue.join(timeout=timeout)
+
+    def depth(self):
+        '''
+        Returns the number of jobs waiting in the queue.
+        '''
+        return self._queue.qsize()
+
+    def stats(self):
+        '''
+        Returns a dictionary describing the state of the queue. Latencies are
+        measured from the time a job is queued until it has been processed.
+        '''
+        mean_latency = 0.0
+        if self.processed:
+            mean_latency = self.total_latency / self.processed
+        return {'depth': self.depth(),
+                'busy': self.busy,
+                'processed': self.processed,
+                'failed': self.failed,
+                'rejected': self.rejected,
+                'last_latency': self.last_latency,
+                'mean_latency': mean_latency,
+                'max_latency': self.max_latency}
+
+    @gen.coroutine
+    def _work(self):
+        '''
+        Worker coroutine. Runs queued jobs one at a time, forever.
+        '''
+        while True:
+            queued, func, args, kwargs = yield self._queue.get()
+            self.busy += 1
+            try:
+                yield func(*args, **kwargs)
+            except Exception:  # pylint: disable=broad-except
+                self.failed += 1
+                LOG.exception('Error while processing queued job.')
+
+            latency = time.monotonic() - queued
+            self.busy -= 1
+            self.processed += 1
+            self.last_latency = latency
+            self.total_latency += latency
+            self.max_latency = max(self.max_latency, latency)
+            self._queue.task_done()
@@ -0,0 +1,27 @@
+# -*- coding: utf-8 -*-
+'''
+Helpers shared by the tests.
+'''
+
+# Import Tornado libs
+import tornado.concurrent
+
+
+class FakeTimer:  # pylint: disable=too-few-public-methods
+    '''
+    A clock that only moves when told to.
+    '''
+    def __init__(self):
+        self.now = 0
+
+    def __call__(self):
+        return self.now
+
+
+def future(result):
+    '''
+    Helper function that returns a future resolved with the given result.
+    '''
+    resolved = tornado.concurrent.Future()
+    resolved.set_result(result)
+    return resolved
@@ -0,0 +1,202 @@
+# -*- coding: utf-8 -*-
+'''
+Tests for the functions in tamarack.auth.py
+'''
+
+# Import Python libs
+from unittest.mock import MagicMock, patch
+import os
+import shutil
+import tempfile
+import time
+import pytest
+
+# Import Tornado libs
+import tornado.concurrent
+import tornado.testing
+import tornado.web
+
+# Import Tamarack libs
+import tamarack.auth
+import tamarack.shared
+import tests.helpers
+
+try:
+    from cryptography.hazmat.backends import default_backend
+    from cryptography.hazmat.primitives import serialization
+    from cryptography.hazmat.primitives.asymmetric import rsa
+    HAS_CRYPTOGRAPHY = True
+except ImportError:
+    HAS_CRYPTOGRAPHY = False
+
+
+class AppHandler(tornado.web.RequestHandler):  # pylint: disable=abstract-method
+    '''
+    Handler serving the GitHub App endpoints, counting the requests it gets.
+    '''
+    calls = []
+
+    def get(self):
+        '''
+        Serves the installations, or an installation.
+        '''
+        AppHandler.calls.append(('GET', self.request.path))
+        assert self.request.headers['Authorization'] == 'Bearer test-jwt'
+        if self.request.path == '/app/installations':
+            self.write('[{"id": 1, "account": {"login": "saltstack"}}, '
+                       '{"id": 2, "account": {"login": "rallytime"}}]')
+        else:
+            self.write({'id': 3})
+
+    def post(self):
+        '''
+        Creates an installation token.
+        '''
+        AppHandler.calls.append(('POST', self.request.path))
+        assert self.request.headers['Authorization'] == 'Bearer test-jwt'
+        installation_id = self.request.path.split('/')[3]
+        expires = time.strftime('%Y-%m-%dT%H:%M:%SZ', time.gmtime(time.time() + 3600))
+        self.write({'token': 'token-{0}-{1}'.format(installation_id, len(AppHandler.calls)),
+                    'expires_at': expires})
+
+
+@patch('tamarack.auth.encode_jwt', lambda *args: 'test-jwt')
+class TestInstallationTokens(tornado.testing.AsyncHTTPTestCase):
+    '''
+    TestCase for the InstallationTokens class
+    '''
+
+    def get_app(self):
+        return tornado.web.Application([(r'/.*', AppHandler)])
+
+    def setUp(self):
+        super().setUp()
+        AppHandler.calls = []
+        self.tokens = tamarack.auth.InstallationTokens(
+            '123', 'private-key', api_url=self.get_url('')
+        )
+
+    @tornado.testing.gen_test
+    def test_get_token(self):
+        '''
+        Tests that the installation is looked up and its token minted once
+        '''
+        repo_url = self.get_url('/repos/saltstack/salt')
+        first = yield self.tokens.get_token('saltstack', repo_url)
+        second = yield self.tokens.get_token('SaltStack', repo_url)
+        assert first == second == 'token-3-2'
+        assert AppHandler.calls == [('GET', '/repos/saltstack/salt/installation'),
+                                    ('POST', '/app/installations/3/access_tokens')]
+
+    @tornado.testing.gen_test
+    def test_concurrent(self):
+        '''
+        Tests that concurrent requests for a token share one lookup and mint
+        '''
+        tokens = yield [self.tokens.get_token('saltstack') for _ in range(5)]
+        assert set(tokens) == {'token-3-2'}
+        assert len(AppHandler.calls) == 2
+
+    @tornado.testing.gen_test
+    def test_load_installations(self):
+        '''
+        Tests that every installation gets a token when loaded
+        '''
+        yield self.tokens.load_installations()
+        assert self.tokens.stats() == {'installations': 2, 'tokens': 2, 'minted': 2}
+        token = yield self.tokens.get_token('rallytime')
+        assert token.startswith('token-2-')
+        assert len(AppHandler.calls) == 3
+
+    @tornado.testing.gen_test
+    def test_refresh_before_expiry(self):
+        '''
+        Tests that a token close to its expiry is returned while a new one is
+        minted in the background
+        '''
+        first = yield self.tokens.get_token('saltstack')
+        self.tokens.margin = 4000
+        second = yield self.tokens.get_token('saltstack')
+        assert second == first
+        yield self.tokens.refresh(3)
+        self.tokens.margin = 600
+        third = yield self.tokens.get_token('saltstack')
+        assert third != first
+        assert self.tokens.minted == 2
+
+    @tornado.testing.gen_test
+    def test_shared(self):
+        '''
+        Tests that installations and tokens loaded by one process are used by
+        another one sharing the store, without asking GitHub again
+        '''
+        directory = tempfile.mkdtemp()
+        self.addCleanup(shutil.rmtree, directory)
+        path = os.path.join(directory, 'shared.db')
+        other = tamarack.auth.InstallationTokens('123', 'private-key',
+                                                 api_url=self.get_url(''))
+        self.tokens.share(tamarack.shared.SharedStore(path))
+        other.share(tamarack.shared.SharedStore(path))
+
+        yield self.tokens.load_installations()
+        calls = len(AppHandler.calls)
+        token = yield other.get_token('rallytime')
+        assert token == (yield self.tokens.get_token('rallytime'))
+        assert len(AppHandler.calls) == calls
+        assert other.minted == 0
+
+
+class TestEventToken(tornado.testing.AsyncTestCase):
+    '''
+    TestCase for the event_token function
+    '''
+
+    @tornado.testing.gen_test
+    def test_installation_token(self):
+        '''
+        Tests that the installation token of the repository owner is used
+        '''
+        tokens = tamarack.auth.InstallationTokens('123', 'private-key')
+        tokens.get_token = MagicMock(return_value=tests.helpers.future('installation-token'))
+        tamarack.auth.set_installation_tokens(tokens)
+        token = yield tamarack.auth.event_token(
+            {'repository': {'full_name': 'saltstack/salt',
+                            'url': 'https://github.com/saltstack/salt'}}, 'user-token')
+        assert token == 'installation-token'
+        tokens.get_token.assert_called_once_with(
+            'saltstack', 'https://api.github.com/repos/saltstack/salt')
+
+    def tearDown(self):
+        tamarack.auth.set_installation_tokens(None)
+        super().tearDown()
+
+    @tornado.testing.gen_test
+    def test_no_app(self):
+        '''
+        Tests that the given token is used if no GitHub App is configured
+        '''
+        tamarack.auth.set_installation_tokens(None)
+        with patch('tamarack.auth.GITHUB_APP_ID', None):
+            token = yield tamarack.auth.event_token({'repository': {}}, 'user-token')
+        assert token == 'user-token'
+
+
+@pytest.mark.skipif(not (tamarack.auth.HAS_JWT and HAS_CRYPTOGRAPHY),
+                    reason='PyJWT or cryptography is not installed')
+class TestEncodeJWT:  # pylint: disable=too-few-public-methods
+    '''
+    TestCase for the encode_jwt function
+    '''
+
+    def test_claims(self):
+        '''
+        Tests that the JWT carries the App ID and validity period
+        '''
+        private_key = rsa.generate_private_key(
+            public_exponent=65537, key_size=2048, backend=default_backend()
+        ).private_bytes(serialization.Encoding.PEM,
+                        serialization.PrivateFormat.TraditionalOpenSSL,
+                        serialization.NoEncryption())
+        token = tamarack.auth.encode_jwt('123', private_key, 100, 640)
+        claims = tamarack.auth.jwt.decode(token, options={'verify_signature': False})
+        assert claims == {'iat': 100, 'exp': 640, 'iss': 123}
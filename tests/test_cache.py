@@ -0,0 +1,172 @@
+# -*- coding: utf-8 -*-
+'''
+Tests for the functions in tamarack.cache.py
+'''
+
+# Import Tornado libs
+from tornado import gen
+import tornado.testing
+
+# Import Tamarack libs
+import tamarack.cache
+import tests.helpers
+
+
+class TestLRUCache:
+    '''
+    TestCase for the LRUCache class
+    '''
+
+    def test_get_and_set(self):
+        '''
+        Tests that stored values are returned and missing keys return the default
+        '''
+        cache = tamarack.cache.LRUCache()
+        cache.set('foo', 1)
+        assert cache.get('foo') == 1
+        assert cache.get('bar', 'default') == 'default'
+        assert (cache.hits, cache.misses) == (1, 1)
+
+    def test_lru_eviction(self):
+        '''
+        Tests that the least recently used entry is evicted when the cache is full
+        '''
+        cache = tamarack.cache.LRUCache(maxsize=2)
+        cache.set('a', 1)
+        cache.set('b', 2)
+        cache.get('a')
+        cache.set('c', 3)
+        assert 'a' in cache
+        assert 'b' not in cache
+        assert len(cache) == 2
+
+    def test_ttl_expiry(self):
+        '''
+        Tests that entries expire after the ttl
+        '''
+        timer = tests.helpers.FakeTimer()
+        cache = tamarack.cache.LRUCache(ttl=10, timer=timer)
+        cache.set('foo', 1)
+        timer.now = 9
+        assert cache.get('foo') == 1
+        timer.now = 10
+        assert cache.get('foo') is None
+        assert len(cache) == 0
+
+
+class TestSizedLRUCache:
+    '''
+    TestCase for the SizedLRUCache class
+    '''
+
+    def test_bounded_by_bytes(self):
+        '''
+        Tests that least recently used entries are evicted to stay within maxbytes
+        '''
+        cache = tamarack.cache.SizedLRUCache(10)
+        cache.set('a', b'1234')
+        cache.set('b', b'1234')
+        cache.get('a')
+        cache.set('c', b'1234')
+        assert 'b' not in cache
+        assert 'a' in cache and 'c' in cache
+        assert (cache.nbytes, cache.evictions) == (8, 1)
+
+    def test_replace_and_oversized(self):
+        '''
+        Tests that replaced entries are accounted for and oversized values are
+        not cached
+        '''
+        cache = tamarack.cache.SizedLRUCache(10)
+        cache.set('a', b'1234')
+        cache.set('a', b'12')
+        assert cache.nbytes == 2
+        cache.set('a', b'12345678901')
+        assert 'a' not in cache
+        assert cache.nbytes == 0
+
+    def test_expired_entry_released(self):
+        '''
+        Tests that expired entries no longer count toward the size
+        '''
+        timer = tests.helpers.FakeTimer()
+        cache = tamarack.cache.SizedLRUCache(10, ttl=5, timer=timer)
+        cache.set('a', b'1234')
+        timer.now = 5
+        assert cache.get('a') is None
+        assert cache.nbytes == 0
+        assert cache.pop('a') is None
+
+
+class TestTimedSet:
+    '''
+    TestCase for the TimedSet class
+    '''
+
+    def test_add(self):
+        '''
+        Tests that adding a key twice within the window is detected
+        '''
+        timer = tests.helpers.FakeTimer()
+        seen = tamarack.cache.TimedSet(10, timer=timer)
+        assert seen.add('foo') is True
+        assert seen.add('foo') is False
+        assert 'foo' in seen
+
+    def test_window(self):
+        '''
+        Tests that keys are forgotten after the window
+        '''
+        timer = tests.helpers.FakeTimer()
+        seen = tamarack.cache.TimedSet(10, timer=timer)
+        seen.add('foo')
+        timer.now = 5
+        seen.add('bar')
+        timer.now = 10
+        assert 'foo' not in seen
+        assert 'bar' in seen
+        assert len(seen) == 1
+
+    def test_maxsize(self):
+        '''
+        Tests that the oldest keys are forgotten when the set is full
+        '''
+        seen = tamarack.cache.TimedSet(10, maxsize=2, timer=tests.helpers.FakeTimer())
+        for key in ('a', 'b', 'c'):
+            seen.add(key)
+        assert 'a' not in seen
+        assert len(seen) == 2
+
+
+class TestSingleFlight(tornado.testing.AsyncTestCase):
+    '''
+    TestCase for the SingleFlight class
+    '''
+
+    @tornado.testing.gen_test
+    def test_shared_call(self):
+        '''
+        Tests that concurrent calls for the same key share one call
+        '''
+        calls = []
+
+        @gen.coroutine
+        def lookup(value):
+            '''
+            Records the call and returns the value.
+            '''
+            calls.append(value)
+            yield gen.moment
+            return value
+
+        flight = tamarack.cache.SingleFlight()
+        results = yield [flight.run('foo', lookup, 1),
+                         flight.run('foo', lookup, 2),
+                         flight.run('bar', lookup, 3)]
+        assert results == [1, 1, 3]
+        assert calls == [1, 3]
+
+        yield gen.moment
+        assert len(flight) == 0
+        result = yield flight.run('foo', lookup, 4)
+        assert result == 4
@@ -0,0 +1,192 @@
+# -*- coding: utf-8 -*-
+'''
+Tests for the functions in tamarack.codeowners.py
+'''
+
+# Import Tamarack libs
+import tamarack.codeowners
+
+
+class TestTranslate:
+    '''
+    TestCase for the pattern semantics of compiled rules
+    '''
+
+    @staticmethod
+    def _matches(pattern, file_name):
+        return tamarack.codeowners.Rule(0, pattern).matches(file_name)
+
+    def test_unanchored(self):
+        '''
+        Tests that patterns without a slash match at any depth
+        '''
+        assert self._matches('*.js', 'app.js')
+        assert self._matches('*.js', 'src/lib/app.js')
+        assert not self._matches('*.js', 'app.json')
+        assert self._matches('README.md', 'docs/README.md')
+        assert self._matches('*', 'any/file/at/all.txt')
+
+    def test_directory_names(self):
+        '''
+        Tests that a pattern without wildcards also owns a directory's files
+        '''
+        assert self._matches('apps/', 'apps/foo.py')
+        assert self._matches('apps/', 'src/apps/deep/foo.py')
+        assert not self._matches('apps/', 'apps')
+        assert self._matches('salt/cloud', 'salt/cloud/clouds/ec2.py')
+        assert self._matches('salt/state.py', 'salt/state.py')
+        assert not self._matches('salt/state.py', 'salt/state.pyc')
+
+    def test_anchored(self):
+        '''
+        Tests that patterns with a leading or middle slash are anchored at the root
+        '''
+        assert self._matches('/docs/', 'docs/a/b.md')
+        assert not self._matches('/docs/', 'src/docs/b.md')
+        assert self._matches('/build/logs/', 'build/logs/x/y.log')
+        assert not self._matches('doc/conf.py', 'src/doc/conf.py')
+
+    def test_single_star_not_nested(self):
+        '''
+        Tests that "docs/*" does not match files in subdirectories of docs
+        '''
+        assert self._matches('docs/*', 'docs/getting-started.md')
+        assert not self._matches('docs/*', 'docs/build-app/troubleshooting.md')
+        assert self._matches('doc/?onf.py', 'doc/conf.py')
+        assert not self._matches('doc/?onf.py', 'doc/x/conf.py')
+
+    def test_double_star(self):
+        '''
+        Tests the leading, trailing and middle "**" forms
+        '''
+        assert self._matches('**/logs', 'logs/a.log')
+        assert self._matches('**/logs', 'deeply/nested/logs/a.log')
+        assert self._matches('docs/**', 'docs/a/b/c.md')
+        assert not self._matches('docs/**', 'src/docs/a.md')
+        assert self._matches('a/**/b', 'a/b')
+        assert self._matches('a/**/b', 'a/x/y/b')
+        assert not self._matches('a/**/b', 'a/xb')
+        assert self._matches('tests/**/test_*.py', 'tests/unit/modules/test_reg.py')
+
+    def test_brackets_literal(self):
+        '''
+        Tests that brackets are not character ranges, as on GitHub
+        '''
+        assert self._matches('pkg/[ab].txt', 'pkg/[ab].txt')
+        assert not self._matches('pkg/[ab].txt', 'pkg/a.txt')
+
+
+class TestOwnersRules:
+    '''
+    TestCase for the OwnersRules class
+    '''
+    entries = [('*', ('@global',)),
+               ('*.sls', ('@saltstack/team-states',)),
+               ('salt/auth/', ('@saltstack/team-core', 'someone')),
+               ('salt/cloud/*.py', ('@saltstack/team-cloud',)),
+               ('tests/**/test_reg.py', ('@saltstack/team-windows',)),
+               ('/apps/', ('@octocat',)),
+               ('/apps/github', ()),
+               ('salt/state.py', ('@saltstack/team-state', '@saltstack/team-state'))]
+
+    def _owner(self, rules, file_name):
+        rule = rules.match(file_name)
+        return None if rule is None else rule.pattern
+
+    def test_last_match_wins(self):
+        '''
+        Tests that the last matching rule decides each file's owners
+        '''
+        rules = tamarack.codeowners.OwnersRules(self.entries)
+        assert self._owner(rules, 'README.rst') == '*'
+        assert self._owner(rules, 'salt/auth/pki.py') == 'salt/auth/'
+        assert self._owner(rules, 'salt/auth/sub/top.sls') == 'salt/auth/'
+        assert self._owner(rules, 'salt/states/top.sls') == '*.sls'
+        assert self._owner(rules, 'salt/cloud/clouds/ec2.py') == '*'
+        assert self._owner(rules, 'salt/cloud/libcloud.py') == 'salt/cloud/*.py'
+        assert self._owner(rules, 'tests/unit/modules/test_reg.py') == \
+            'tests/**/test_reg.py'
+        assert self._owner(rules, 'apps/github/app.py') == '/apps/github'
+        assert self._owner(rules, 'apps/other/app.py') == '/apps/'
+
+    def test_owners_deduplicated(self):
+        '''
+        Tests that owners are returned once, in the order they are found, and
+        that a rule without owners leaves its files unowned
+        '''
+        rules = tamarack.codeowners.OwnersRules(self.entries)
+        assert rules.owners(['salt/state.py', 'salt/auth/a.py', 'salt/auth/b.py',
+                             'apps/github/app.py']) == \
+            ['@saltstack/team-state', '@saltstack/team-core', 'someone']
+
+    def test_matches_reverse_scan(self):
+        '''
+        Tests that the indexed lookup finds the same rule as trying every rule
+        from the last one to the first
+        '''
+        rules = tamarack.codeowners.OwnersRules(self.entries)
+        files = ['README.rst', 'salt/auth/pki.py', 'salt/states/top.sls',
+                 'salt/cloud/libcloud.py', 'tests/unit/test_reg.py',
+                 'apps/github/app.py', 'apps/x', 'src/apps/x', 'salt/state.py']
+        for file_name in files:
+            expected = next((rule for rule in reversed(rules.rules)
+                             if rule.matches(file_name)), None)
+            assert rules.match(file_name) is expected
+
+    def test_no_rules(self):
+        '''
+        Tests that nothing matches an empty rule set
+        '''
+        rules = tamarack.codeowners.OwnersRules([])
+        assert rules.match('README.rst') is None
+        assert not rules.owners(['README.rst'])
+
+
+class TestParseEntries:  # pylint: disable=too-few-public-methods
+    '''
+    TestCase for the parse_entries function
+    '''
+
+    def test_parsed(self):
+        '''
+        Tests that multiple owners, inline comments and ownerless rules are parsed,
+        and that comments, blank lines and negated patterns are ignored
+        '''
+        contents = '# Team State\n' \
+                   'salt/state.py       @saltstack/team-state  # state module\n' \
+                   '\n' \
+                   '   \n' \
+                   '/scripts/  @doctocat @octocat user@example.com\n' \
+                   '/apps/github\n' \
+                   '!salt/cloud/\n'
+        assert tamarack.codeowners.parse_entries(contents) == [
+            ('salt/state.py', ('@saltstack/team-state',)),
+            ('/scripts/', ('@doctocat', '@octocat', 'user@example.com')),
+            ('/apps/github', ()),
+        ]
+
+
+class TestCompileRules:
+    '''
+    TestCase for the compile_rules function
+    '''
+    owners_content = '# Team State\n' \
+                     'salt/state.py       @saltstack/team-state\n' \
+                     '\n' \
+                     'salt/auth/*         @saltstack/team-core\n'
+
+    def test_compiled(self):
+        '''
+        Tests that comments and blank lines are ignored
+        '''
+        rules = tamarack.codeowners.compile_rules(self.owners_content)
+        assert [(rule.pattern, rule.owners) for rule in rules.rules] == \
+            [('salt/state.py', ('@saltstack/team-state',)),
+             ('salt/auth/*', ('@saltstack/team-core',))]
+
+    def test_memoized(self):
+        '''
+        Tests that the same CODEOWNERS contents are only compiled once
+        '''
+        rules = tamarack.codeowners.compile_rules(self.owners_content)
+        assert tamarack.codeowners.compile_rules(self.owners_content) is rules
@@ -0,0 +1,109 @@
+# -*- coding: utf-8 -*-
+'''
+Tests for the functions in tamarack.event.py
+'''
+
+# Import Python libs
+import json
+
+# Import Tamarack libs
+import tamarack.event
+
+
+class TestEvent:
+    '''
+    TestCase for the Event class
+    '''
+    payload = {
+        'action': 'opened',
+        'number': 42,
+        'pull_request': {
+            'url': 'https://api.github.com/repos/foo/bar/pulls/42',
+            'issue_url': 'https://api.github.com/repos/foo/bar/issues/42',
+            'title': 'Fix the thing',
+            'body': 'A long description',
+            'user': {'login': 'octocat', 'id': 1, 'avatar_url': 'https://example.com'},
+            'base': {'ref': 'develop', 'sha': 'abc', 'repo': {'id': 2}},
+            'head': {'ref': 'fix', 'sha': 'def', 'repo': {'id': 5}},
+            'changed_files': 3,
+            'requested_reviewers': [{'login': 'rallytime', 'id': 3}],
+            'requested_teams': [{'slug': 'team-core', 'id': 4, 'name': 'Core'}],
+        },
+        'repository': {'full_name': 'foo/bar',
+                       'url': 'https://api.github.com/repos/foo/bar',
+                       'description': 'The bar repository'},
+        'sender': {'login': 'octocat'},
+    }
+
+    def _event(self):
+        return tamarack.event.Event.from_body(
+            json.dumps(self.payload).encode('utf-8'), name='pull_request',
+            delivery_id='abc')
+
+    def test_routed_fields(self):
+        '''
+        Tests that the routed fields are kept in compact form
+        '''
+        event = self._event()
+        assert event.action == 'opened'
+        assert event.number == 42
+        assert event.get('pull_request') == {
+            'url': 'https://api.github.com/repos/foo/bar/pulls/42',
+            'issue_url': 'https://api.github.com/repos/foo/bar/issues/42',
+            'title': 'Fix the thing',
+            'user': {'login': 'octocat'},
+            'base': {'ref': 'develop', 'sha': 'abc'},
+            'head': {'sha': 'def'},
+            'changed_files': 3,
+            'requested_reviewers': [{'login': 'rallytime'}],
+            'requested_teams': [{'slug': 'team-core'}]}
+        assert event.get('repository') == {
+            'full_name': 'foo/bar', 'url': 'https://api.github.com/repos/foo/bar'}
+
+    def test_defaults(self):
+        '''
+        Tests that missing fields return the default
+        '''
+        event = self._event()
+        assert event.get('ref_type') is None
+        assert event.get('ref', 'foo') == 'foo'
+
+    def test_other_fields_dropped(self):
+        '''
+        Tests that fields that are not kept are missing
+        '''
+        event = self._event()
+        assert event.get('sender') is None
+        assert event.get('sender', {}) == {}
+
+    def test_push_commits(self):
+        '''
+        Tests that the commits of a push event are reduced to their paths
+        '''
+        payload = {'ref': 'refs/heads/develop', 'deleted': False,
+                   'commits': [{'id': 'abc', 'message': 'Fix the thing',
+                                'added': ['a.py'], 'modified': ['.github/CODEOWNERS'],
+                                'removed': []}]}
+        event = tamarack.event.Event.from_body(json.dumps(payload).encode('utf-8'),
+                                               name='push')
+        assert event.get('ref') == 'refs/heads/develop'
+        assert event.get('deleted') is False
+        assert event.get('commits') == [
+            {'added': ['a.py'], 'modified': ['.github/CODEOWNERS'], 'removed': []}]
+
+    def test_no_wanted_fields(self):
+        '''
+        Tests that nested objects holding none of the kept fields are dropped
+        '''
+        payload = {'ref': 'refs/heads/develop', 'repository': {'id': 2},
+                   'commits': [{'id': 'abc'}, {'id': 'def', 'added': ['a.py']}]}
+        event = tamarack.event.Event.from_body(json.dumps(payload).encode('utf-8'),
+                                               name='push')
+        assert event.get('repository') is None
+        assert event.get('commits') == [{'added': ['a.py']}]
+
+    def test_no_slot_dict(self):
+        '''
+        Tests that events do not carry a per-instance dictionary
+        '''
+        assert not hasattr(self._event(), '__dict__')
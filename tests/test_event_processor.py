@@ -4,15 +4,18 @@ Tests for the functions in tamarack.event_processor.py
 '''
 
 # Import Python libs
+from unittest.mock import MagicMock, patch
 import os
 import pytest
 
 # Import Tornado libs
+from tornado import gen
 import tornado.testing
 import tornado.web
 
 # Import Tamarack libs
 import tamarack.event_processor
+import tests.helpers
 
 GITHUB_TEST_TOKEN = os.environ.get('GITHUB_TEST_TOKEN') or ''
 
@@ -74,6 +77,17 @@ class TestHandlePullRequest(tornado.testing.AsyncTestCase):
         ret = yield tamarack.event_processor.handle_pull_request(event_data, '')
         assert ret is None
 
+    def test_new_branch_buffered(self):
+        '''
+        Tests that the Slack message for a new branch is queued on the buffer
+        '''
+        event_data = {'ref_type': 'branch',
+                      'ref': 'test-branch-name'}
+        with patch('tamarack.slack.notify') as mock_notify:
+            tamarack.event_processor.handle_create_event(event_data)
+        attachment = mock_notify.call_args[0][0]
+        assert 'test-branch-name' in attachment['fields'][0]['value']
+
     @tornado.testing.gen_test
     def test_unknown_event(self):
         '''
@@ -85,12 +99,109 @@ class TestHandlePullRequest(tornado.testing.AsyncTestCase):
         assert ret is None
 
 
+class TestCoalescing(tornado.testing.AsyncTestCase):
+    '''
+    TestCase for the coalescing of events for the same pull request
+    '''
+
+    @tornado.testing.gen_test
+    def test_events_coalesced(self):
+        '''
+        Tests that events arriving while a PR is processed are merged into one
+        decision
+        '''
+        calls = []
+
+        @gen.coroutine
+        def process(event_data, actions, token, trace=None):  # pylint: disable=unused-argument
+            '''
+            Records the decisions made.
+            '''
+            calls.append((event_data['pull_request']['title'], actions))
+            yield gen.sleep(0.01)
+
+        def event(action, title):
+            '''
+            Returns a pull request event.
+            '''
+            return {'number': 1, 'action': action,
+                    'repository': {'full_name': 'foo/bar'},
+                    'pull_request': {'title': title}}
+
+        with patch('tamarack.event_processor.process_pull_request', process):
+            yield [
+                tamarack.event_processor.handle_pull_request(event('opened', 'a'), ''),
+                tamarack.event_processor.handle_pull_request(event('synchronize', 'b'), ''),
+                tamarack.event_processor.handle_pull_request(event('labeled', 'c'), ''),
+            ]
+
+        assert calls == [('a', ['opened']), ('c', ['synchronize', 'labeled'])]
+        assert not tamarack.event_processor.PENDING_PULL_REQUESTS
+
+    @tornado.testing.gen_test
+    def test_failed_decision(self):
+        '''
+        Tests that events coalesced while a decision fails are still processed
+        '''
+        calls = []
+
+        @gen.coroutine
+        def process(event_data, actions, token, trace=None):  # pylint: disable=unused-argument
+            '''
+            Records the decisions made and fails the first one.
+            '''
+            calls.append(actions)
+            yield gen.sleep(0.01)
+            if len(calls) == 1:
+                raise tornado.web.HTTPError(502)
+
+        def event(action):
+            '''
+            Returns a pull request event.
+            '''
+            return {'number': 1, 'action': action, 'repository': {'full_name': 'foo/bar'},
+                    'pull_request': {'title': action}}
+
+        with patch('tamarack.event_processor.process_pull_request', process):
+            first = tamarack.event_processor.handle_pull_request(event('opened'), '')
+            second = tamarack.event_processor.handle_pull_request(event('synchronize'), '')
+            with pytest.raises(tornado.web.HTTPError):
+                yield first
+            yield gen.with_timeout(self.io_loop.time() + 1, second)
+
+        assert calls == [['opened'], ['synchronize']]
+        assert not tamarack.event_processor.PENDING_PULL_REQUESTS
+
+    @tornado.testing.gen_test
+    def test_other_prs_not_coalesced(self):
+        '''
+        Tests that events for different pull requests are processed separately
+        '''
+        calls = []
+
+        @gen.coroutine
+        def process(event_data, actions, token, trace=None):  # pylint: disable=unused-argument
+            '''
+            Records the decisions made.
+            '''
+            calls.append((event_data['number'], actions))
+            yield gen.moment
+
+        with patch('tamarack.event_processor.process_pull_request', process):
+            yield [
+                tamarack.event_processor.handle_pull_request(
+                    {'number': num, 'action': 'opened'}, '')
+                for num in (1, 2)
+            ]
+
+        assert sorted(calls) == [(1, ['opened']), (2, ['opened'])]
+
+
 class TestHandleCreateEvent(tornado.testing.AsyncTestCase):
     '''
     TestCase for the handle_create_event function
     '''
 
-    @tornado.testing.gen_test
     def test_new_branch(self):
         '''
         Tests that a branch pushed to GitHub calls sends a slack message
@@ -100,18 +211,59 @@ class TestHandleCreateEvent(tornado.testing.AsyncTestCase):
 
         event_data = {'ref_type': 'branch',
                       'ref': 'test-branch-name'}
-        ret = yield tamarack.event_processor.handle_create_event(event_data)
-        assert ret is None
+        ret = tamarack.event_processor.handle_create_event(event_data)
+        assert not ret.done()
 
         # Reset variables for clean tests
         tamarack.slack.SLACK_WEBHOOK_URL = slack_url
 
-    @tornado.testing.gen_test
     def test_unknown_event(self):
         '''
         Tests that create events other than "branch" are ignored.
         '''
         event_data = {'ref_type': 'foo',
                       'ref': 'bar'}
-        ret = yield tamarack.event_processor.handle_create_event(event_data)
+        ret = tamarack.event_processor.handle_create_event(event_data)
         assert ret is None
+
+
+class TestHandlePushEvent(tornado.testing.AsyncTestCase):
+    '''
+    TestCase for the handle_push_event function
+    '''
+
+    def _event(self, ref='refs/heads/develop', files=('.github/CODEOWNERS',)):
+        return {'ref': ref,
+                'repository': {'full_name': 'saltstack/salt',
+                               'url': 'https://github.com/saltstack/salt'},
+                'commits': [{'added': [], 'removed': [], 'modified': ['README.md']},
+                            {'added': [], 'removed': [], 'modified': list(files)}]}
+
+    @tornado.testing.gen_test
+    def test_owners_refreshed(self):
+        '''
+        Tests that a push changing CODEOWNERS on a base branch refreshes it
+        '''
+        refresh = MagicMock(return_value=tests.helpers.future(None))
+        with patch('tamarack.pull_request.OWNERS_BRANCHES', ['develop']), \
+                patch('tamarack.pull_request.refresh_owners_file', refresh):
+            ret = yield tamarack.event_processor.handle_push_event(self._event(), 'token')
+        assert ret is True
+        refresh.assert_called_once_with('https://api.github.com/repos/saltstack/salt',
+                                        'develop', 'token', trace=None)
+
+    @tornado.testing.gen_test
+    def test_skipped(self):
+        '''
+        Tests that pushes to other branches, to tags, or not changing CODEOWNERS
+        are ignored
+        '''
+        refresh = MagicMock(return_value=tests.helpers.future(None))
+        with patch('tamarack.pull_request.OWNERS_BRANCHES', ['develop']), \
+                patch('tamarack.pull_request.refresh_owners_file', refresh):
+            for event_data in (self._event(ref='refs/heads/feature'),
+                               self._event(ref='refs/tags/v1.0'),
+                               self._event(files=['salt/state.py'])):
+                ret = yield tamarack.event_processor.handle_push_event(event_data, 'token')
+                assert ret is False
+        assert not refresh.called
@@ -0,0 +1,80 @@
+# -*- coding: utf-8 -*-
+'''
+Tests for the functions in tamarack.executor.py
+'''
+
+# Import Python libs
+import concurrent.futures
+import threading
+
+# Import Tornado libs
+import tornado.testing
+
+# Import Tamarack libs
+import tamarack.executor
+
+
+def _thread_name(value):
+    return value, threading.current_thread().name
+
+
+def _fail():
+    raise ValueError('boom')
+
+
+class TestRun(tornado.testing.AsyncTestCase):
+    '''
+    TestCase for the run function
+    '''
+
+    def tearDown(self):
+        executor = tamarack.executor.get_executor()
+        if executor is not None:
+            executor.shutdown()
+        tamarack.executor.set_executor(tamarack.executor._UNSET)  # pylint: disable=W0212
+        super().tearDown()
+
+    @tornado.testing.gen_test
+    def test_thread_pool(self):
+        '''
+        Tests that work is run in a thread of the pool
+        '''
+        tamarack.executor.set_executor(tamarack.executor.make_executor('thread', 1))
+        value, name = yield tamarack.executor.run(_thread_name, 'foo')
+        assert value == 'foo'
+        assert name != threading.current_thread().name
+
+    @tornado.testing.gen_test
+    def test_process_pool(self):
+        '''
+        Tests that work can be run in a process pool
+        '''
+        executor = tamarack.executor.make_executor('process', 1)
+        assert isinstance(executor, concurrent.futures.ProcessPoolExecutor)
+        tamarack.executor.set_executor(executor)
+        value, _ = yield tamarack.executor.run(_thread_name, 'foo')
+        assert value == 'foo'
+
+    @tornado.testing.gen_test
+    def test_inline(self):
+        '''
+        Tests that work is run right away when the executor is inline
+        '''
+        tamarack.executor.set_executor(tamarack.executor.make_executor('inline'))
+        future = tamarack.executor.run(_thread_name, 'foo')
+        assert future.done()
+        value, name = yield future
+        assert (value, name) == ('foo', threading.current_thread().name)
+
+    @tornado.testing.gen_test
+    def test_inline_exception(self):
+        '''
+        Tests that an exception raised inline is set on the future
+        '''
+        tamarack.executor.set_executor(None)
+        try:
+            yield tamarack.executor.run(_fail)
+        except ValueError as err:
+            assert str(err) == 'boom'
+        else:
+            assert False, 'ValueError not raised'
@@ -4,10 +4,16 @@ Tests for the functions in tamarack.github.py
 '''
 
 # Import Python libs
+import io
+import json
 import os
+import time
 
 # Import Tornado libs
+import tornado.httpclient
+import tornado.httputil
 import tornado.testing
+import tornado.web
 
 # Import Tamarack libs
 import tamarack.github
@@ -29,3 +35,487 @@ class TestAPIRequest(tornado.testing.AsyncTestCase):
             'https://api.github.com/repos/rallytime/tamarack/pulls/19',
             GITHUB_TEST_TOKEN)
         assert ret['title'] == 'Add first tests!'
+
+
+class FilesHandler(tornado.web.RequestHandler):  # pylint: disable=abstract-method
+    '''
+    Handler serving a paginated listing of 250 files, 100 per page. Tornado adds
+    an ETag to each page and answers a matching If-None-Match with a 304.
+    '''
+    num_files = 250
+    revalidated = 0
+
+    def get(self):
+        '''
+        Serves a page of the listing.
+        '''
+        if self.request.headers.get('If-None-Match'):
+            FilesHandler.revalidated += 1
+        page = int(self.get_argument('page', 1))
+        per_page = int(self.get_argument('per_page', 30))
+        last = (self.num_files + per_page - 1) // per_page
+        if page < last:
+            base = self.request.protocol + '://' + self.request.host + self.request.path
+            self.set_header('Link', '<{0}?per_page={1}&page={2}>; rel="next", '
+                                    '<{0}?per_page={1}&page={3}>; rel="last"'.format(
+                                        base, per_page, page + 1, last))
+        start = (page - 1) * per_page
+        end = min(start + per_page, self.num_files)
+        self.write(json.dumps([{'filename': 'file{0}.py'.format(i)}
+                               for i in range(start, end)]))
+
+
+class TestPageIterator(tornado.testing.AsyncHTTPTestCase):
+    '''
+    TestCase for the PageIterator class
+    '''
+
+    def get_app(self):
+        return tornado.web.Application([('/files', FilesHandler)])
+
+    @tornado.testing.gen_test
+    def test_all_pages(self):
+        '''
+        Tests that every page of the listing is returned
+        '''
+        pages = tamarack.github.PageIterator(self.get_url('/files'))
+        seen = {}
+        while not pages.done():
+            items = yield pages.next()
+            seen[pages.page] = items
+
+        assert sorted(seen) == [1, 2, 3]
+        assert [len(seen[page]) for page in (1, 2, 3)] == [100, 100, 50]
+        assert seen[3][-1] == {'filename': 'file249.py'}
+
+    @tornado.testing.gen_test
+    def test_single_page(self):
+        '''
+        Tests that a listing without a Link header is a single page
+        '''
+        pages = tamarack.github.PageIterator(self.get_url('/files'), per_page=300)
+        items = yield pages.next()
+        assert len(items) == 250
+        assert pages.done()
+
+    @tornado.testing.gen_test
+    def test_pages_revalidated(self):
+        '''
+        Tests that pages fetched again are revalidated and served from the cache
+        '''
+        tamarack.github.RESPONSE_CACHE.clear()
+        FilesHandler.revalidated = 0
+        stats = tamarack.github.cache_stats()
+        for _ in range(2):
+            pages = tamarack.github.PageIterator(self.get_url('/files'))
+            seen = {}
+            while not pages.done():
+                items = yield pages.next()
+                seen[pages.page] = items
+            assert [len(seen[page]) for page in (1, 2, 3)] == [100, 100, 50]
+
+        assert FilesHandler.revalidated == 3
+        assert tamarack.github.cache_stats()['not_modified'] == stats['not_modified'] + 3
+        tamarack.github.RESPONSE_CACHE.clear()
+
+
+class TestEndpoint:  # pylint: disable=too-few-public-methods
+    '''
+    TestCase for the _endpoint function
+    '''
+
+    def test_placeholders(self):
+        '''
+        Tests that owners, repositories and numbers are replaced in metric labels
+        '''
+        assert tamarack.github._endpoint(
+            'https://api.github.com/repos/saltstack/salt/pulls/49517/files?page=2'
+        ) == '/repos/:owner/:repo/pulls/:number/files'
+        assert tamarack.github._endpoint('https://api.github.com/rate_limit') == \
+            '/rate_limit'
+
+
+class TestParseLinks:
+    '''
+    TestCase for the _parse_links function
+    '''
+
+    def test_links(self):
+        '''
+        Tests that the urls of a Link header are mapped to their rel names
+        '''
+        header = '<https://api.github.com/x?page=2>; rel="next", ' \
+                 '<https://api.github.com/x?page=5>; rel="last"'
+        assert tamarack.github._parse_links(header) == {
+            'next': 'https://api.github.com/x?page=2',
+            'last': 'https://api.github.com/x?page=5'}
+
+    def test_no_header(self):
+        '''
+        Tests that a missing Link header has no links
+        '''
+        assert tamarack.github._parse_links(None) == {}
+
+
+class LimitedHandler(tornado.web.RequestHandler):  # pylint: disable=abstract-method
+    '''
+    Handler that rejects its first request with a secondary rate limit error.
+    '''
+    calls = 0
+
+    def get(self):
+        '''
+        Serves the request, unless it is the first one.
+        '''
+        LimitedHandler.calls += 1
+        self.set_header('X-RateLimit-Limit', '5000')
+        self.set_header('X-RateLimit-Remaining', '4000')
+        self.set_header('X-RateLimit-Reset', str(int(time.time()) + 3600))
+        if LimitedHandler.calls == 1:
+            self.set_header('Retry-After', '0')
+            self.set_status(429)
+            self.write('{"message": "You have exceeded a secondary rate limit."}')
+            return
+        self.write('{"ok": true}')
+
+
+class AuthorizationHandler(tornado.web.RequestHandler):  # pylint: disable=abstract-method
+    '''
+    Handler that echoes the Authorization header and query string it got.
+    '''
+
+    def get(self):
+        '''
+        Echoes the request.
+        '''
+        self.write({'authorization': self.request.headers.get('Authorization'),
+                    'query': self.request.query})
+
+
+class TestFetch(tornado.testing.AsyncHTTPTestCase):
+    '''
+    TestCase for the fetch function
+    '''
+
+    def get_app(self):
+        return tornado.web.Application([('/limited', LimitedHandler),
+                                        ('/auth', AuthorizationHandler)])
+
+    @tornado.testing.gen_test
+    def test_authorization_header(self):
+        '''
+        Tests that the token is sent in the Authorization header, not the url
+        '''
+        ret = yield tamarack.github.api_request(self.get_url('/auth'), 'abc')
+        assert ret == {'authorization': 'token abc', 'query': ''}
+
+    @tornado.testing.gen_test
+    def test_rate_limited_retry(self):
+        '''
+        Tests that a rate limited request is retried and the quota is tracked
+        '''
+        LimitedHandler.calls = 0
+        ret = yield tamarack.github.api_request(self.get_url('/limited'))
+        assert ret == {'ok': True}
+        assert LimitedHandler.calls == 2
+        assert tamarack.github.get_rate_limiter().remaining == 4000
+
+
+class ETagHandler(tornado.web.RequestHandler):  # pylint: disable=abstract-method
+    '''
+    Handler serving a JSON body. Tornado adds an ETag to the response and answers
+    a matching If-None-Match with a 304.
+    '''
+    calls = 0
+    body = {'version': 1}
+
+    def get(self):
+        '''
+        Serves the body.
+        '''
+        ETagHandler.calls += 1
+        self.write(ETagHandler.body)
+
+
+class TestResponseCache(tornado.testing.AsyncHTTPTestCase):
+    '''
+    TestCase for the GET response cache of the fetch function
+    '''
+
+    def get_app(self):
+        return tornado.web.Application([('/etag', ETagHandler)])
+
+    def setUp(self):
+        super().setUp()
+        tamarack.github.RESPONSE_CACHE.clear()
+        ETagHandler.calls = 0
+        ETagHandler.body = {'version': 1}
+
+    def tearDown(self):
+        tamarack.github.RESPONSE_CACHE.clear()
+        super().tearDown()
+
+    @tornado.testing.gen_test
+    def test_not_modified(self):
+        '''
+        Tests that a cached response is revalidated and reused on a 304
+        '''
+        stats = tamarack.github.cache_stats()
+        first = yield tamarack.github.api_request(self.get_url('/etag'), 'token')
+        second = yield tamarack.github.api_request(self.get_url('/etag'), 'token')
+        assert first == second == {'version': 1}
+        assert ETagHandler.calls == 2
+        assert tamarack.github.cache_stats()['not_modified'] == stats['not_modified'] + 1
+        assert tamarack.github.cache_stats()['entries'] == 1
+        assert self.get_url('/etag') in tamarack.github.RESPONSE_CACHE
+
+    @tornado.testing.gen_test
+    def test_modified(self):
+        '''
+        Tests that a changed resource replaces the cached response
+        '''
+        yield tamarack.github.api_request(self.get_url('/etag'))
+        ETagHandler.body = {'version': 2}
+        ret = yield tamarack.github.api_request(self.get_url('/etag'))
+        assert ret == {'version': 2}
+        cached = tamarack.github.RESPONSE_CACHE.get(self.get_url('/etag'))
+        assert json.loads(cached.body) == {'version': 2}
+
+
+class GraphQLHandler(tornado.web.RequestHandler):  # pylint: disable=abstract-method
+    '''
+    Handler answering GraphQL queries for a pull request of three files, two
+    per page, or with an error for an unknown repository.
+    '''
+    queries = []
+
+    def post(self):
+        '''
+        Answers a query.
+        '''
+        variables = json.loads(self.request.body)['variables']
+        GraphQLHandler.queries.append(variables)
+        if variables['name'] != 'salt':
+            self.write({'data': None,
+                        'errors': [{'message': 'Could not resolve to a Repository'}]})
+            return
+        last_page = {'hasNextPage': False, 'endCursor': None}
+        if 'withReviews' in variables:
+            assert not variables['withRequests']
+            assert variables['reviewsCursor'] == '3'
+            reviews = {'pageInfo': last_page, 'nodes': [{'author': {'login': 'cachedout'}}]}
+            self.write({'data': {'repository': {'pullRequest': {'reviews': reviews}}}})
+            return
+
+        start = int(variables['cursor'] or 0)
+        files = {'pageInfo': {'hasNextPage': start == 0, 'endCursor': '2'},
+                 'nodes': [{'path': path} for path in ['a.py', 'b.py', 'c.py'][start:start + 2]]}
+        repository = {'pullRequest': {'files': files}}
+        if 'expression' in variables:
+            repository['object'] = {'oid': 'abc', 'isTruncated': False,
+                                    'text': '* @saltstack/team-core\n'}
+            repository['pullRequest']['reviewRequests'] = {'pageInfo': last_page, 'nodes': [
+                {'requestedReviewer': {'login': 'rallytime'}},
+                {'requestedReviewer': {'combinedSlug': 'saltstack/team-core'}},
+            ]}
+            repository['pullRequest']['reviews'] = {
+                'pageInfo': {'hasNextPage': True, 'endCursor': '3'},
+                'nodes': [{'author': {'login': 'twangboy'}}, {'author': None},
+                          {'author': {'login': 'twangboy'}}]
+            }
+        self.write({'data': {'repository': repository}})
+
+
+class TestGraphQL(tornado.testing.AsyncHTTPTestCase):
+    '''
+    TestCase for the get_review_data and graphql functions
+    '''
+
+    def get_app(self):
+        return tornado.web.Application([('/graphql', GraphQLHandler)])
+
+    def setUp(self):
+        super().setUp()
+        GraphQLHandler.queries = []
+
+    @tornado.testing.gen_test
+    def test_review_data(self):
+        '''
+        Tests that the files, requested reviewers and reviews of every page
+        and the CODEOWNERS file are returned
+        '''
+        ret = yield tamarack.github.get_review_data(
+            self.get_url('/repos/saltstack/salt'), 1, 'develop', '.github/CODEOWNERS', 'abc'
+        )
+        assert ret == tamarack.github.ReviewData(
+            files=['a.py', 'b.py', 'c.py'], owners_sha='abc',
+            owners_text='* @saltstack/team-core\n', owners_truncated=False,
+            requested_reviewers=['rallytime', 'saltstack/team-core'],
+            reviewed_by=['twangboy', 'cachedout']
+        )
+        assert GraphQLHandler.queries[0]['expression'] == 'develop:.github/CODEOWNERS'
+        assert len(GraphQLHandler.queries) == 3
+
+    @tornado.testing.gen_test
+    def test_errors(self):
+        '''
+        Tests that errors in the response are raised
+        '''
+        try:
+            yield tamarack.github.get_review_data(
+                self.get_url('/repos/saltstack/missing'), 1, None, '.github/CODEOWNERS', 'abc'
+            )
+        except tornado.web.HTTPError as err:
+            assert err.status_code == 502
+            assert 'Could not resolve' in err.log_message % err.args
+        else:
+            assert False
+
+    def test_graphql_url(self):
+        '''
+        Tests the GraphQL endpoints of github.com and GitHub Enterprise
+        '''
+        assert tamarack.github.graphql_url(
+            'https://api.github.com/repos/saltstack/salt') == 'https://api.github.com/graphql'
+        assert tamarack.github.graphql_url(
+            'https://github.example.com/api/v3/repos/saltstack/salt'
+        ) == 'https://github.example.com/api/graphql'
+
+
+class TestPickReadToken(tornado.testing.AsyncTestCase):
+    '''
+    TestCase for the pick_read_token function
+    '''
+
+    def setUp(self):
+        super().setUp()
+        self.read_tokens = tamarack.github.GITHUB_READ_TOKENS
+        tamarack.github.GITHUB_READ_TOKENS = ['read-1', 'read-2']
+
+    def tearDown(self):
+        tamarack.github.GITHUB_READ_TOKENS = self.read_tokens
+        super().tearDown()
+
+    def test_unknown_quota_first(self):
+        '''
+        Tests that a token whose quota is not known yet is picked
+        '''
+        tamarack.github.get_rate_limiter('main').remaining = 10
+        assert tamarack.github.pick_read_token('main') == 'read-1'
+
+    def test_most_remaining(self):
+        '''
+        Tests that the token with the most quota left is picked
+        '''
+        for token, remaining in (('main', 10), ('read-1', 3000), ('read-2', 4000)):
+            tamarack.github.get_rate_limiter(token).remaining = remaining
+        assert tamarack.github.pick_read_token('main') == 'read-2'
+        assert len(tamarack.github.rate_limiters()) >= 3
+
+
+class TestRateLimiter(tornado.testing.AsyncTestCase):
+    '''
+    TestCase for the RateLimiter class
+    '''
+
+    @tornado.testing.gen_test
+    def test_token_bucket(self):
+        '''
+        Tests that requests beyond the burst are paced at the configured rate
+        '''
+        limiter = tamarack.github.RateLimiter(rate=100, burst=2)
+        start = time.time()
+        yield [limiter.acquire() for _ in range(6)]
+        assert time.time() - start >= 0.03
+        assert limiter.throttled == 4
+
+    @tornado.testing.gen_test
+    def test_writes_first(self):
+        '''
+        Tests that waiting writes are let through before waiting reads
+        '''
+        order = []
+        limiter = tamarack.github.RateLimiter(rate=50, burst=1)
+        yield limiter.acquire()
+
+        read = limiter.acquire(tamarack.github.PRIORITY_READ)
+        read.add_done_callback(lambda future: order.append('read'))
+        write = limiter.acquire(tamarack.github.PRIORITY_WRITE)
+        write.add_done_callback(lambda future: order.append('write'))
+        yield [read, write]
+        assert order == ['write', 'read']
+
+    def test_write_reserve(self):
+        '''
+        Tests that reads wait for the reset once only the write reserve is left
+        '''
+        limiter = tamarack.github.RateLimiter(write_reserve=50)
+        limiter.update({'X-RateLimit-Limit': '5000',
+                        'X-RateLimit-Remaining': '40',
+                        'X-RateLimit-Reset': str(int(time.time()) + 100)})
+        assert limiter._delay(tamarack.github.PRIORITY_READ) > 90
+        assert limiter._delay(tamarack.github.PRIORITY_WRITE) == 0
+
+    def test_paced_to_reset(self):
+        '''
+        Tests that the rate drops when little of the quota is left
+        '''
+        limiter = tamarack.github.RateLimiter(rate=10, pacing_fraction=0.2)
+        now = time.time()
+        limiter.update({'X-RateLimit-Limit': '5000',
+                        'X-RateLimit-Remaining': '4000',
+                        'X-RateLimit-Reset': str(int(now) + 1000)})
+        assert limiter._rate(now) == 10
+        limiter.update({'X-RateLimit-Remaining': '500'})
+        assert 0.4 < limiter._rate(now) < 0.6
+
+    def test_resources(self):
+        '''
+        Tests that the REST and GraphQL quotas of a token are tracked apart
+        '''
+        core = tamarack.github.get_rate_limiter('main')
+        graphql = tamarack.github.get_rate_limiter('main', 'graphql')
+        assert core is not graphql
+        assert graphql.write_reserve == 0
+
+        headers = {'X-RateLimit-Resource': 'graphql', 'X-RateLimit-Limit': '5000',
+                   'X-RateLimit-Remaining': '10'}
+        core.update(headers)
+        graphql.update(headers)
+        assert core.remaining is None
+        assert graphql.remaining == 10
+
+
+class TestRetryDelay:
+    '''
+    TestCase for the _retry_delay function
+    '''
+
+    @staticmethod
+    def _error(code, headers=None, body=b''):
+        request = tornado.httpclient.HTTPRequest('https://api.github.com')
+        response = tornado.httpclient.HTTPResponse(
+            request, code, headers=tornado.httputil.HTTPHeaders(headers or {}),
+            buffer=io.BytesIO(body))
+        return tornado.httpclient.HTTPError(code, response=response)
+
+    def test_retry_after(self):
+        '''
+        Tests that the Retry-After header is honored
+        '''
+        err = self._error(403, {'Retry-After': '30'})
+        assert tamarack.github._retry_delay(err, 0) == 30
+
+    def test_backoff(self):
+        '''
+        Tests that 429s without headers back off exponentially with jitter
+        '''
+        err = self._error(429)
+        assert 4 <= tamarack.github._retry_delay(err, 2) <= 8
+
+    def test_not_retried(self):
+        '''
+        Tests that permission errors and other failures are not retried
+        '''
+        assert tamarack.github._retry_delay(self._error(403, body=b'Forbidden'), 0) is None
+        assert tamarack.github._retry_delay(self._error(500), 0) is None
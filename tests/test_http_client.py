@@ -0,0 +1,97 @@
+# -*- coding: utf-8 -*-
+'''
+Tests for the functions in tamarack.http_client.py
+'''
+
+# Import Python libs
+from unittest.mock import patch
+
+# Import Tornado libs
+from tornado import gen
+import tornado.httpclient
+import tornado.testing
+import tornado.web
+
+# Import Tamarack libs
+import tamarack.http_client
+
+
+class SlowHandler(tornado.web.RequestHandler):  # pylint: disable=abstract-method
+    '''
+    Handler that keeps track of how many requests it serves concurrently.
+    '''
+    active = 0
+    peak = 0
+
+    @gen.coroutine
+    def get(self):
+        '''
+        Serves the request after a short sleep.
+        '''
+        SlowHandler.active += 1
+        SlowHandler.peak = max(SlowHandler.peak, SlowHandler.active)
+        yield gen.sleep(0.01)
+        SlowHandler.active -= 1
+        self.write('ok')
+
+
+class TestHTTPClient(tornado.testing.AsyncHTTPTestCase):
+    '''
+    TestCase for the HTTPClient class
+    '''
+
+    def get_app(self):
+        return tornado.web.Application([('/slow', SlowHandler)])
+
+    @tornado.testing.gen_test
+    def test_per_host_limit(self):
+        '''
+        Tests that no more than max_per_host requests are in flight per host
+        '''
+        SlowHandler.peak = 0
+        client = tamarack.http_client.HTTPClient(max_per_host=2)
+        responses = yield [
+            client.fetch(tornado.httpclient.HTTPRequest(self.get_url('/slow')))
+            for _ in range(6)
+        ]
+        assert [response.body for response in responses] == [b'ok'] * 6
+        assert SlowHandler.peak == 2
+        assert client.in_flight == 0
+        client.close()
+
+    @tornado.testing.gen_test
+    def test_default_timeouts(self):
+        '''
+        Tests that the default timeouts are applied to requests without their own
+        '''
+        client = tamarack.http_client.HTTPClient(connect_timeout=3, request_timeout=5)
+        request = tornado.httpclient.HTTPRequest(self.get_url('/slow'), request_timeout=7)
+        yield client.fetch(request)
+        assert request.connect_timeout == 3
+        assert request.request_timeout == 7
+        client.close()
+
+    def test_simple_client_warning(self):
+        '''
+        Tests that falling back to the simple client without pycurl is logged
+        '''
+        with patch('tamarack.http_client.HAS_CURL', False), \
+                patch('tamarack.http_client.LOG') as mock_log:
+            client = tamarack.http_client.HTTPClient()
+        assert mock_log.warning.call_count == 1
+        client.close()
+
+
+class TestGetClient(tornado.testing.AsyncTestCase):
+    '''
+    TestCase for the get_client and set_client functions
+    '''
+
+    def test_shared_client(self):
+        '''
+        Tests that the client set by the application is shared
+        '''
+        client = tamarack.http_client.HTTPClient()
+        tamarack.http_client.set_client(client)
+        assert tamarack.http_client.get_client() is client
+        client.close()
@@ -0,0 +1,142 @@
+# -*- coding: utf-8 -*-
+'''
+Tests for the functions in tamarack.journal.py
+'''
+
+# Import Python libs
+import os
+import shutil
+import tempfile
+
+# Import Tornado libs
+import tornado.testing
+
+# Import Tamarack libs
+import tamarack.journal
+
+
+class TestJournal(tornado.testing.AsyncTestCase):
+    '''
+    TestCase for the Journal class
+    '''
+
+    def setUp(self):
+        super().setUp()
+        self.directory = tempfile.mkdtemp()
+
+    def tearDown(self):
+        shutil.rmtree(self.directory)
+        super().tearDown()
+
+    def _segments(self):
+        return sorted(name for name in os.listdir(self.directory)
+                      if name.endswith(tamarack.journal.SEGMENT_SUFFIX))
+
+    @tornado.testing.gen_test
+    def test_group_commit(self):
+        '''
+        Tests that concurrent appends are committed together
+        '''
+        journal = tamarack.journal.Journal(self.directory)
+        yield [journal.append('id-{0}'.format(i), b'{}') for i in range(50)]
+        assert journal.appended == 50
+        assert journal.commits < 50
+        journal.close()
+
+    @tornado.testing.gen_test
+    def test_replay_unprocessed(self):
+        '''
+        Tests that only events that were not processed are replayed
+        '''
+        journal = tamarack.journal.Journal(self.directory)
+        yield journal.append('one', b'{"number": 1}')
+        yield journal.append('two', b'{"number": 2}')
+        journal.mark_processed('one')
+        journal.close()
+
+        journal = tamarack.journal.Journal(self.directory)
+        assert journal.replay() == [('two', b'{"number": 2}')]
+        assert not journal.replay()
+        journal.mark_processed('two')
+        journal.close()
+
+        journal = tamarack.journal.Journal(self.directory)
+        assert not journal.replay()
+        journal.close()
+
+    @tornado.testing.gen_test
+    def test_torn_record_ignored(self):
+        '''
+        Tests that a partially written record at the end of a segment is ignored
+        '''
+        journal = tamarack.journal.Journal(self.directory)
+        yield journal.append('one', b'{"number": 1}')
+        yield journal.append('two', b'{"number": 2}')
+        journal.close()
+
+        path = os.path.join(self.directory, self._segments()[-1])
+        with open(path, 'r+b') as segment:
+            segment.truncate(os.path.getsize(path) - 3)
+
+        journal = tamarack.journal.Journal(self.directory)
+        assert journal.replay() == [('one', b'{"number": 1}')]
+        journal.close()
+
+    @tornado.testing.gen_test
+    def test_processed_segments_deleted(self):
+        '''
+        Tests that segments are rotated and deleted once fully processed
+        '''
+        journal = tamarack.journal.Journal(self.directory, segment_size=64)
+        for i in range(4):
+            yield journal.append('id-{0}'.format(i), b'x' * 40)
+        assert len(self._segments()) == 4
+
+        for i in range(4):
+            journal.mark_processed('id-{0}'.format(i))
+        assert len(self._segments()) == 1
+        assert journal.pending() == 0
+        journal.close()
+
+    def _index(self):
+        with open(os.path.join(self.directory, tamarack.journal.INDEX_NAME), 'rb') as index:
+            return set(index.read().split())
+
+    @tornado.testing.gen_test
+    def test_index_compacted(self):
+        '''
+        Tests that the processed index only keeps the IDs of segments that still
+        exist once a segment is rotated
+        '''
+        journal = tamarack.journal.Journal(self.directory, segment_size=128)
+        for i in range(5):
+            yield journal.append('id-{0}'.format(i), b'x' * 40)
+        for i in (0, 2, 3):
+            journal.mark_processed('id-{0}'.format(i))
+        yield journal.append('id-5', b'x' * 40)
+        assert self._index() == {b'id-0', b'id-2', b'id-3'}
+
+        yield journal.append('id-6', b'x' * 40)
+        assert self._index() == {b'id-0'}
+        journal.close()
+
+        journal = tamarack.journal.Journal(self.directory, segment_size=128)
+        assert [record[0] for record in journal.replay()] == ['id-1', 'id-4', 'id-5', 'id-6']
+        journal.close()
+
+    @tornado.testing.gen_test
+    def test_load_drops_deleted_ids(self):
+        '''
+        Tests that loading the journal forgets the IDs of the segments it deletes
+        '''
+        journal = tamarack.journal.Journal(self.directory)
+        yield journal.append('one', b'{"number": 1}')
+        yield journal.append('two', b'{"number": 2}')
+        journal.mark_processed('one')
+        journal.mark_processed('two')
+        journal.close()
+
+        journal = tamarack.journal.Journal(self.directory)
+        assert not journal.replay()
+        assert self._index() == set()
+        journal.close()
@@ -0,0 +1,147 @@
+# -*- coding: utf-8 -*-
+'''
+Tests for the functions in tamarack.logs.py
+'''
+
+# Import Python libs
+from unittest.mock import patch
+import io
+import json
+import logging
+import os
+import queue
+import shutil
+import tempfile
+
+# Import Tamarack libs
+import tamarack.logs
+import tamarack.tracing
+
+
+def _record(msg='Found %s files', args=(3,), **extra):
+    record = logging.LogRecord('tamarack.pull_request', logging.INFO, __file__, 1,
+                               msg, args, None)
+    record.__dict__.update(extra)
+    return record
+
+
+class TestJsonFormatter:
+    '''
+    TestCase for the JsonFormatter class
+    '''
+
+    def test_format(self):
+        '''
+        Tests that records are formatted as JSON with their event context
+        '''
+        trace = tamarack.tracing.Trace('abc', event='pull_request', action='opened')
+        record = _record(**tamarack.logs.context(trace, pr=7))
+        data = json.loads(tamarack.logs.JsonFormatter().format(record))
+        assert data['message'] == 'Found 3 files'
+        assert data['level'] == 'INFO'
+        assert data['logger'] == 'tamarack.pull_request'
+        assert data['delivery_id'] == 'abc'
+        assert data['event'] == 'pull_request'
+        assert data['action'] == 'opened'
+        assert data['pr'] == 7
+
+    def test_no_context(self):
+        '''
+        Tests that missing context fields are left out
+        '''
+        data = json.loads(tamarack.logs.JsonFormatter().format(_record()))
+        assert 'delivery_id' not in data
+        assert 'pr' not in data
+
+
+class TestDroppingQueueHandler:  # pylint: disable=too-few-public-methods
+    '''
+    TestCase for the DroppingQueueHandler class
+    '''
+
+    def test_full_queue(self):
+        '''
+        Tests that records are dropped instead of blocking when the queue is full
+        '''
+        handler = tamarack.logs.DroppingQueueHandler(queue.Queue(1))
+        handler.handle(_record())
+        handler.handle(_record())
+        assert handler.queue.qsize() == 1
+        assert handler.dropped == 1
+
+
+class TestSummarize:
+    '''
+    TestCase for the summarize function
+    '''
+
+    def test_short_list(self):
+        '''
+        Tests that short lists are logged in full
+        '''
+        assert tamarack.logs.summarize(['a.py', 'b.py'], limit=2) == 'a.py, b.py'
+
+    def test_long_list(self):
+        '''
+        Tests that long lists are cut off with the number of items left out
+        '''
+        files = ['{0}.py'.format(num) for num in range(100)]
+        assert tamarack.logs.summarize(files, limit=2) == '0.py, 1.py ... and 98 more'
+
+
+class TestSetup:
+    '''
+    TestCase for the setup and after_fork functions
+    '''
+
+    def setup_method(self):
+        '''
+        Creates the log directory and remembers the root logger's handlers.
+        '''
+        # pylint: disable=attribute-defined-outside-init
+        self.directory = tempfile.mkdtemp()
+        self.root = logging.getLogger('')
+        self.handlers = list(self.root.handlers)
+        self.level = self.root.level
+
+    def teardown_method(self):
+        '''
+        Restores the root logger and removes the log directory.
+        '''
+        tamarack.logs.stop()
+        for handler in list(self.root.handlers):
+            if handler not in self.handlers:
+                self.root.removeHandler(handler)
+                handler.close()
+        self.root.setLevel(self.level)
+        shutil.rmtree(self.directory)
+
+    def _read(self, name):
+        with open(os.path.join(self.directory, name), encoding='utf-8') as log_file:
+            return log_file.read()
+
+    def test_queued_json(self):
+        '''
+        Tests that records are written to the log file by the background writer
+        '''
+        path = os.path.join(self.directory, 'tamarack.log')
+        with patch('sys.stderr', io.StringIO()):
+            tamarack.logs.setup(path, logging.INFO, log_format='json', use_queue=True)
+            logging.getLogger('tamarack.test').info('Hello %s', 'world',
+                                                    extra={'delivery_id': 'abc'})
+            tamarack.logs.stop()
+        data = json.loads(self._read('tamarack.log'))
+        assert data['message'] == 'Hello world'
+        assert data['delivery_id'] == 'abc'
+
+    def test_after_fork(self):
+        '''
+        Tests that a forked process writes to its own log file
+        '''
+        path = os.path.join(self.directory, 'tamarack.log')
+        with patch('sys.stderr', io.StringIO()):
+            tamarack.logs.setup(path, logging.INFO, log_format='text', use_queue=True)
+            tamarack.logs.after_fork(2)
+            logging.getLogger('tamarack.test').info('Hello')
+            tamarack.logs.stop()
+        assert self._read('tamarack.2.log') == '[INFO] Hello\n'
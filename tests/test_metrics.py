@@ -0,0 +1,53 @@
+# -*- coding: utf-8 -*-
+'''
+Tests for the functions in tamarack.metrics.py
+'''
+
+# Import Tamarack libs
+import tamarack.metrics
+
+
+class TestRegistry:
+    '''
+    TestCase for the Registry class and its metrics
+    '''
+
+    def test_counter(self):
+        '''
+        Tests that counters are rendered per label value
+        '''
+        registry = tamarack.metrics.Registry()
+        counter = registry.counter('jobs_total', 'Jobs.', ('result',))
+        counter.inc('ok')
+        counter.inc('ok', amount=2)
+        counter.inc('failed')
+        assert registry.render() == '# HELP jobs_total Jobs.\n' \
+                                    '# TYPE jobs_total counter\n' \
+                                    'jobs_total{result="failed"} 1\n' \
+                                    'jobs_total{result="ok"} 3\n'
+
+    def test_histogram(self):
+        '''
+        Tests that histogram buckets are cumulative and include their upper bound
+        '''
+        registry = tamarack.metrics.Registry()
+        histogram = registry.histogram('latency_seconds', 'Latency.', ('event',),
+                                       buckets=(0.1, 1))
+        histogram.observe(0.1, 'create')
+        histogram.observe(0.5, 'create')
+        histogram.observe(2, 'create')
+        lines = registry.render().splitlines()
+        assert lines[2:] == ['latency_seconds_bucket{event="create",le="0.1"} 1',
+                             'latency_seconds_bucket{event="create",le="1"} 2',
+                             'latency_seconds_bucket{event="create",le="+Inf"} 3',
+                             'latency_seconds_sum{event="create"} 2.6',
+                             'latency_seconds_count{event="create"} 3']
+
+    def test_label_escaping(self):
+        '''
+        Tests that quotes, backslashes and newlines in label values are escaped
+        '''
+        lines = tamarack.metrics.render_metric(
+            'm', 'gauge', 'M.', [('m', {'label': 'a"b\\c\nd'}, 1)]
+        )
+        assert lines[-1] == r'm{label="a\"b\\c\nd"} 1'
@@ -0,0 +1,187 @@
+# -*- coding: utf-8 -*-
+'''
+Tests for the functions in tamarack.mirror.py
+'''
+
+# Import Python libs
+from unittest.mock import MagicMock, patch
+import os
+import shutil
+import subprocess
+import tempfile
+import pytest
+
+# Import Tornado libs
+import tornado.testing
+
+# Import Tamarack libs
+import tamarack.mirror
+import tests.helpers
+
+GIT_ENV = dict(os.environ, GIT_AUTHOR_NAME='Tamarack', GIT_AUTHOR_EMAIL='bot@example.com',
+               GIT_COMMITTER_NAME='Tamarack', GIT_COMMITTER_EMAIL='bot@example.com')
+
+
+def _git(cwd, *args):
+    '''
+    Helper function that runs git and returns its output.
+    '''
+    return subprocess.check_output(['git'] + list(args), cwd=cwd, env=GIT_ENV).decode().strip()
+
+
+def _write(repo, path, contents):
+    '''
+    Helper function that writes a file in a repository's work tree.
+    '''
+    path = os.path.join(repo, path)
+    os.makedirs(os.path.dirname(path), exist_ok=True)
+    with open(path, 'w', encoding='utf-8') as file_:
+        file_.write(contents)
+
+
+def make_repo(directory):
+    '''
+    Helper function that creates a repository with a pull request, #7, from
+    the "fix" branch into "develop", and returns the SHAs of the base and head
+    commits. "develop" moves on after "fix" branched off it.
+    '''
+    repo = os.path.join(directory, 'source')
+    os.makedirs(repo)
+    _git(repo, 'init', '--quiet', '--initial-branch', 'develop')
+    _write(repo, '.github/CODEOWNERS', '*.py    @saltstack/team-core\n')
+    for name in ('a.py', 'd.py', 'e.py'):
+        _write(repo, name, name)
+    _git(repo, 'add', '--all')
+    _git(repo, 'commit', '--quiet', '-m', 'base')
+
+    _git(repo, 'checkout', '--quiet', '-b', 'fix')
+    _write(repo, 'a.py', 'changed')
+    _write(repo, 'b/c.py', 'added')
+    _git(repo, 'rm', '--quiet', 'd.py')
+    _git(repo, 'mv', 'e.py', 'f.py')
+    _git(repo, 'add', '--all')
+    _git(repo, 'commit', '--quiet', '-m', 'fix')
+    _git(repo, 'update-ref', 'refs/pull/7/head', 'fix')
+
+    _git(repo, 'checkout', '--quiet', 'develop')
+    _write(repo, 'g.py', 'later')
+    _git(repo, 'add', '--all')
+    _git(repo, 'commit', '--quiet', '-m', 'later')
+    return repo, _git(repo, 'rev-parse', 'develop'), _git(repo, 'rev-parse', 'fix')
+
+
+@pytest.mark.skipif(shutil.which('git') is None, reason='git is not installed')
+class TestPullRequestData(tornado.testing.AsyncTestCase):
+    '''
+    TestCase for the get_pull_request_data function
+    '''
+
+    def setUp(self):
+        super().setUp()
+        self.directory = tempfile.mkdtemp()
+        self.addCleanup(shutil.rmtree, self.directory)
+        self.repo, self.base, self.head = make_repo(self.directory)
+        self.mirrors = os.path.join(self.directory, 'mirrors')
+        self.event_data = {
+            'number': 7,
+            'repository': {'full_name': 'saltstack/salt', 'clone_url': self.repo},
+            'pull_request': {'base': {'ref': 'develop', 'sha': self.base},
+                             'head': {'sha': self.head}},
+        }
+
+    @tornado.testing.gen_test
+    def test_changed_files(self):
+        '''
+        Tests that the files changed since the merge base and the CODEOWNERS
+        file of the base are read from the mirror
+        '''
+        files, owners_sha, owners_text = yield tamarack.mirror.get_pull_request_data(
+            self.event_data, '', '.github/CODEOWNERS', directory=self.mirrors
+        )
+        assert sorted(files) == ['a.py', 'b/c.py', 'd.py', 'f.py']
+        assert owners_text == '*.py    @saltstack/team-core\n'
+        assert owners_sha == _git(self.repo, 'rev-parse', 'develop:.github/CODEOWNERS')
+        assert os.path.isdir(os.path.join(self.mirrors, 'saltstack', 'salt.git'))
+
+    @tornado.testing.gen_test
+    def test_fetch_skipped(self):
+        '''
+        Tests that the refs are only fetched if a commit is missing
+        '''
+        mirror = tamarack.mirror.get_mirror('saltstack/salt', self.repo, self.mirrors)
+        for _ in range(2):
+            yield tamarack.mirror.get_pull_request_data(
+                self.event_data, '', '.github/CODEOWNERS', directory=self.mirrors
+            )
+        assert mirror.fetches == 1
+
+        _write(self.repo, 'h.py', 'newer')
+        _git(self.repo, 'add', '--all')
+        _git(self.repo, 'commit', '--quiet', '-m', 'newer')
+        self.event_data['pull_request']['base']['sha'] = _git(self.repo, 'rev-parse', 'develop')
+        yield tamarack.mirror.get_pull_request_data(
+            self.event_data, '', '.github/CODEOWNERS', directory=self.mirrors
+        )
+        assert mirror.fetches == 2
+
+    @tornado.testing.gen_test
+    def test_no_owners_file(self):
+        '''
+        Tests that a missing CODEOWNERS file is reported as None
+        '''
+        mirror = tamarack.mirror.get_mirror('saltstack/salt', self.repo, self.mirrors)
+        yield mirror.update(['+refs/heads/develop:refs/heads/develop'])
+        ret = yield mirror.read_file('develop', 'CODEOWNERS')
+        assert ret == (None, None)
+
+    @tornado.testing.gen_test
+    def test_fetch_failed(self):
+        '''
+        Tests that a failing git command raises CalledProcessError
+        '''
+        mirror = tamarack.mirror.get_mirror('saltstack/salt', self.repo, self.mirrors)
+        with pytest.raises(subprocess.CalledProcessError):
+            yield mirror.update(['+refs/pull/8/head:refs/pull/8/head'])
+
+    @tornado.testing.gen_test
+    def test_token_git_version(self):
+        '''
+        Tests that the token is passed to git 2.31 and later, and that older
+        versions fetch without it
+        '''
+        os.makedirs(self.mirrors)
+        mirror = tamarack.mirror.Mirror(self.mirrors, 'https://github.com/saltstack/salt.git')
+        run_git = MagicMock(return_value=tests.helpers.future(b''))
+        for version, has_token in (((2, 31), True), ((2, 30), False)):
+            with patch('tamarack.mirror._GIT_VERSION', version), \
+                    patch('tamarack.mirror.run_git', run_git):
+                yield mirror.update(['+refs/heads/develop:refs/heads/develop'], token='token')
+            assert (run_git.call_args[1]['env'] is not None) == has_token
+
+
+class TestUseMirror:
+    '''
+    TestCase for the use_mirror function
+    '''
+
+    def test_threshold(self):
+        '''
+        Tests that only large pull requests use the mirror, if one is configured
+        '''
+        repository = {'clone_url': 'https://github.com/saltstack/salt.git'}
+        event_data = {'pull_request': {'changed_files': 500}, 'repository': repository}
+        with patch('tamarack.mirror.GIT_MIRROR_DIR', '/var/lib/tamarack'), \
+                patch('tamarack.mirror.GIT_MIRROR_THRESHOLD', 300):
+            assert tamarack.mirror.use_mirror(event_data)
+            assert not tamarack.mirror.use_mirror({'pull_request': {'changed_files': 10},
+                                                   'repository': repository})
+        with patch('tamarack.mirror.GIT_MIRROR_DIR', None):
+            assert not tamarack.mirror.use_mirror(event_data)
+
+    def test_no_clone_url(self):
+        '''
+        Tests that a repository without a clone url uses the API
+        '''
+        with patch('tamarack.mirror.GIT_MIRROR_DIR', '/var/lib/tamarack'):
+            assert not tamarack.mirror.use_mirror({'pull_request': {'changed_files': 500},
+                                                   'repository': {'clone_url': None}})
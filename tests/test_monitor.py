@@ -0,0 +1,47 @@
+# -*- coding: utf-8 -*-
+'''
+Tests for the functions in tamarack.monitor.py
+'''
+
+# Import Python libs
+import time
+
+# Import Tornado libs
+from tornado import gen
+import tornado.testing
+
+# Import Tamarack libs
+import tamarack.monitor
+
+
+class TestLagMonitor(tornado.testing.AsyncTestCase):
+    '''
+    TestCase for the LagMonitor class
+    '''
+
+    def test_stats(self):
+        '''
+        Tests that samples are summarized and negative lag is ignored
+        '''
+        monitor = tamarack.monitor.LagMonitor(warn=1)
+        monitor.record(0.1)
+        monitor.record(0.3)
+        monitor.record(-0.01)
+        stats = monitor.stats()
+        assert stats['samples'] == 3
+        assert stats['last_lag'] == 0.0
+        assert stats['max_lag'] == 0.3
+        assert abs(stats['mean_lag'] - 0.4 / 3) < 1e-9
+
+    @tornado.testing.gen_test
+    def test_blocked_loop(self):
+        '''
+        Tests that blocking the IOLoop shows up as lag
+        '''
+        monitor = tamarack.monitor.LagMonitor(interval=0.01)
+        monitor.start()
+        yield gen.sleep(0)
+        time.sleep(0.1)
+        while monitor.samples == 0:
+            yield gen.sleep(0.01)
+        assert monitor.max_lag >= 0.05
@@ -3,22 +3,54 @@
 Tests for the functions in tamarack.pull_request.py
 '''
 
+# pylint: disable=duplicate-code
 # Import Python libs
 from unittest.mock import MagicMock, patch
+import base64
+import io
+import json
 import os
+import shutil
+import tempfile
 import pytest
 
 # Import Tornado libs
+import tornado.concurrent
 import tornado.httpclient
+import tornado.httputil
 import tornado.testing
 import tornado.web
 
 # Import Tamarack libs
+import tamarack.auth
+import tamarack.cache
+import tamarack.codeowners
+import tamarack.executor
+import tamarack.github
 import tamarack.pull_request
+import tamarack.shared
+import tamarack.tracing
+import tests.helpers
 
 GITHUB_TEST_TOKEN = os.environ.get('GITHUB_TEST_TOKEN') or ''
 
 
+def _response(code=200, body=None, headers=None):
+    '''
+    Helper function that returns a resolved future holding a fake GitHub response.
+    '''
+    request = tornado.httpclient.HTTPRequest('https://api.github.com')
+    buffer = None
+    if body is not None:
+        buffer = io.BytesIO(json.dumps(body).encode('utf-8'))
+    response = tornado.httpclient.HTTPResponse(
+        request, code,
+        headers=tornado.httputil.HTTPHeaders(headers or {}),
+        buffer=buffer
+    )
+    return tests.helpers.future(response)
+
+
 class TestAssignReviewers(tornado.testing.AsyncTestCase):
     '''
     TestCase for the assign_reviewers function
@@ -35,7 +67,8 @@ class TestAssignReviewers(tornado.testing.AsyncTestCase):
         event_data = {'number': 19,
                       'pull_request':
                           {'url': 'https://api.github.com/repos/rallytime/tamarack/pulls/19',
-                           'base': {'ref': 'master'}},
+                           'base': {'ref': 'master'},
+                           'user': {'login': 'rallytime'}},
                       'repository':
                           {'url': 'https://api.github.com/repos/rallytime/tamarack'}}
         with patch('tamarack.pull_request._get_code_owners',
@@ -51,6 +84,251 @@ class TestAssignReviewers(tornado.testing.AsyncTestCase):
             assert True
 
 
+class TestAssignReviewersMocked(tornado.testing.AsyncTestCase):
+    '''
+    TestCase for the assign_reviewers function, without calling out to GitHub
+    '''
+    event_data = {'number': 1,
+                  'pull_request': {'url': 'https://api.github.com/repos/foo/bar/pulls/1',
+                                   'user': {'login': 'author'}},
+                  'repository': {'url': 'https://api.github.com/repos/foo/bar'}}
+
+    @tornado.testing.gen_test
+    def test_pages_matched(self):
+        '''
+        Tests that files from every page are matched and reviewers requested
+        '''
+        rules = tamarack.codeowners.compile_rules(
+            'salt/state.py    @saltstack/team-state\n'
+            'salt/auth/*      someone\n'
+        )
+        owners_file = tamarack.pull_request.OwnersFile(None, None, '', rules, 0)
+        pages = MagicMock()
+        pages.done.side_effect = [False, True]
+        pages.next.side_effect = [tests.helpers.future([{'filename': 'salt/state.py'}]),
+                                  tests.helpers.future([{'filename': 'salt/auth/pki.py'}])]
+        mock_request = MagicMock(return_value=tests.helpers.future({}))
+
+        with patch('tamarack.pull_request.get_owners_file',
+                   MagicMock(return_value=tests.helpers.future(owners_file))), \
+                patch('tamarack.pull_request.get_pr_file_pages',
+                      MagicMock(return_value=pages)), \
+                patch('tamarack.pull_request._get_current_reviewers',
+                      MagicMock(return_value=tests.helpers.future([]))), \
+                patch('tamarack.github.api_request', mock_request):
+            yield tamarack.pull_request.assign_reviewers(self.event_data, '')
+
+        assert mock_request.call_args[1]['post_data'] == {
+            'reviewers': ['someone'], 'team_reviewers': ['team-state']}
+
+    @tornado.testing.gen_test
+    def test_graphql(self):
+        '''
+        Tests that the files and CODEOWNERS file are fetched with GraphQL, and
+        that the cached file is revalidated by its SHA on the next event
+        '''
+        review_data = tamarack.github.ReviewData(
+            ['salt/state.py'], 'abc', 'salt/state.py    someone\n', False, [], [])
+        mock_review = MagicMock(return_value=tests.helpers.future(review_data))
+        mock_request = MagicMock(return_value=tests.helpers.future({}))
+
+        with patch('tamarack.github.get_review_data', mock_review), \
+                patch('tamarack.github.api_request', mock_request), \
+                patch('tamarack.pull_request.OWNERS_CACHE', tamarack.cache.LRUCache()):
+            yield tamarack.pull_request.assign_reviewers(self.event_data, 'token')
+            mock_review.return_value = tests.helpers.future(review_data._replace(owners_text=None))
+            yield tamarack.pull_request.assign_reviewers(self.event_data, 'token')
+
+        assert [call[1]['with_text'] for call in mock_review.call_args_list] == [True, False]
+        assert mock_request.call_args[1]['post_data'] == {'reviewers': ['someone']}
+        assert mock_request.call_count == 2
+
+    @tornado.testing.gen_test
+    def test_mirror(self):
+        '''
+        Tests that the files of a large pull request are listed from the git
+        mirror when one is configured
+        '''
+        mirror_data = (['salt/state.py', 'salt/auth/pki.py'], 'abc',
+                       'salt/auth/*    someone\n')
+        mock_request = MagicMock(return_value=tests.helpers.future({}))
+        mock_review = MagicMock()
+
+        with patch('tamarack.mirror.use_mirror', MagicMock(return_value=True)), \
+                patch('tamarack.mirror.get_pull_request_data',
+                      MagicMock(return_value=tests.helpers.future(mirror_data))), \
+                patch('tamarack.pull_request._get_current_reviewers',
+                      MagicMock(return_value=tests.helpers.future([]))), \
+                patch('tamarack.github.get_review_data', mock_review), \
+                patch('tamarack.github.api_request', mock_request), \
+                patch('tamarack.pull_request.OWNERS_CACHE', tamarack.cache.LRUCache()):
+            yield tamarack.pull_request.assign_reviewers(self.event_data, 'token')
+
+        assert not mock_review.called
+        assert mock_request.call_args[1]['post_data'] == {'reviewers': ['someone']}
+
+    @tornado.testing.gen_test
+    def test_only_missing_requested(self):
+        '''
+        Tests that code owners already requested or who have reviewed are not
+        requested again, and that nothing is sent if none are left
+        '''
+        review_data = tamarack.github.ReviewData(
+            ['salt/state.py'], 'abc',
+            'salt/state.py    @someone @author @saltstack/team-state other@example.com\n',
+            False, ['saltstack/team-state'], []
+        )
+        mock_request = MagicMock(return_value=tests.helpers.future({}))
+
+        with patch('tamarack.github.get_review_data',
+                   MagicMock(return_value=tests.helpers.future(review_data))), \
+                patch('tamarack.github.api_request', mock_request), \
+                patch('tamarack.pull_request.OWNERS_CACHE', tamarack.cache.LRUCache()):
+            yield tamarack.pull_request.assign_reviewers(self.event_data, 'token')
+            assert mock_request.call_args[1]['post_data'] == {'reviewers': ['someone']}
+
+            review_data = review_data._replace(reviewed_by=['Someone'])
+            with patch('tamarack.github.get_review_data',
+                       MagicMock(return_value=tests.helpers.future(review_data))):
+                yield tamarack.pull_request.assign_reviewers(self.event_data, 'token')
+
+        assert mock_request.call_count == 1
+
+    @tornado.testing.gen_test
+    def test_graphql_fallback(self):
+        '''
+        Tests that the REST API is used if the GraphQL query fails
+        '''
+        owners_file = tamarack.pull_request.OwnersFile(
+            None, None, '', tamarack.codeowners.compile_rules('* someone\n'), 0)
+        pages = MagicMock()
+        pages.done.return_value = True
+        pages.next.return_value = tests.helpers.future([{'filename': 'README.md'}])
+        failed = tornado.concurrent.Future()
+        failed.set_exception(tornado.web.HTTPError(502))
+        mock_request = MagicMock(return_value=tests.helpers.future({}))
+
+        with patch('tamarack.github.get_review_data', MagicMock(return_value=failed)), \
+                patch('tamarack.pull_request.get_owners_file',
+                      MagicMock(return_value=tests.helpers.future(owners_file))), \
+                patch('tamarack.pull_request.get_pr_file_pages',
+                      MagicMock(return_value=pages)), \
+                patch('tamarack.pull_request._get_current_reviewers',
+                      MagicMock(return_value=tests.helpers.future([]))), \
+                patch('tamarack.github.api_request', mock_request):
+            yield tamarack.pull_request.assign_reviewers(self.event_data, 'token')
+
+        assert mock_request.call_args[1]['post_data'] == {'reviewers': ['someone']}
+
+
+class TestGetCurrentReviewers(tornado.testing.AsyncTestCase):
+    '''
+    TestCase for the _get_current_reviewers function
+    '''
+
+    @tornado.testing.gen_test
+    def test_current(self):
+        '''
+        Tests that requested teams are given with the repository's organization,
+        alongside requested users and the authors of reviews
+        '''
+        event_data = {
+            'number': 1,
+            'pull_request': {'url': 'https://api.github.com/repos/foo/bar/pulls/1',
+                             'requested_reviewers': [{'login': 'alice'}],
+                             'requested_teams': [{'slug': 'team-core'}]},
+            'repository': {'full_name': 'foo/bar'},
+        }
+        pages = MagicMock()
+        pages.done.side_effect = [False, True]
+        pages.next.return_value = tests.helpers.future([{'user': {'login': 'bob'}}, {'user': None}])
+        with patch('tamarack.github.PageIterator', MagicMock(return_value=pages)):
+            current = yield tamarack.pull_request._get_current_reviewers(event_data, '')
+        assert current == ['alice', 'foo/team-core', 'bob']
+
+
+class TestMissingReviewers:
+    '''
+    TestCase for the _missing_reviewers function
+    '''
+
+    def test_missing(self):
+        '''
+        Tests that the author, email owners and current reviewers are left out
+        '''
+        owners = ['@saltstack/team-core', '@Rallytime', 'twangboy', 'dev@example.com',
+                  '@saltstack/team-suse', '@garethgreenaway']
+        current = ['twangboy', 'saltstack/team-suse']
+        assert tamarack.pull_request._missing_reviewers(owners, 'rallytime', current) == (
+            ['garethgreenaway'], ['team-core'])
+
+    def test_team_named_like_user(self):
+        '''
+        Tests that a team is not skipped because a user of the same name is a
+        current reviewer
+        '''
+        assert tamarack.pull_request._missing_reviewers(
+            ['@saltstack/alice', '@alice'], 'rallytime', ['alice']) == ([], ['alice'])
+
+    def test_none_missing(self):
+        '''
+        Tests that nothing is returned when every owner is already requested
+        '''
+        assert tamarack.pull_request._missing_reviewers(
+            ['@saltstack/team-core'], 'rallytime', ['saltstack/team-core']) == ([], [])
+
+
+class TestMatchCodeOwners(tornado.testing.AsyncTestCase):
+    '''
+    TestCase for the _match_code_owners function
+    '''
+    contents = 'salt/state.py       @saltstack/team-state\n'
+
+    def _owners_file(self):
+        return tamarack.pull_request.OwnersFile(
+            sha=None, etag=None, contents=self.contents,
+            rules=tamarack.codeowners.compile_rules(self.contents), checked=0
+        )
+
+    @tornado.testing.gen_test
+    def test_small_match_inline(self):
+        '''
+        Tests that matches below the threshold are not offloaded
+        '''
+        with patch('tamarack.executor.run') as mock_run:
+            matches = yield tamarack.pull_request._match_code_owners(
+                ['salt/state.py'], self._owners_file()
+            )
+        assert matches == ['@saltstack/team-state']
+        assert not mock_run.called
+
+    @tornado.testing.gen_test
+    def test_large_match_offloaded(self):
+        '''
+        Tests that matches above the threshold are run in the executor
+        '''
+        with patch('tamarack.pull_request.OFFLOAD_THRESHOLD', 1), \
+                patch('tamarack.executor.run', wraps=tamarack.executor.run) as mock_run:
+            matches = yield tamarack.pull_request._match_code_owners(
+                ['salt/state.py'], self._owners_file()
+            )
+        assert matches == ['@saltstack/team-state']
+        assert mock_run.call_args[0][2] == self.contents
+
+    @tornado.testing.gen_test
+    def test_match_traced(self):
+        '''
+        Tests that the match is recorded as a span on the trace
+        '''
+        trace = tamarack.tracing.Trace('abc')
+        yield tamarack.pull_request._match_code_owners(
+            ['salt/state.py', 'README.md'], self._owners_file(), trace=trace
+        )
+        assert [span['name'] for span in trace.spans] == ['owners.match']
+        assert trace.spans[0]['files'] == 2
+        assert trace.spans[0]['mode'] == 'inline'
+
+
 class TestGetCodeOwners:
     '''
     TestCase for the _get_code_owners function
@@ -91,6 +369,20 @@ class TestGetCodeOwners:
             self.owners_content
         ) == ['@saltstack/team-core', '@saltstack/team-suse']
 
+    def test_multiple_owners(self):
+        '''
+        Tests that rules with several owners are supported, the last matching
+        rule wins, and each owner is only returned once
+        '''
+        owners_content = self.owners_content + \
+            'salt/auth/pki.py    @saltstack/team-pki someone  # PKI\n'
+        assert tamarack.pull_request._get_code_owners(
+            ['salt/auth/pki.py', 'salt/auth/ldap.py', 'salt/auth/pam.py',
+             'salt/state.py', 'salt/auth/pki.py'],
+            owners_content
+        ) == ['@saltstack/team-pki', 'someone', '@saltstack/team-core',
+              '@saltstack/team-state', '@saltstack/team-suse']
+
 
 class TestGetOwnersFileContents(tornado.testing.AsyncTestCase):
     '''
@@ -129,6 +421,207 @@ class TestGetOwnersFileContents(tornado.testing.AsyncTestCase):
         assert 'salt/cli/ssh.py                     @saltstack/team-ssh' in contents
 
 
+class TestGetOwnersFile(tornado.testing.AsyncTestCase):
+    '''
+    TestCase for the get_owners_file function
+    '''
+    event_data = {'number': 1,
+                  'repository': {'url': 'https://api.github.com/repos/foo/bar'},
+                  'pull_request': {'base': {'ref': 'develop'}}}
+    contents = 'salt/state.py       @saltstack/team-state\n'
+    body = {'sha': 'abc123',
+            'content': base64.b64encode(contents.encode('utf-8')).decode('utf-8')}
+
+    def setUp(self):
+        super().setUp()
+        tamarack.pull_request.OWNERS_CACHE.clear()
+
+    def tearDown(self):
+        tamarack.pull_request.OWNERS_CACHE.clear()
+        super().tearDown()
+
+    @tornado.testing.gen_test
+    def test_fetched_and_compiled(self):
+        '''
+        Tests that the CODEOWNERS file is decoded and compiled
+        '''
+        mock_fetch = MagicMock(return_value=_response(body=self.body,
+                                                      headers={'Etag': '"v1"'}))
+        with patch('tamarack.github.fetch', mock_fetch):
+            owners_file = yield tamarack.pull_request.get_owners_file(self.event_data, '')
+
+        assert mock_fetch.call_args[0][0].endswith('/contents/.github/CODEOWNERS?ref=develop')
+        assert owners_file.sha == 'abc123'
+        assert owners_file.etag == '"v1"'
+        assert owners_file.contents == self.contents
+        assert len(owners_file.rules) == 1
+
+    @tornado.testing.gen_test
+    def test_fresh_entry_cached(self):
+        '''
+        Tests that a freshly cached CODEOWNERS file is returned without a request
+        '''
+        mock_fetch = MagicMock(return_value=_response(body=self.body))
+        with patch('tamarack.github.fetch', mock_fetch):
+            first = yield tamarack.pull_request.get_owners_file(self.event_data, '')
+            second = yield tamarack.pull_request.get_owners_file(self.event_data, '')
+
+        assert mock_fetch.call_count == 1
+        assert second == first
+        assert second.rules is first.rules
+
+    @tornado.testing.gen_test
+    def test_shared_cache(self):
+        '''
+        Tests that a CODEOWNERS file cached in a shared store is found by
+        another process, with its rules compiled again
+        '''
+        directory = tempfile.mkdtemp()
+        self.addCleanup(shutil.rmtree, directory)
+        path = os.path.join(directory, 'shared.db')
+        mock_fetch = MagicMock(return_value=_response(body=self.body))
+        with patch('tamarack.github.fetch', mock_fetch), \
+                patch('tamarack.pull_request.OWNERS_CACHE'):
+            tamarack.pull_request.set_owners_cache(
+                tamarack.shared.SharedStore(path).cache(
+                    'owners', load=tamarack.pull_request.OwnersFile._make
+                )
+            )
+            yield tamarack.pull_request.get_owners_file(self.event_data, '')
+            tamarack.pull_request.set_owners_cache(
+                tamarack.shared.SharedStore(path).cache(
+                    'owners', load=tamarack.pull_request.OwnersFile._make
+                )
+            )
+            owners_file = yield tamarack.pull_request.get_owners_file(self.event_data, '')
+
+        assert mock_fetch.call_count == 1
+        assert owners_file.contents == self.contents
+        assert len(owners_file.rules) == 1
+
+    @tornado.testing.gen_test
+    def test_revalidated_not_modified(self):
+        '''
+        Tests that a stale entry is revalidated with its ETag and reused on a 304
+        '''
+        mock_fetch = MagicMock(side_effect=[
+            _response(body=self.body, headers={'Etag': '"v1"'}),
+            _response(code=304, headers={'Etag': '"v1"'}),
+        ])
+        with patch('tamarack.github.fetch', mock_fetch), \
+                patch('tamarack.pull_request.OWNERS_CACHE_FRESH', 0):
+            first = yield tamarack.pull_request.get_owners_file(self.event_data, '')
+            second = yield tamarack.pull_request.get_owners_file(self.event_data, '')
+
+        assert mock_fetch.call_args[1]['headers']['If-None-Match'] == '"v1"'
+        assert second.rules is first.rules
+
+    @tornado.testing.gen_test
+    def test_same_sha_not_recompiled(self):
+        '''
+        Tests that an unchanged blob SHA reuses the cached contents and rules
+        '''
+        mock_fetch = MagicMock(side_effect=[
+            _response(body=self.body, headers={'Etag': '"v1"'}),
+            _response(body=self.body, headers={'Etag': '"v2"'}),
+        ])
+        with patch('tamarack.github.fetch', mock_fetch), \
+                patch('tamarack.pull_request.OWNERS_CACHE_FRESH', 0):
+            first = yield tamarack.pull_request.get_owners_file(self.event_data, '')
+            second = yield tamarack.pull_request.get_owners_file(self.event_data, '')
+
+        assert second.etag == '"v2"'
+        assert second.contents is first.contents
+
+
+class TestRefreshOwnersFile(tornado.testing.AsyncTestCase):
+    '''
+    TestCase for the refresh_owners_file and preload_owners_files functions
+    '''
+    repo_url = 'https://api.github.com/repos/foo/bar'
+    body = TestGetOwnersFile.body
+
+    def setUp(self):
+        super().setUp()
+        tamarack.pull_request.OWNERS_CACHE.clear()
+
+    def tearDown(self):
+        tamarack.pull_request.OWNERS_CACHE.clear()
+        super().tearDown()
+
+    @tornado.testing.gen_test
+    def test_fresh_entry_refreshed(self):
+        '''
+        Tests that a fresh cached file is refetched, and that pull requests then
+        find the new file without a request
+        '''
+        changed = dict(self.body, sha='def456', content=base64.b64encode(
+            b'salt/state.py    someone\n').decode('utf-8'))
+        mock_fetch = MagicMock(side_effect=[_response(body=self.body),
+                                            _response(body=changed)])
+        event_data = {'number': 1, 'repository': {'url': self.repo_url},
+                      'pull_request': {'base': {'ref': 'develop'}}}
+        with patch('tamarack.github.fetch', mock_fetch):
+            yield tamarack.pull_request.get_owners_file(event_data, '')
+            assert tamarack.pull_request.is_owners_branch(self.repo_url, 'develop')
+            yield tamarack.pull_request.refresh_owners_file(self.repo_url, 'develop', '')
+            owners_file = yield tamarack.pull_request.get_owners_file(event_data, '')
+
+        assert mock_fetch.call_count == 2
+        assert owners_file.sha == 'def456'
+
+    @tornado.testing.gen_test
+    def test_removed(self):
+        '''
+        Tests that a CODEOWNERS file that no longer exists is uncached
+        '''
+        url = self.repo_url + '/contents/.github/CODEOWNERS?ref=develop'
+        tamarack.pull_request.OWNERS_CACHE.set(
+            url, tamarack.pull_request.OwnersFile('abc123', None, '', None, 0))
+        not_found = tornado.concurrent.Future()
+        not_found.set_exception(tornado.httpclient.HTTPError(404))
+        with patch('tamarack.github.fetch', MagicMock(return_value=not_found)):
+            ret = yield tamarack.pull_request.refresh_owners_file(self.repo_url, 'develop', '')
+        assert ret is None
+        assert url not in tamarack.pull_request.OWNERS_CACHE
+
+    @tornado.testing.gen_test
+    def test_preload(self):
+        '''
+        Tests that every configured branch is preloaded, despite failures
+        '''
+        failed = tornado.concurrent.Future()
+        failed.set_exception(tornado.httpclient.HTTPError(500))
+        mock_fetch = MagicMock(side_effect=[_response(body=self.body), failed,
+                                            _response(body=self.body)])
+        with patch('tamarack.github.fetch', mock_fetch):
+            yield tamarack.pull_request.preload_owners_files(
+                '', 'foo/bar', ['develop', '2019.2', '2019.2.1'])
+
+        assert mock_fetch.call_count == 3
+        assert len(tamarack.pull_request.OWNERS_CACHE) == 2
+        assert tamarack.pull_request.is_owners_branch(self.repo_url, '2019.2.1')
+        assert not tamarack.pull_request.is_owners_branch(self.repo_url, '2019.2')
+
+    @tornado.testing.gen_test
+    def test_preload_installation_token(self):
+        '''
+        Tests that the branches are preloaded with the installation token of
+        the repository owner, if a GitHub App is configured
+        '''
+        tokens = tamarack.auth.InstallationTokens('123', 'private-key')
+        tokens.get_token = MagicMock(return_value=tests.helpers.future('installation-token'))
+        tamarack.auth.set_installation_tokens(tokens)
+        self.addCleanup(tamarack.auth.set_installation_tokens, None)
+        mock_fetch = MagicMock(return_value=_response(body=self.body))
+        with patch('tamarack.github.fetch', mock_fetch):
+            yield tamarack.pull_request.preload_owners_files('', 'foo/bar', ['develop'])
+
+        tokens.get_token.assert_called_once_with(
+            'foo', 'https://api.github.com/repos/foo/bar')
+        assert mock_fetch.call_args[0][1] == 'installation-token'
+
+
 class TestGetPRFileNames(tornado.testing.AsyncTestCase):
     '''
     TestCase for the get_pr_file_names function
@@ -5,13 +5,28 @@ Tests for the functions in tamarack.server.py
 
 # Import Python libs
 from unittest.mock import MagicMock, patch
+import hashlib
+import hmac
+import json
+import os
+import shutil
+import tempfile
 import pytest
 
 # Import Tornado libs
+from tornado import gen
+import tornado.concurrent
+import tornado.testing
 import tornado.web
 
 # Import Tamarack libs
+import tamarack.event
+import tamarack.journal
+import tamarack.pull_request
 import tamarack.server
+import tamarack.shared
+import tamarack.worker
+import tests.helpers
 
 
 @pytest.fixture(scope='module')
@@ -35,12 +50,289 @@ def preserve_globals(request):
     request.addfinalizer(restore_globals)
 
 
+def _sign(body, key):
+    '''
+    Helper function that returns the GitHub signature header for a body.
+    '''
+    return 'sha1=' + hmac.new(key.encode('utf-8'), msg=body,
+                              digestmod=hashlib.sha1).hexdigest()
+
+
+class TestEventHandler(tornado.testing.AsyncHTTPTestCase):
+    '''
+    TestCase for the EventHandler class
+    '''
+    key = 'superSecretTestingKey'
+
+    def setUp(self):
+        self.handled = []
+        self.key_patch = patch('tamarack.server.HOOK_SECRET_KEY', self.key)
+        self.key_patch.start()
+        super().setUp()
+
+    def tearDown(self):
+        super().tearDown()
+        self.key_patch.stop()
+
+    def get_app(self):
+        return tamarack.server.make_app()
+
+    def _post(self, payload, key=None, delivery_id=None):
+        body = json.dumps(payload).encode('utf-8')
+        headers = {'X-Hub-Signature': _sign(body, key or self.key)}
+        if delivery_id:
+            headers['X-GitHub-Delivery'] = delivery_id
+        return self.fetch('/events', method='POST', body=body, headers=headers)
+
+    @gen.coroutine
+    def _handle_event(self, event_data, token, trace=None):  # pylint: disable=unused-argument
+        self.handled.append((event_data, token))
+
+    def test_event_accepted(self):
+        '''
+        Tests that a valid event is queued and acknowledged with a 202
+        '''
+        with patch('tamarack.event_processor.handle_event', self._handle_event):
+            response = self._post({'ref_type': 'tag'})
+            assert response.code == 202
+            self.io_loop.run_sync(
+                lambda: self._app.settings['work_queue'].join(timeout=5))
+        assert len(self.handled) == 1
+        event, token = self.handled[0]
+        assert isinstance(event, tamarack.event.Event)
+        assert event.get('ref_type') == 'tag'
+        assert token == tamarack.server.GITHUB_TOKEN
+
+    def test_unrouted_event_ignored(self):
+        '''
+        Tests that event types Tamarack does not handle are acknowledged unread
+        '''
+        body = b'{"ref": "refs/heads/develop"}'
+        with patch('tamarack.event.Event.from_body') as mock_parse:
+            response = self.fetch('/events', method='POST', body=body,
+                                  headers={'X-Hub-Signature': _sign(body, self.key),
+                                           'X-GitHub-Event': 'status'})
+        assert response.code == 202
+        assert not mock_parse.called
+        assert self._app.settings['work_queue'].stats()['processed'] == 0
+
+    def test_event_journaled(self):
+        '''
+        Tests that an accepted event is journaled and marked as processed
+        '''
+        directory = tempfile.mkdtemp()
+        journal = tamarack.journal.Journal(directory)
+        self._app.settings['journal'] = journal
+        try:
+            with patch('tamarack.event_processor.handle_event', self._handle_event):
+                response = self._post({'ref_type': 'tag'})
+                assert response.code == 202
+                assert journal.appended == 1
+                self.io_loop.run_sync(
+                    lambda: self._app.settings['work_queue'].join(timeout=5))
+            assert journal.pending() == 0
+        finally:
+            journal.close()
+            shutil.rmtree(directory)
+
+    def test_shared_store(self):
+        '''
+        Tests that delivery IDs are remembered in the shared store if one is set
+        '''
+        directory = tempfile.mkdtemp()
+        path = os.path.join(directory, 'shared.db')
+        try:
+            with patch('tamarack.server.SHARED_STORE', path), \
+                    patch('tamarack.pull_request.OWNERS_CACHE'):
+                app = tamarack.server.make_app()
+                deliveries = app.settings['deliveries']
+                assert isinstance(deliveries, tamarack.shared.SharedTimedSet)
+                assert isinstance(tamarack.pull_request.OWNERS_CACHE,
+                                  tamarack.shared.SharedCache)
+                assert deliveries.add(b'key')
+                other = tamarack.shared.SharedStore(path).timed_set('deliveries', 60)
+                assert b'key' in other
+        finally:
+            shutil.rmtree(directory)
+
+    def test_shared_preload(self):
+        '''
+        Tests that only the first process sharing a store preloads CODEOWNERS
+        '''
+        directory = tempfile.mkdtemp()
+        path = os.path.join(directory, 'shared.db')
+        try:
+            with patch('tamarack.server.SHARED_STORE', path), \
+                    patch('tamarack.pull_request.OWNERS_CACHE'), \
+                    patch('tamarack.pull_request.OWNERS_REPOSITORY', 'saltstack/salt'), \
+                    patch('tamarack.pull_request.OWNERS_BRANCHES', ['develop']), \
+                    patch('tamarack.pull_request.preload_owners_files') as mock_preload:
+                tamarack.server.make_app()
+                tamarack.server.make_app()
+                self.io_loop.run_sync(lambda: gen.sleep(0))
+            assert mock_preload.call_count == 1
+        finally:
+            shutil.rmtree(directory)
+
+    def test_duplicate_delivery(self):
+        '''
+        Tests that a redelivered event is dropped before it is parsed
+        '''
+        delivery_id = '72d3162e-cc78-11e3-81ab-4c9367dc0958'
+        with patch('tamarack.event_processor.handle_event', self._handle_event):
+            assert self._post({'ref_type': 'tag'}, delivery_id=delivery_id).code == 202
+            with patch('tamarack.event.Event.from_body') as mock_loads:
+                response = self._post({'ref_type': 'tag'}, delivery_id=delivery_id)
+            assert response.code == 200
+            assert not mock_loads.called
+            self.io_loop.run_sync(
+                lambda: self._app.settings['work_queue'].join(timeout=5))
+        assert len(self.handled) == 1
+
+    def test_rejected_redelivered(self):
+        '''
+        Tests that a delivery rejected with a 503 is accepted when redelivered
+        '''
+        delivery_id = '72d3162e-cc78-11e3-81ab-4c9367dc0959'
+        work_queue = self._app.settings['work_queue']
+        full_queue = tamarack.worker.WorkQueue(maxsize=1, num_workers=0)
+        full_queue.put(self._handle_event, {}, '')
+        self._app.settings['work_queue'] = full_queue
+        assert self._post({'ref_type': 'tag'}, delivery_id=delivery_id).code == 503
+
+        self._app.settings['work_queue'] = work_queue
+        with patch('tamarack.event_processor.handle_event', self._handle_event):
+            assert self._post({'ref_type': 'tag'}, delivery_id=delivery_id).code == 202
+
+    def test_bad_signature(self):
+        '''
+        Tests that an event with a bad signature is rejected before it is parsed
+        '''
+        with patch('tamarack.event.Event.from_body') as mock_loads:
+            response = self._post({'ref_type': 'tag'}, key='wrong')
+        assert response.code == 401
+        assert not mock_loads.called
+
+    def test_missing_signature(self):
+        '''
+        Tests that an event without a signature is rejected
+        '''
+        response = self.fetch('/events', method='POST', body=b'{}')
+        assert response.code == 401
+
+    def test_body_too_large(self):
+        '''
+        Tests that bodies larger than MAX_BODY_SIZE are rejected
+        '''
+        with patch('tamarack.server.MAX_BODY_SIZE', 10):
+            response = self._post({'ref_type': 'tag', 'padding': 'x' * 100})
+        assert response.code == 413
+
+    def test_event_traced(self):
+        '''
+        Tests that a processed event is logged as a trace with its delivery ID
+        '''
+        delivery_id = '72d3162e-cc78-11e3-81ab-4c9367dc0960'
+        with patch('tamarack.event_processor.handle_event', self._handle_event), \
+                self.assertLogs('tamarack.trace', 'INFO') as logs:
+            assert self._post({'ref_type': 'tag'}, delivery_id=delivery_id).code == 202
+            self.io_loop.run_sync(
+                lambda: self._app.settings['work_queue'].join(timeout=5))
+        record = json.loads(logs.records[0].getMessage())
+        assert record['delivery_id'] == delivery_id
+        assert record['action'] == 'tag'
+
+    def test_queue_full(self):
+        '''
+        Tests that events are rejected with a 503 when the work queue is full
+        '''
+        queue = tamarack.worker.WorkQueue(maxsize=1, num_workers=0)
+        queue.put(self._handle_event, {}, '')
+        self._app.settings['work_queue'] = queue
+        response = self._post({'ref_type': 'tag'})
+        assert response.code == 503
+
+
+class TestMetricsHandler(tornado.testing.AsyncHTTPTestCase):
+    '''
+    TestCase for the "/metrics" endpoint
+    '''
+
+    def get_app(self):
+        return tamarack.server.make_app()
+
+    def test_metrics(self):
+        '''
+        Tests that recorded metrics and the application state are exposed
+        '''
+        self.fetch('/events', method='POST', body='{}',
+                   headers={'X-GitHub-Event': 'issues'})
+        response = self.fetch('/metrics')
+        assert response.code == 200
+        assert response.headers['Content-Type'].startswith('text/plain')
+        body = response.body.decode('utf-8')
+        assert 'tamarack_webhook_request_seconds_count{event="issues",status="202"}' in body
+        assert 'tamarack_work_queue_depth 0' in body
+        assert 'tamarack_loop_lag_seconds{stat="max"}' in body
+        assert 'tamarack_github_cache_bytes' in body
+
+
+class TestProcessEvent(tornado.testing.AsyncTestCase):
+    '''
+    TestCase for the process_event function
+    '''
+
+    @tornado.testing.gen_test
+    def test_marked_after_notification(self):
+        '''
+        Tests that an event is only marked as processed once the Slack
+        notification it queued has been sent
+        '''
+        sent = tornado.concurrent.Future()
+        journal = MagicMock()
+        with patch('tamarack.event_processor.handle_event',
+                   MagicMock(return_value=tests.helpers.future(sent))):
+            yield tamarack.server.process_event({'ref_type': 'branch'}, '', 'abc', journal)
+            assert not journal.mark_processed.called
+            sent.set_result(None)
+            yield gen.moment
+        journal.mark_processed.assert_called_once_with('abc')
+
+
+class TestDeliveryKey:
+    '''
+    TestCase for the _delivery_key function.
+    '''
+
+    def test_uuid(self):
+        '''
+        Tests that UUID delivery IDs are stored as 16 bytes
+        '''
+        key = tamarack.server._delivery_key('72d3162e-cc78-11e3-81ab-4c9367dc0958')
+        assert isinstance(key, bytes)
+        assert len(key) == 16
+
+    def test_other_ids(self):
+        '''
+        Tests that other delivery IDs are kept as-is and missing ones are None
+        '''
+        assert tamarack.server._delivery_key('foo') == 'foo'
+        assert tamarack.server._delivery_key(None) is None
+
+
 class TestValidateGitHubSignature:
     '''
     TestCase for the validate_github_signature function.
     '''
     request = tornado.web.RequestHandler
 
+    def test_missing_signature(self):
+        '''
+        Tests that a missing signature header returns False
+        '''
+        setattr(self.request, 'headers', {})
+        assert tamarack.server.validate_github_signature(self.request) is False
+
     def test_incorrect_sha_type(self):
         '''
         Tests that an incorrect sha type returns False
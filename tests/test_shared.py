@@ -0,0 +1,170 @@
+# -*- coding: utf-8 -*-
+'''
+Tests for the functions in tamarack.shared.py
+'''
+
+# Import Python libs
+import collections
+import os
+import sqlite3
+import stat
+import time
+
+# Import Tamarack libs
+import tamarack.shared
+import tests.helpers
+
+
+def _store(tmpdir, timer=None):
+    return tamarack.shared.SharedStore(
+        os.path.join(str(tmpdir), 'shared.db'), timer=timer or tests.helpers.FakeTimer()
+    )
+
+
+class TestSharedCache:
+    '''
+    TestCase for the SharedCache class
+    '''
+
+    def test_get_and_set(self, tmpdir):
+        '''
+        Tests that stored values are returned and missing keys return the default
+        '''
+        cache = _store(tmpdir).cache('test')
+        cache.set('foo', {'bar': [1, 2]})
+        assert cache.get('foo') == {'bar': [1, 2]}
+        assert cache.get('baz', 'default') == 'default'
+        assert (cache.hits, cache.misses) == (1, 1)
+        assert 'foo' in cache
+        assert len(cache) == 1
+
+    def test_shared_between_connections(self, tmpdir):
+        '''
+        Tests that a value stored through one store is seen by another store
+        opened on the same file, as in another process
+        '''
+        _store(tmpdir).cache('test').set('foo', 1)
+        assert _store(tmpdir).cache('test').get('foo') == 1
+        assert _store(tmpdir).cache('other').get('foo') is None
+
+    def test_ttl(self, tmpdir):
+        '''
+        Tests that entries expire after the ttl
+        '''
+        timer = tests.helpers.FakeTimer()
+        cache = _store(tmpdir, timer).cache('test', ttl=10)
+        cache.set('foo', 1)
+        timer.now += 9
+        assert cache.get('foo') == 1
+        timer.now += 1
+        assert cache.get('foo') is None
+
+    def test_pop_and_clear(self, tmpdir):
+        '''
+        Tests that popped and cleared entries are removed
+        '''
+        cache = _store(tmpdir).cache('test')
+        cache.set('foo', 1)
+        cache.set('bar', 2)
+        assert cache.pop('foo') == 1
+        assert cache.pop('foo', 'default') == 'default'
+        cache.clear()
+        assert len(cache) == 0
+
+    def test_trim(self, tmpdir):
+        '''
+        Tests that the entries expiring first are evicted beyond maxsize
+        '''
+        timer = tests.helpers.FakeTimer()
+        cache = _store(tmpdir, timer).cache('test', maxsize=50, ttl=100)
+        for num in range(tamarack.shared.TRIM_INTERVAL):
+            timer.now += 0.01
+            cache.set(num, num)
+        assert len(cache) == 50
+        assert 0 not in cache
+        assert tamarack.shared.TRIM_INTERVAL - 1 in cache
+
+    def test_json(self, tmpdir):
+        '''
+        Tests that values are stored as JSON and loaded with the load function
+        '''
+        point = collections.namedtuple('Point', ['x', 'y'])
+        store = _store(tmpdir)
+        store.cache('test', load=point._make).set('foo', point(1, 2))
+        assert store.get('test', 'foo') == '[1, 2]'
+        assert store.cache('test', load=point._make).get('foo') == point(1, 2)
+
+    def test_private_file(self, tmpdir):
+        '''
+        Tests that the database file is only accessible to its owner
+        '''
+        _store(tmpdir)
+        mode = os.stat(os.path.join(str(tmpdir), 'shared.db')).st_mode
+        assert stat.S_IMODE(mode) == 0o600
+
+
+class TestSharedTimedSet:
+    '''
+    TestCase for the SharedTimedSet class
+    '''
+
+    def test_add(self, tmpdir):
+        '''
+        Tests that only the first add of a key succeeds, across stores
+        '''
+        first = _store(tmpdir).timed_set('deliveries', 60)
+        second = _store(tmpdir).timed_set('deliveries', 60)
+        assert first.add(b'key') is True
+        assert second.add(b'key') is False
+        assert b'key' in second
+        assert len(second) == 1
+
+    def test_expiry(self, tmpdir):
+        '''
+        Tests that keys are forgotten after the window and can be added again
+        '''
+        timer = tests.helpers.FakeTimer()
+        deliveries = _store(tmpdir, timer).timed_set('deliveries', 60)
+        deliveries.add('foo')
+        timer.now += 60
+        assert 'foo' not in deliveries
+        assert deliveries.add('foo') is True
+
+    def test_discard(self, tmpdir):
+        '''
+        Tests that discarded keys can be added again
+        '''
+        deliveries = _store(tmpdir).timed_set('deliveries', 60)
+        deliveries.add('foo')
+        deliveries.discard('foo')
+        assert deliveries.add('foo') is True
+
+
+class TestFailOpen:  # pylint: disable=too-few-public-methods
+    '''
+    TestCase for a SharedStore whose database stays locked by another process
+    '''
+
+    def test_locked(self, tmpdir):
+        '''
+        Tests that lookups miss, writes are skipped and deliveries are treated
+        as new, without waiting long for the lock
+        '''
+        store = _store(tmpdir)
+        store.cache('test').set('foo', 1)
+        store.timed_set('deliveries', 60).add('bar')
+
+        other = sqlite3.connect(os.path.join(str(tmpdir), 'shared.db'), isolation_level=None)
+        other.execute('BEGIN EXCLUSIVE')
+        try:
+            start = time.monotonic()
+            assert store.timed_set('deliveries', 60).add('bar') is True
+            store.cache('test').set('foo', 2)
+            assert time.monotonic() - start < 1
+        finally:
+            other.execute('ROLLBACK')
+            other.close()
+
+        assert store.busy == 2
+        assert store.cache('test').get('foo') == 1
+        assert store.timed_set('deliveries', 60).add('bar') is False
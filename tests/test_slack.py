@@ -3,7 +3,13 @@
 Tests for the functions in tamarack.slack.py
 '''
 
+# Import Python libs
+from unittest.mock import patch
+
 # Import Tornado libs
+from tornado import gen
+import tornado.httpclient
+import tornado.httputil
 import tornado.testing
 
 # Import Tamarack libs
@@ -30,3 +36,109 @@ class TestAPIRequest(tornado.testing.AsyncTestCase):
 
         # Reset variables for clean tests
         tamarack.slack.SLACK_WEBHOOK_URL = slack_url
+
+
+def _http_error(code, headers=None):
+    '''
+    Helper function that returns an HTTPError holding a fake Slack response.
+    '''
+    request = tornado.httpclient.HTTPRequest('https://hooks.slack.com')
+    response = tornado.httpclient.HTTPResponse(
+        request, code, headers=tornado.httputil.HTTPHeaders(headers or {})
+    )
+    return tornado.httpclient.HTTPError(code, response=response)
+
+
+class TestNotificationBuffer(tornado.testing.AsyncTestCase):
+    '''
+    TestCase for the NotificationBuffer class
+    '''
+
+    def setUp(self):
+        super().setUp()
+        self.posts = []
+        self.errors = []
+        self.request_patch = patch('tamarack.slack.api_request', self._api_request)
+        self.request_patch.start()
+
+    def tearDown(self):
+        self.request_patch.stop()
+        super().tearDown()
+
+    @gen.coroutine
+    def _api_request(self, method='GET', headers=None, post_data=None, url=None):
+        # pylint: disable=unused-argument
+        self.posts.append((url, post_data['attachments']))
+        if self.errors:
+            raise self.errors.pop(0)
+
+    @gen.coroutine
+    def _wait_for(self, buf, num_posts):
+        while len(self.posts) < num_posts or buf._sending:  # pylint: disable=W0212
+            yield gen.sleep(0.01)
+
+    @tornado.testing.gen_test
+    def test_batched_within_window(self):
+        '''
+        Tests that attachments added within the window are sent as one message,
+        and that their futures resolve once it has been sent
+        '''
+        buf = tamarack.slack.NotificationBuffer(url='url', window=0.05, min_interval=0)
+        sent = [buf.add({'text': num}) for num in range(3)]
+        assert not self.posts
+        assert not any(future.done() for future in sent)
+        yield sent
+        assert self.posts == [('url', [{'text': 0}, {'text': 1}, {'text': 2}])]
+        assert buf.sent == 3
+
+    @tornado.testing.gen_test
+    def test_flushed_when_full(self):
+        '''
+        Tests that a full batch is sent without waiting for the window
+        '''
+        buf = tamarack.slack.NotificationBuffer(url='url', window=60, max_size=2,
+                                                min_interval=0)
+        for num in range(3):
+            buf.add({'text': num})
+        yield self._wait_for(buf, 2)
+        assert [len(attachments) for _, attachments in self.posts] == [2, 1]
+
+    @tornado.testing.gen_test
+    def test_rate_limited_retry(self):
+        '''
+        Tests that a message is retried after the delay Slack asks for
+        '''
+        self.errors = [_http_error(429, {'Retry-After': '0'})]
+        buf = tamarack.slack.NotificationBuffer(url='url', window=0, min_interval=0)
+        buf.add({'text': 'foo'})
+        yield self._wait_for(buf, 2)
+        assert len(self.posts) == 2
+        assert (buf.sent, buf.retried, buf.dropped) == (1, 1, 0)
+
+    @tornado.testing.gen_test
+    def test_client_error_dropped(self):
+        '''
+        Tests that a message Slack rejects is dropped without retries
+        '''
+        self.errors = [_http_error(400)]
+        buf = tamarack.slack.NotificationBuffer(url='url', window=0, min_interval=0)
+        yield buf.add({'text': 'foo'})
+        assert (buf.sent, buf.retried, buf.dropped) == (0, 0, 1)
+
+
+class TestGetBuffer(tornado.testing.AsyncTestCase):
+    '''
+    TestCase for the get_buffer and set_buffer functions
+    '''
+
+    def test_per_url(self):
+        '''
+        Tests that each webhook URL has its own buffer, which can be replaced
+        '''
+        first = tamarack.slack.get_buffer('first')
+        assert tamarack.slack.get_buffer('first') is first
+        assert tamarack.slack.get_buffer('second') is not first
+
+        custom = tamarack.slack.NotificationBuffer(url='first', window=10)
+        tamarack.slack.set_buffer(custom)
+        assert tamarack.slack.get_buffer('first') is custom
@@ -0,0 +1,141 @@
+# -*- coding: utf-8 -*-
+'''
+Tests for the functions in tamarack.tracing.py
+'''
+
+# Import Python libs
+from unittest.mock import patch
+import json
+import logging
+import os
+import shutil
+import tempfile
+import pytest
+
+# Import Tamarack libs
+import tamarack.event
+import tamarack.tracing
+import tests.helpers
+
+
+class TestTrace:
+    '''
+    TestCase for the Trace class
+    '''
+
+    def test_span(self):
+        '''
+        Tests that a span records its offset, duration and attributes
+        '''
+        timer = tests.helpers.FakeTimer()
+        trace = tamarack.tracing.Trace('abc', event='pull_request', timer=timer)
+        timer.now += 1
+        with trace.span('owners.match', files=3) as attrs:
+            timer.now += 0.5
+            attrs['mode'] = 'inline'
+        assert trace.spans == [{'name': 'owners.match', 'start': 1.0,
+                                'duration': 0.5, 'files': 3, 'mode': 'inline'}]
+
+    def test_span_error(self):
+        '''
+        Tests that a span ended by an exception records the error type
+        '''
+        trace = tamarack.tracing.Trace('abc', timer=tests.helpers.FakeTimer())
+        with pytest.raises(ValueError):
+            with trace.span('owners.decode'):
+                raise ValueError('bad')
+        assert trace.spans[0]['error'] == 'ValueError'
+
+    def test_finish(self, caplog):
+        '''
+        Tests that a finished trace is logged as a single JSON record
+        '''
+        caplog.set_level(logging.INFO, logger='tamarack.trace')
+        timer = tests.helpers.FakeTimer()
+        trace = tamarack.tracing.Trace('abc', event='create', action='branch',
+                                       timer=timer)
+        trace.add('github.fetch', timer.now, 0.25, status=200)
+        timer.now += 2
+        trace.finish()
+        assert len(caplog.records) == 1
+        record = json.loads(caplog.records[0].getMessage())
+        assert record['delivery_id'] == 'abc'
+        assert record['event'] == 'create'
+        assert record['action'] == 'branch'
+        assert record['duration'] == 2.0
+        assert record['spans'] == [{'name': 'github.fetch', 'start': 0.0,
+                                    'duration': 0.25, 'status': 200}]
+
+
+class TestStartTrace:
+    '''
+    TestCase for the start_trace and span functions
+    '''
+
+    def test_start_trace(self):
+        '''
+        Tests that a trace is labeled with the event type and action
+        '''
+        event = tamarack.event.Event.from_body(b'{"action": "opened"}',
+                                               name='pull_request')
+        trace = tamarack.tracing.start_trace(event, 'abc')
+        assert trace.event == 'pull_request'
+        assert trace.action == 'opened'
+
+    def test_tracing_off(self):
+        '''
+        Tests that no trace is created when tracing is turned off
+        '''
+        with patch('tamarack.tracing.TRACING', False):
+            assert tamarack.tracing.start_trace({'action': 'opened'}, 'abc') is None
+
+    def test_span_without_trace(self):
+        '''
+        Tests that span does nothing without a trace
+        '''
+        with tamarack.tracing.span(None, 'owners.match', files=3) as attrs:
+            attrs['mode'] = 'inline'
+        assert attrs == {'files': 3, 'mode': 'inline'}
+
+
+class TestProfile:
+    '''
+    TestCase for the start_profile and stop_profile functions
+    '''
+
+    def setup_method(self):
+        '''
+        Creates the directory profiles are written to.
+        '''
+        # pylint: disable=attribute-defined-outside-init
+        self.directory = tempfile.mkdtemp()
+
+    def teardown_method(self):
+        '''
+        Removes the directory profiles are written to.
+        '''
+        shutil.rmtree(self.directory)
+
+    def test_not_sampled(self):
+        '''
+        Tests that nothing is profiled with a sample rate of 0
+        '''
+        assert tamarack.tracing.start_profile(rate=0) is None
+        assert tamarack.tracing.stop_profile(None, 'abc', self.directory) is None
+
+    def test_profile(self):
+        '''
+        Tests that a sampled event is profiled and its stats dumped
+        '''
+        profile = tamarack.tracing.start_profile(rate=1)
+        assert profile is not None
+        # Only one profile runs at a time.
+        assert tamarack.tracing.start_profile(rate=1) is None
+
+        path = tamarack.tracing.stop_profile(profile, '../abc', self.directory)
+        assert path == os.path.join(self.directory, '.._abc.prof')
+        assert os.path.getsize(path) > 0
+
+        profile = tamarack.tracing.start_profile(rate=1)
+        assert profile is not None
+        tamarack.tracing.stop_profile(profile, 'abc', self.directory)
@@ -0,0 +1,77 @@
+# -*- coding: utf-8 -*-
+'''
+Tests for the functions in tamarack.worker.py
+'''
+
+# Import Python libs
+import pytest
+
+# Import Tornado libs
+from tornado import gen
+import tornado.queues
+import tornado.testing
+
+# Import Tamarack libs
+import tamarack.worker
+
+
+class TestWorkQueue(tornado.testing.AsyncTestCase):
+    '''
+    TestCase for the WorkQueue class
+    '''
+
+    @tornado.testing.gen_test
+    def test_jobs_processed(self):
+        '''
+        Tests that queued jobs are run by the workers and latency is recorded
+        '''
+        results = []
+
+        @gen.coroutine
+        def job(value):
+            '''
+            Records the value it was called with.
+            '''
+            yield gen.moment
+            results.append(value)
+
+        queue = tamarack.worker.WorkQueue(maxsize=10, num_workers=2)
+        queue.start()
+        for value in range(5):
+            queue.put(job, value)
+        yield queue.join(timeout=5)
+
+        assert sorted(results) == [0, 1, 2, 3, 4]
+        stats = queue.stats()
+        assert stats['processed'] == 5
+        assert stats['depth'] == 0
+        assert stats['max_latency'] >= stats['mean_latency'] > 0
+
+    @tornado.testing.gen_test
+    def test_failed_job(self):
+        '''
+        Tests that a failing job is counted and does not stop the worker
+        '''
+        @gen.coroutine
+        def job():
+            '''
+            Always fails.
+            '''
+            raise ValueError('foo')
+
+        queue = tamarack.worker.WorkQueue(maxsize=10, num_workers=1)
+        queue.start()
+        queue.put(job)
+        queue.put(job)
+        yield queue.join(timeout=5)
+        assert queue.stats()['failed'] == 2
+
+    def test_queue_full(self):
+        '''
+        Tests that QueueFull is raised when the queue is full
+        '''
+        queue = tamarack.worker.WorkQueue(maxsize=1, num_workers=1)
+        queue.put(gen.sleep, 0)
+        with pytest.raises(tornado.queues.QueueFull):
+            queue.put(gen.sleep, 0)
+        assert queue.stats()['rejected'] == 1